@@ -0,0 +1,10 @@
+"""
+Run the NILM command line interface as `python -m nilm`.
+"""
+
+import sys
+
+from nilm.cli import main
+
+
+sys.exit(main())
@@ -0,0 +1,69 @@
+"""
+Building a new aggregate power file from the aggregate meters, with every
+device not being kept subtracted out. Files are streamed in chunks, so memory
+use does not depend on their length.
+"""
+
+import logging
+import os
+
+from nilm.stream import add_chunks, pad_chunks, subtract_chunks, write_chunks
+from nilm.timeseries import BINARY_EXTENSION, TimeSeries, series_files
+from nilm.trace import span
+
+
+log = logging.getLogger(__name__)
+
+
+# Gaps in the meter data longer than this are left unpadded.
+MAX_PAD = 600
+
+
+def padded_chunks(path, chunk_size, name=''):
+    """Stream the padded timeseries at the given path."""
+    return pad_chunks(TimeSeries.iter_chunks(os.path.abspath(path), chunk_size,
+                                             name), MAX_PAD)
+
+
+def generate_aggregate(aggregated, directory, devices, out, binary=False,
+                       chunk_size=1000000):
+    """
+    Write the padded files of the kept devices, and the sum of the aggregated
+    files less every other device file in the directory, to the output
+    directory.
+    """
+    ext = BINARY_EXTENSION if binary else '.dat'
+
+    device_files = series_files(directory)
+    for dev_path in devices:
+        try:
+            device_files.remove(os.path.abspath(dev_path))
+        except ValueError:
+            log.error('Unable to find device file %s under %s' % (dev_path,
+                                                                  directory))
+            continue
+
+        name = os.path.basename(dev_path).split('.')[0]
+        with span('save', device=name) as save_span:
+            save_span.add(write_chunks(padded_chunks(dev_path, chunk_size,
+                                                     name),
+                                       os.path.join(out, name + ext)))
+
+    for agg_path in aggregated:
+        try:
+            device_files.remove(os.path.abspath(agg_path))
+        except ValueError:
+            log.warning('Unable to find aggregated power file %s under %s' %
+                        (agg_path, directory))
+
+    agg_chunks = padded_chunks(aggregated[0], chunk_size)
+    for agg_path in aggregated[1:]:
+        agg_chunks = add_chunks(agg_chunks, padded_chunks(agg_path, chunk_size))
+
+    for dev_path in device_files:
+        agg_chunks = subtract_chunks(agg_chunks,
+                                     padded_chunks(dev_path, chunk_size))
+
+    with span('save', device='aggregate') as save_span:
+        save_span.add(write_chunks(agg_chunks,
+                                   os.path.join(out, 'aggregate' + ext)))
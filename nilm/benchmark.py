@@ -0,0 +1,323 @@
+"""
+Benchmarks of the pipeline's hot paths at a range of data sizes. Each case is
+timed in its own process so that its peak memory can be measured, scaling
+exponents are fitted to the timings, and results can be saved as a JSON
+baseline for later runs to be compared against.
+"""
+
+# pylint: disable=E1101
+
+import collections
+import json
+import multiprocessing
+import Queue
+import resource
+import time
+import traceback
+
+import numpy as np
+
+from nilm.evaluation import evaluate, f_score
+from nilm.markov import decode_devices, find_means, fit_devices, fit_levels
+from nilm.online import OnlineDisaggregator
+from nilm.preprocess import (confidence_estimator, get_changed_data,
+                             solve_constant_energy)
+from nilm.timeseries import TimeSeries
+
+
+def random_series(samples, rng, name=''):
+    """
+    A random device timeseries of the given length, switching between off
+    and a constant power, with occasional gaps in time.
+    """
+    ts = TimeSeries(name)
+    ts.array = np.zeros(samples, dtype=[('time', np.uint32),
+                                        ('power', np.float32)])
+    ts.array['time'] = np.cumsum(np.where(rng.rand(samples) < 0.001,
+                                          rng.randint(2, 1000, samples), 1))
+
+    switches = np.cumsum(rng.rand(samples) < 0.01) % 2
+    ts.array['power'] = switches * rng.randint(10, 2000) + rng.rand(samples)
+
+    return ts
+
+
+def random_devices(samples, devices, rng):
+    """Random device timeseries sharing timestamps, and their aggregate."""
+    series = [random_series(samples, rng, 'device%s' % d) for d in
+              xrange(devices)]
+    for ts in series[1:]:
+        ts.array['time'] = series[0].times
+
+    aggregated = np.sum([ts.powers for ts in series], axis=0)
+
+    return (aggregated.astype(np.float32), series)
+
+
+def setup_pad(samples, _, rng):
+    """Pad a series with gaps."""
+    ts = random_series(samples, rng)
+    return lambda: ts.pad(600)
+
+
+def setup_arithmetic(samples, _, rng):
+    """Add and subtract series with partially shared timestamps."""
+    ts1 = random_series(samples, rng)
+    ts2 = random_series(samples, rng)
+    return lambda: (ts1 + ts2, ts1 - ts2)
+
+
+def setup_activations(samples, _, rng):
+    """Find the activations of a series."""
+    ts = random_series(samples, rng)
+    return lambda: ts.activation_index(np.float32(25.0))
+
+
+def setup_confidence_estimator(samples, devices, rng):
+    """Estimate device powers from single device switches."""
+    (aggregated, series) = random_devices(samples, devices, rng)
+    return lambda: confidence_estimator(aggregated, series, get_changed_data,
+                                        np.float32(25.0))
+
+
+def setup_constant_energy(samples, devices, rng):
+    """Solve for constant device powers."""
+    (aggregated, series) = random_devices(samples, devices, rng)
+    activations = [ts.indicators(np.float32(25.0)) for ts in series]
+    return lambda: solve_constant_energy(aggregated, activations)
+
+
+def setup_find_means(samples, _, rng):
+    """Fit three means to one step change per hundred samples."""
+    changes = np.sort(rng.rand(max(samples // 100, 3)) * 2000).tolist()
+    lengths = rng.randint(1, 1000, len(changes)).tolist()
+    return lambda: find_means(lengths, changes, 3)
+
+
+def setup_fit_devices(samples, devices, rng):
+    """Fit markov power levels for every device."""
+    (aggregated, series) = random_devices(samples, devices, rng)
+    indicators = np.column_stack([ts.indicators(np.float32(25.0)) for ts in
+                                  series])
+    return lambda: fit_devices(aggregated, indicators, 3)
+
+
+def setup_decode_devices(samples, devices, rng):
+    """Decode every device's power from the aggregate with a beam search."""
+    (aggregated, series) = random_devices(samples, devices, rng)
+    indicators = np.column_stack([ts.indicators(np.float32(25.0)) for ts in
+                                  series])
+    levels = fit_levels(aggregated, indicators, 3)
+    return lambda: decode_devices(aggregated, levels)
+
+
+def setup_online(samples, devices, rng):
+    """Disaggregate the aggregate one reading at a time."""
+    (aggregated, series) = random_devices(samples, devices, rng)
+    indicators = np.column_stack([ts.indicators(np.float32(25.0)) for ts in
+                                  series])
+    disaggregator = OnlineDisaggregator(fit_levels(aggregated, indicators, 3))
+
+    def run():
+        """Start from a fresh state on every run."""
+        disaggregator.reset()
+        return disaggregator.run(aggregated)
+
+    return run
+
+
+def setup_f_score(samples, devices, rng):
+    """Score every device, one at a time."""
+    (_, series) = random_devices(samples, devices, rng)
+    (_, truth) = random_devices(samples, devices, rng)
+    return lambda: [f_score(s, t, np.float32(25.0)) for (s, t) in
+                    zip(series, truth)]
+
+
+def setup_evaluate(samples, devices, rng):
+    """Score every device at ten thresholds at once."""
+    test = rng.rand(samples, devices).astype(np.float32) * 100
+    truth = rng.rand(samples, devices).astype(np.float32) * 100
+    return lambda: evaluate(test, truth, np.linspace(0, 100, 10))
+
+
+# Each case's setup, and whether it depends on the number of devices.
+CASES = collections.OrderedDict([
+    ('pad', (setup_pad, False)),
+    ('arithmetic', (setup_arithmetic, False)),
+    ('activations', (setup_activations, False)),
+    ('confidence_estimator', (setup_confidence_estimator, True)),
+    ('solve_constant_energy', (setup_constant_energy, True)),
+    ('find_means', (setup_find_means, False)),
+    ('fit_devices', (setup_fit_devices, True)),
+    ('decode_devices', (setup_decode_devices, True)),
+    ('online', (setup_online, True)),
+    ('f_score', (setup_f_score, True)),
+    ('evaluate', (setup_evaluate, True)),
+])
+
+
+def measure(case, samples, devices, repeat, queue):
+    """
+    Time the best of repeat runs of a case, and put the time and the peak
+    resident memory of this process in megabytes on the queue, or the
+    traceback if the case raised.
+    """
+    try:
+        rng = np.random.RandomState(0)
+        run = CASES[case][0](samples, devices, rng)
+
+        best = np.inf
+        for _ in xrange(repeat):
+            start = time.time()
+            run()
+            best = min(best, time.time() - start)
+    except Exception: # pylint: disable=broad-except
+        queue.put({'error': traceback.format_exc()})
+        return
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    queue.put({'seconds': best, 'peak_rss_mb': peak})
+
+
+def run_case(case, samples, devices, repeat=3, timeout=600.0):
+    """
+    Run a case in a new process, returning its result record. If the case
+    raises, dies or runs longer than timeout seconds, the record has no time
+    or memory, and its error describes the failure.
+    """
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=measure, args=(case, samples,
+                                                            devices, repeat,
+                                                            queue))
+    process.start()
+
+    deadline = time.time() + timeout
+    outcome = None
+    while outcome is None:
+        try:
+            outcome = queue.get(timeout=min(1.0, timeout))
+        except Queue.Empty:
+            if not process.is_alive():
+                # The outcome may have arrived just before the process exited.
+                try:
+                    outcome = queue.get(timeout=1.0)
+                except Queue.Empty:
+                    outcome = {'error': 'exited with status %s' %
+                                        process.exitcode}
+            elif time.time() > deadline:
+                process.terminate()
+                outcome = {'error': 'timed out after %s seconds' % timeout}
+    process.join()
+
+    record = {'case': case, 'samples': samples, 'devices': devices,
+              'seconds': None, 'peak_rss_mb': None, 'error': None}
+    record.update(outcome)
+
+    return record
+
+
+def run_benchmarks(cases, sample_sizes, device_counts, repeat=3, log=None,
+                   timeout=600.0, max_size=None):
+    """
+    Run every case at every sample size, and the cases depending on devices
+    at every device count, returning the list of result records. Sizes whose
+    samples times devices exceed max_size are skipped.
+    """
+    results = []
+
+    for case in cases:
+        counts = device_counts if CASES[case][1] else [1]
+        for devices in counts:
+            for samples in sample_sizes:
+                if max_size is not None and samples * devices > max_size:
+                    continue
+                result = run_case(case, samples, devices, repeat, timeout)
+                if log is not None:
+                    log(format_result(result))
+                results.append(result)
+
+    return results
+
+
+def fit_exponents(results):
+    """
+    Fit the empirical scaling exponent of each case's time in the number of
+    samples, and in the number of devices where it varies, as the slope of a
+    least squares line through the log-log timings. Returns a dictionary from
+    case to a dictionary of exponents.
+    """
+    exponents = collections.OrderedDict((r['case'], {}) for r in results)
+    results = [r for r in results if not r.get('error')]
+
+    for (variable, fixed) in [('samples', 'devices'), ('devices', 'samples')]:
+        groups = collections.OrderedDict()
+        for r in results:
+            groups.setdefault((r['case'], r[fixed]), []).append(
+                (r[variable], r['seconds']))
+
+        fits = collections.OrderedDict()
+        for ((case, _), points) in groups.items():
+            sizes = np.array([p[0] for p in points], dtype=np.float64)
+            seconds = np.array([p[1] for p in points], dtype=np.float64)
+            if len(np.unique(sizes)) < 2:
+                continue
+
+            seconds = np.maximum(seconds, 1e-9)
+            fits.setdefault(case, []).append(
+                np.polyfit(np.log(sizes), np.log(seconds), 1)[0])
+
+        for (case, slopes) in fits.items():
+            exponents[case][variable] = float(np.mean(slopes))
+
+    return exponents
+
+
+def compare_results(results, baseline, threshold=1.5):
+    """
+    Compare results against the baseline results, returning the list of
+    (result, baseline time, ratio) for each matching case whose time grew by
+    more than the threshold ratio.
+    """
+    baseline_times = dict(((b['case'], b['samples'], b['devices']),
+                           b['seconds']) for b in baseline
+                          if not b.get('error'))
+    regressions = []
+
+    for r in results:
+        key = (r['case'], r['samples'], r['devices'])
+        if r.get('error') or key not in baseline_times:
+            continue
+
+        ratio = r['seconds'] / max(baseline_times[key], 1e-9)
+        if ratio > threshold:
+            regressions.append((r, baseline_times[key], ratio))
+
+    return regressions
+
+
+def format_result(result):
+    """Format a result record as a line of the results table."""
+    if result.get('error'):
+        return '%-24s %10d %8d %s' % (result['case'], result['samples'],
+                                      result['devices'],
+                                      'failed: %s' % result['error'].strip()
+                                      .splitlines()[-1])
+
+    return '%-24s %10d %8d %12.6f %10.1f' % (result['case'], result['samples'],
+                                            result['devices'],
+                                            result['seconds'],
+                                            result['peak_rss_mb'])
+
+
+def save_baseline(path, results):
+    """Save results and their scaling exponents as a JSON baseline."""
+    with open(path, 'w') as fd:
+        json.dump({'results': results, 'exponents': fit_exponents(results)},
+                  fd, indent=2, sort_keys=True)
+
+
+def load_baseline(path):
+    """Load the results of a JSON baseline."""
+    with open(path, 'r') as fd:
+        return json.load(fd)['results']
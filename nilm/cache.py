@@ -0,0 +1,193 @@
+"""
+A content-addressed on-disk cache of arrays, so that runs repeating the same
+data preparation can skip it. Entries are keyed by a hash of everything their
+arrays were computed from, including the content of the input files, and are
+stored in NumPy's binary format to be memory-mapped back without copying. The
+least recently used entries are evicted to keep the cache within a size.
+"""
+
+# pylint: disable=E1101
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+
+# Default location and size in megabytes of the cache.
+CACHE_DIRECTORY = os.path.join('~', '.cache', 'nilm')
+CACHE_SIZE = 4096
+
+# Hidden directory in the cache remembering the digest of each input file,
+# in a file of its own so that concurrent processes never lose each other's.
+DIGEST_DIRECTORY = '.digests'
+
+# File in each entry holding its extra information.
+INFO_FILE = 'info.json'
+
+
+def file_digest(path, block_size=1 << 20):
+    """The SHA-1 digest of the content of a file."""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as fd:
+        for block in iter(lambda: fd.read(block_size), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def array_digest(array):
+    """The SHA-1 digest of the dtype, shape and content of an array."""
+    array = np.ascontiguousarray(array)
+    digest = hashlib.sha1(str((array.dtype.descr, array.shape)))
+    digest.update(array.data)
+
+    return digest.hexdigest()
+
+
+class ArrayCache(object):
+    """
+    Cache of named arrays under keys, in a directory bounded to max_bytes.
+
+    Each entry is a directory of arrays named after its key. Entries are
+    written to a temporary directory and renamed into place, so concurrent
+    readers and writers never see partial entries, and their modification
+    time is updated whenever they are read, for eviction.
+    """
+    def __init__(self, directory=CACHE_DIRECTORY, max_bytes=CACHE_SIZE << 20):
+        self.directory = os.path.expanduser(directory)
+        self.max_bytes = max_bytes
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:
+                if not os.path.isdir(self.directory):
+                    raise
+
+    def key(self, *parts):
+        """The key of an entry computed from the given JSON-able parts."""
+        return hashlib.sha1(json.dumps(parts, sort_keys=True)).hexdigest()
+
+    def file_digest(self, path):
+        """
+        The digest of an input file's content, remembered while the file
+        keeps its size and modification time so that it is hashed only once.
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        memo_directory = os.path.join(self.directory, DIGEST_DIRECTORY)
+        memo_path = os.path.join(memo_directory,
+                                 hashlib.sha1(path).hexdigest() + '.json')
+
+        try:
+            with open(memo_path, 'r') as fd:
+                memo = json.load(fd)
+        except (IOError, ValueError):
+            memo = None
+
+        if memo is not None and memo[:3] == [path, stat.st_size,
+                                             stat.st_mtime]:
+            return memo[3]
+
+        digest = file_digest(path)
+
+        if not os.path.isdir(memo_directory):
+            try:
+                os.makedirs(memo_directory)
+            except OSError:
+                if not os.path.isdir(memo_directory):
+                    raise
+        (fd, tmp_path) = tempfile.mkstemp(dir=memo_directory, prefix='.tmp-')
+        with os.fdopen(fd, 'w') as tmp:
+            json.dump([path, stat.st_size, stat.st_mtime, digest], tmp)
+        os.rename(tmp_path, memo_path)
+
+        return digest
+
+    def entry_path(self, key):
+        """The directory of the entry with the given key."""
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        """
+        Returns the dictionary of memory-mapped arrays and the information
+        stored under a key, or None if there is no such entry.
+        """
+        path = self.entry_path(key)
+        try:
+            with open(os.path.join(path, INFO_FILE), 'r') as fd:
+                info = json.load(fd)
+            arrays = dict((name, np.load(os.path.join(path, name + '.npy'),
+                                         mmap_mode='c'))
+                          for name in info['arrays'])
+            os.utime(path, None)
+        except (IOError, OSError, ValueError):
+            return None
+
+        return (arrays, info['info'])
+
+    def put(self, key, arrays, info=None):
+        """
+        Store a dictionary of arrays, and JSON-able information, under a key,
+        then evict old entries while the cache is too large.
+        """
+        tmp_path = tempfile.mkdtemp(dir=self.directory, prefix='.tmp-')
+        try:
+            for (name, array) in arrays.items():
+                np.save(os.path.join(tmp_path, name + '.npy'),
+                        np.ascontiguousarray(array))
+            with open(os.path.join(tmp_path, INFO_FILE), 'w') as fd:
+                json.dump({'arrays': sorted(arrays), 'info': info}, fd)
+
+            os.rename(tmp_path, self.entry_path(key))
+        except OSError:
+            # Another process stored the same entry first.
+            if not os.path.isdir(self.entry_path(key)):
+                raise
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+        self.evict(keep=key)
+
+    def entries(self):
+        """
+        Returns a list of the key, last use time and size in bytes of every
+        entry, least recently used first.
+        """
+        entries = []
+        for key in os.listdir(self.directory):
+            path = self.entry_path(key)
+            if key.startswith('.') or not os.path.isdir(path):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(path, f)) for f in
+                           os.listdir(path))
+                entries.append((key, os.path.getmtime(path), size))
+            except OSError:
+                continue
+
+        return sorted(entries, key=lambda e: e[1])
+
+    def evict(self, keep=None):
+        """
+        Remove the least recently used entries, other than keep, until the
+        cache is no larger than its bound.
+        """
+        entries = self.entries()
+        total = sum(e[2] for e in entries)
+
+        for (key, _, size) in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(self.entry_path(key), ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        """Remove every entry."""
+        for (key, _, _) in self.entries():
+            shutil.rmtree(self.entry_path(key), ignore_errors=True)
@@ -0,0 +1,518 @@
+"""
+Command line interface to the NILM pipeline, as a single command with a
+subcommand for each stage. Subcommands import their backends only when they
+run, so help and argument errors return without loading NumPy, SciPy or
+Keras.
+"""
+
+from __future__ import print_function
+
+import argparse
+import logging
+import os
+import sys
+
+from nilm import trace
+
+
+LOG_FORMAT = '%(asctime)s %(message)s'
+
+PREPROCESS_METHODS = ['raw', 'constant', 'interval', 'edge', 'markov',
+                      'viterbi']
+
+RESAMPLE_METHODS = ['mean', 'max', 'last']
+
+
+def run_aggregate(args):
+    """Create a new aggregated power file."""
+    from nilm.aggregate import generate_aggregate
+
+    generate_aggregate(args.aggregated, args.dir, args.devices, args.out,
+                       args.format == 'binary', args.chunk_size)
+    return 0
+
+
+def run_train(args):
+    """Train neural networks for the given devices."""
+    import numpy as np
+    from nilm.training import open_cache, prepare_data, train_devices
+
+    (agg_data, devices) = prepare_data(args, np.float32(25.00),
+                                       open_cache(args))
+
+    return train_devices(agg_data, devices, args)
+
+
+def run_preprocess(args):
+    """Write the preprocessed device files."""
+    import numpy as np
+    from nilm.timeseries import BINARY_EXTENSION
+    from nilm.training import apply_preprocess, load_data
+
+    (agg_data, devices) = load_data(args.aggregated, args.dir,
+                                    resolution=args.resolution)
+    with trace.span('preprocess.' + args.preprocess, len(agg_data.array)):
+        apply_preprocess(agg_data.powers, devices, args.preprocess,
+                         np.float32(args.threshold))
+
+    ext = BINARY_EXTENSION if args.format == 'binary' else '.dat'
+    for dev in devices:
+        with trace.span('save', len(dev.array), device=dev.name):
+            dev.save(os.path.join(args.out, dev.name + ext))
+
+    return 0
+
+
+def run_evaluate(args):
+    """Print evaluation scores of estimated device files against the truth."""
+    import numpy as np
+    from nilm.evaluation import evaluate
+    from nilm.pyramid import load_level
+    from nilm.timeseries import series_files
+
+    names = dict((os.path.basename(p).split('.')[0], p) for p in
+                 series_files(args.truth))
+    thresholds = np.array(args.thresholds, dtype=np.float32)
+
+    print('%-20s %10s %10s %10s %10s %12s' % ('device', 'threshold',
+                                             'precision', 'recall', 'f1',
+                                             'rmse'))
+    for path in sorted(series_files(args.estimates)):
+        name = os.path.basename(path).split('.')[0]
+        if name not in names:
+            continue
+
+        estimate = load_level(path, args.resolution, name=name)
+        truth = load_level(names[name], args.resolution, name=name)
+        (indices1, indices2) = estimate.align(truth)
+
+        results = evaluate(estimate.powers[indices1], truth.powers[indices2],
+                           thresholds)
+        for (k, threshold) in enumerate(thresholds):
+            print('%-20s %10s %10.4f %10.4f %10.4f %12.4f' %
+                  (name, threshold, results['precision'][0, k],
+                   results['recall'][0, k], results['f_score'][0, k],
+                   results['root_mean_squared_error'][0]))
+
+    return 0
+
+
+def run_disaggregate(args):
+    """Write the device files estimated by the trained networks."""
+    from nilm.pyramid import load_level
+    from nilm.registry import ModelRegistry
+    from nilm.timeseries import BINARY_EXTENSION
+
+    registry = ModelRegistry(args.models)
+    agg_data = load_level(args.aggregated, args.resolution)
+
+    ext = BINARY_EXTENSION if args.format == 'binary' else '.dat'
+    for name in (args.devices or registry.names()):
+        with trace.span('disaggregate', len(agg_data.array), device=name):
+            (dev,) = registry.disaggregate(agg_data, [name], args.stride,
+                                           args.batch_size, args.resolution)
+        with trace.span('save', len(dev.array), device=name):
+            dev.save(os.path.join(args.out, name + ext))
+
+    logging.info('Model registry: %s' % registry.stats())
+    return 0
+
+
+def run_benchmark(args):
+    """Benchmark the hot paths, optionally against a saved baseline."""
+    from nilm.benchmark import (CASES, compare_results, fit_exponents,
+                                load_baseline, run_benchmarks, save_baseline)
+
+    cases = args.cases if args.cases else list(CASES)
+    print('%-24s %10s %8s %12s %10s' % ('case', 'samples', 'devices',
+                                        'seconds', 'peak_mb'))
+    results = run_benchmarks(cases, args.samples, args.devices, args.repeat,
+                             log=print, timeout=args.timeout,
+                             max_size=args.max_size)
+    failures = [r for r in results if r['error']]
+
+    print('')
+    for (case, exponents) in fit_exponents(results).items():
+        print('%-24s %s' % (case, ' '.join('%s^%.2f' % item for item in
+                                           sorted(exponents.items()))))
+
+    if args.save:
+        save_baseline(args.save, results)
+
+    if args.compare:
+        regressions = compare_results(results, load_baseline(args.compare),
+                                      args.threshold)
+        for (result, seconds, ratio) in regressions:
+            print('Regression: %s samples=%d devices=%d %.6fs -> %.6fs '
+                  '(%.2fx)' % (result['case'], result['samples'],
+                               result['devices'], seconds, result['seconds'],
+                               ratio))
+        return 1 if regressions or failures else 0
+
+    return 1 if failures else 0
+
+
+def run_synthesize(args):
+    """Write the meter files of a synthetic household."""
+    from nilm.synthetic import write_household
+
+    write_household(args.out, args.devices, int(args.days * 86400), args.seed,
+                    args.format == 'binary', period=args.period,
+                    jitter=args.jitter, gap_rate=args.gap_rate,
+                    noise=args.noise)
+    return 0
+
+
+def run_monitor(args):
+    """Disaggregate aggregate readings one at a time as they arrive."""
+    import numpy as np
+    from nilm.online import OnlineDisaggregator
+    from nilm.training import learn_levels, load_data
+
+    (agg_data, devices) = load_data(args.aggregated, args.dir,
+                                    resolution=args.resolution)
+    levels = learn_levels(agg_data.powers, devices, args.preprocess,
+                          np.float32(args.threshold))
+    for (dev, dev_levels) in zip(devices, levels):
+        logging.info('Power levels of %s: %s' % (dev.name, dev_levels))
+
+    names = [dev.name for dev in devices]
+    disaggregator = OnlineDisaggregator(levels, names, args.threshold)
+
+    print('time ' + ' '.join(names))
+    if args.input == '-':
+        monitor_readings(disaggregator, sys.stdin)
+    else:
+        with open(args.input) as readings:
+            monitor_readings(disaggregator, readings)
+
+    return 0
+
+
+def monitor_readings(disaggregator, readings):
+    """Print the device powers after each line of time and power readings."""
+    for line in readings:
+        fields = line.split()
+        if len(fields) != 2:
+            continue
+        powers = disaggregator.update(fields[1])
+        print(fields[0] + ' ' + ' '.join('%.1f' % p for p in powers))
+        sys.stdout.flush()
+
+
+def run_levels(args):
+    """Update the saved device power level sketches with new data."""
+    import numpy as np
+    from nilm.sketch import load_sketches, save_sketches, sketch_devices
+    from nilm.training import load_data
+
+    sketches = load_sketches(args.state) if os.path.exists(args.state) else {}
+
+    (agg_data, devices) = load_data(args.aggregated, args.dir,
+                                    resolution=args.resolution)
+    threshold = np.float32(args.threshold)
+    indicators = np.column_stack([d.indicators(threshold) for d in devices])
+    sketch_devices(agg_data.powers, indicators, [d.name for d in devices],
+                   sketches, args.k)
+
+    save_sketches(args.state, sketches)
+
+    print('%-20s %10s %s' % ('device', 'events', 'levels'))
+    for name in sorted(sketches):
+        print('%-20s %10d %s' % (name, sketches[name].events,
+                                 ' '.join('%.1f' % l for l in
+                                          sketches[name].levels)))
+
+    return 0
+
+
+def run_pyramid(args):
+    """Build the cached resolution pyramids of timeseries files."""
+    from nilm.pyramid import build_pyramid
+
+    for path in args.files:
+        build_pyramid(path, args.levels, args.how)
+    return 0
+
+
+def add_log_argument(parser):
+    """Add the log file argument shared by every subcommand."""
+    parser.add_argument('-l', '--log', default='/tmp/agg.log',
+                        help='File to write log to.')
+
+
+def add_trace_argument(parser):
+    """Add the trace file argument of the subcommands running the pipeline."""
+    parser.add_argument('--trace', help='File to write a JSON lines trace of '
+                        'the time and memory of each stage to, printing a '
+                        'summary at the end.')
+
+
+def add_resolution_argument(parser):
+    """Add the resolution argument of the subcommands loading series."""
+    parser.add_argument('-R', '--resolution', type=int, default=1,
+                        help='Seconds per sample to resample the series to, '
+                        'using their cached pyramids.')
+
+
+def add_aggregate_arguments(parser):
+    """Add the arguments of the aggregate subcommand."""
+    parser.add_argument('-o', '--out', required=True, help='Output directory.')
+    parser.add_argument('-a', '--aggregated', nargs='+', required=True,
+                        help='Aggregated power usage file.')
+    parser.add_argument('-d', '--dir', required=True,
+                        help='Directory containing device files.')
+    parser.add_argument('--devices', nargs='+', required=True,
+                        help='List of device files to keep.')
+    add_log_argument(parser)
+    add_trace_argument(parser)
+    parser.add_argument('-f', '--format', choices=['text', 'binary'],
+                        default='text', help='Format of the output files.')
+    parser.add_argument('-c', '--chunk-size', type=int, default=1000000,
+                        help='Number of samples to process at a time.')
+
+
+def add_train_arguments(parser):
+    """Add the arguments of the train subcommand."""
+    parser.add_argument('-o', '--out', required=True, help='Output directory.')
+    parser.add_argument('-a', '--aggregated', required=True,
+                        help='Aggregated power usage file.')
+    parser.add_argument('-d', '--dir', required=True,
+                        help='Directory containing device files.')
+    add_log_argument(parser)
+    add_resolution_argument(parser)
+    add_trace_argument(parser)
+    parser.add_argument('-p', '--preprocess', choices=PREPROCESS_METHODS,
+                        default='raw',
+                        help='Which preprocessing algorithm to use.')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='Number of devices to train in parallel.')
+    parser.add_argument('-s', '--stride', type=int, default=None,
+                        help='Samples between the starts of training windows, '
+                        'defaults to the window size.')
+    parser.add_argument('-b', '--batch-size', type=int, default=10,
+                        help='Number of windows per training batch.')
+    parser.add_argument('-g', '--generator', action='store_true',
+                        help='Build training windows batch by batch.')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Prepare the data and windows from scratch, '
+                        'without reading or writing the cache.')
+    parser.add_argument('--cache-dir', default=os.path.join('~', '.cache',
+                                                            'nilm'),
+                        help='Directory of the prepared data cache.')
+    parser.add_argument('--cache-size', type=int, default=4096,
+                        help='Megabytes the cache may use before the least '
+                        'recently used data is evicted.')
+
+
+def add_preprocess_arguments(parser):
+    """Add the arguments of the preprocess subcommand."""
+    parser.add_argument('-o', '--out', required=True, help='Output directory.')
+    parser.add_argument('-a', '--aggregated', required=True,
+                        help='Aggregated power usage file.')
+    parser.add_argument('-d', '--dir', required=True,
+                        help='Directory containing device files.')
+    add_log_argument(parser)
+    add_resolution_argument(parser)
+    add_trace_argument(parser)
+    parser.add_argument('-p', '--preprocess', choices=PREPROCESS_METHODS,
+                        default='raw',
+                        help='Which preprocessing algorithm to use.')
+    parser.add_argument('-t', '--threshold', type=float, default=25.0,
+                        help='Power above which a device is on.')
+    parser.add_argument('-f', '--format', choices=['text', 'binary'],
+                        default='text', help='Format of the output files.')
+
+
+def add_evaluate_arguments(parser):
+    """Add the arguments of the evaluate subcommand."""
+    parser.add_argument('-e', '--estimates', required=True,
+                        help='Directory containing estimated device files.')
+    parser.add_argument('-r', '--truth', required=True,
+                        help='Directory containing true device files.')
+    add_log_argument(parser)
+    add_resolution_argument(parser)
+    parser.add_argument('-t', '--thresholds', nargs='+', type=float,
+                        default=[25.0],
+                        help='Powers above which a device is on.')
+
+
+def add_disaggregate_arguments(parser):
+    """Add the arguments of the disaggregate subcommand."""
+    parser.add_argument('-o', '--out', required=True, help='Output directory.')
+    parser.add_argument('-a', '--aggregated', required=True,
+                        help='Aggregated power usage file.')
+    parser.add_argument('-m', '--models', required=True,
+                        help='Directory containing the trained networks.')
+    parser.add_argument('--devices', nargs='+',
+                        help='Devices to estimate, defaults to every trained '
+                        'network.')
+    add_log_argument(parser)
+    add_resolution_argument(parser)
+    add_trace_argument(parser)
+    parser.add_argument('-s', '--stride', type=int, default=None,
+                        help='Samples between the starts of windows, '
+                        'defaults to half the output window.')
+    parser.add_argument('-b', '--batch-size', type=int, default=1024,
+                        help='Number of windows per prediction batch.')
+    parser.add_argument('-f', '--format', choices=['text', 'binary'],
+                        default='text', help='Format of the output files.')
+
+
+def add_benchmark_arguments(parser):
+    """Add the arguments of the benchmark subcommand."""
+    parser.add_argument('cases', nargs='*',
+                        help='Cases to run, defaults to all of them.')
+    add_log_argument(parser)
+    parser.add_argument('-n', '--samples', nargs='+', type=int,
+                        default=[1000, 10000, 100000, 1000000, 10000000],
+                        help='Numbers of samples to run each case with.')
+    parser.add_argument('-D', '--devices', nargs='+', type=int,
+                        default=[1, 4, 16, 64],
+                        help='Numbers of devices to run multi-device cases '
+                        'with.')
+    parser.add_argument('-m', '--max-size', type=int, default=100000000,
+                        help='Largest number of samples times devices to run '
+                        'a case with, bounding the memory of the sweep.')
+    parser.add_argument('-T', '--timeout', type=float, default=600.0,
+                        help='Seconds after which a case counts as failed.')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='Number of timed runs, of which the best counts.')
+    parser.add_argument('-s', '--save', help='File to save a JSON baseline '
+                        'to.')
+    parser.add_argument('-c', '--compare', help='JSON baseline to compare '
+                        'against, failing on any regression.')
+    parser.add_argument('-t', '--threshold', type=float, default=1.5,
+                        help='Slowdown ratio counted as a regression.')
+
+
+def add_synthesize_arguments(parser):
+    """Add the arguments of the synthesize subcommand."""
+    parser.add_argument('-o', '--out', required=True, help='Output directory.')
+    add_log_argument(parser)
+    parser.add_argument('-n', '--devices', type=int, default=10,
+                        help='Number of devices.')
+    parser.add_argument('--days', type=float, default=1.0,
+                        help='Number of days to generate, at one second '
+                        'resolution.')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the household.')
+    parser.add_argument('--period', type=int, default=1,
+                        help='Seconds between meter readings.')
+    parser.add_argument('--jitter', type=int, default=0,
+                        help='Seconds by which readings can be early or late.')
+    parser.add_argument('--gap-rate', type=float, default=0.0,
+                        help='Probability of each second starting a gap in '
+                        'the readings.')
+    parser.add_argument('--noise', type=float, default=0.02,
+                        help='Standard deviation of power noise, relative to '
+                        'the power.')
+    parser.add_argument('-f', '--format', choices=['text', 'binary'],
+                        default='text', help='Format of the output files.')
+
+
+def add_monitor_arguments(parser):
+    """Add the arguments of the monitor subcommand."""
+    parser.add_argument('-a', '--aggregated', required=True,
+                        help='Aggregated power usage file to learn from.')
+    parser.add_argument('-d', '--dir', required=True,
+                        help='Directory containing device files to learn '
+                        'from.')
+    add_log_argument(parser)
+    add_resolution_argument(parser)
+    parser.add_argument('-p', '--preprocess',
+                        choices=['constant', 'interval', 'edge', 'markov'],
+                        default='markov',
+                        help='How to learn the device power levels.')
+    parser.add_argument('-t', '--threshold', type=float, default=25.0,
+                        help='Power above which a device is on, and the '
+                        'smallest step taken as a switch.')
+    parser.add_argument('-i', '--input', default='-',
+                        help='File of aggregate readings to disaggregate, '
+                        'standard input by default.')
+
+
+def add_levels_arguments(parser):
+    """Add the arguments of the levels subcommand."""
+    parser.add_argument('-a', '--aggregated', required=True,
+                        help='Aggregated power usage file of the new data.')
+    parser.add_argument('-d', '--dir', required=True,
+                        help='Directory containing device files of the new '
+                        'data.')
+    parser.add_argument('-s', '--state', required=True,
+                        help='JSON file of the device sketches, updated in '
+                        'place.')
+    add_log_argument(parser)
+    add_resolution_argument(parser)
+    parser.add_argument('-t', '--threshold', type=float, default=25.0,
+                        help='Power above which a device is on.')
+    parser.add_argument('-k', type=int, default=3,
+                        help='Number of power levels of new devices.')
+
+
+def add_pyramid_arguments(parser):
+    """Add the arguments of the pyramid subcommand."""
+    parser.add_argument('files', nargs='+', help='Timeseries files.')
+    add_log_argument(parser)
+    parser.add_argument('--levels', nargs='+', type=int,
+                        default=[10, 60, 900],
+                        help='Seconds per sample of each level.')
+    parser.add_argument('--how', choices=RESAMPLE_METHODS,
+                        default='mean',
+                        help='How to combine the samples of each bin.')
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog='nilm', description='Non-intrusive '
+                                     'load monitoring tools.')
+    subparsers = parser.add_subparsers(dest='command')
+
+    for (name, help_text, add_arguments, run) in [
+            ('aggregate', 'Create a new aggregated power file.',
+             add_aggregate_arguments, run_aggregate),
+            ('train', 'Train neural networks for the given devices.',
+             add_train_arguments, run_train),
+            ('preprocess', 'Write preprocessed device files.',
+             add_preprocess_arguments, run_preprocess),
+            ('evaluate', 'Score estimated device files against the truth.',
+             add_evaluate_arguments, run_evaluate),
+            ('disaggregate', 'Estimate device files with trained networks.',
+             add_disaggregate_arguments, run_disaggregate),
+            ('benchmark', 'Benchmark the hot paths at several data sizes.',
+             add_benchmark_arguments, run_benchmark),
+            ('synthesize', 'Write the meter files of a synthetic household.',
+             add_synthesize_arguments, run_synthesize),
+            ('monitor', 'Disaggregate live aggregate readings.',
+             add_monitor_arguments, run_monitor),
+            ('levels', 'Update device power levels with new data.',
+             add_levels_arguments, run_levels),
+            ('pyramid', 'Build cached resampled levels of timeseries files.',
+             add_pyramid_arguments, run_pyramid)]:
+        subparser = subparsers.add_parser(name, help=help_text,
+                                          description=help_text)
+        add_arguments(subparser)
+        subparser.set_defaults(run=run)
+
+    return parser
+
+
+def main(argv=None):
+    parser = get_parser()
+    args = parser.parse_args(argv)
+    logging.basicConfig(filename=args.log, level=logging.DEBUG,
+                        format=LOG_FORMAT)
+
+    if getattr(args, 'trace', None) is None:
+        return args.run(args)
+
+    trace.enable(args.trace)
+    try:
+        return args.run(args)
+    finally:
+        trace.disable()
+        print(trace.format_summary(trace.summarize(trace.read_trace(
+            args.trace))))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
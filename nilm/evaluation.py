@@ -40,3 +40,63 @@ def mean_squared_error(test, truth):
 def root_mean_squared_error(test, truth):
     """Calculate the root mean squared error between the two arrays."""
     return np.sqrt(mean_squared_error(test, truth))
+
+
+def count_above(matrix, thresholds):
+    """
+    Count the values in each column of the matrix which are above each of the
+    thresholds, by sorting the columns once and searching for every threshold.
+    Returns a D x K array of counts.
+    """
+    ordered = np.sort(matrix, axis=0)
+    length = ordered.shape[0]
+
+    return np.array([length - np.searchsorted(ordered[:, d], thresholds,
+                                              side='right')
+                     for d in xrange(ordered.shape[1])], dtype=np.float64)
+
+
+def evaluate(test, truth, thresholds):
+    """
+    Evaluate T x D matrices of test power against the ground truth for every
+    device and every threshold at once. Returns a dictionary of D x K arrays
+    of true positive, false positive and false negative counts, precision,
+    recall and F1 score, along with the per-device mean squared error and
+    root mean squared error.
+
+    A device with no predicted positives has a precision of 1, and one with
+    no true positives has a recall of 1, so that agreeing that a device is
+    always off scores perfectly rather than producing NaN.
+    """
+    test = np.asarray(test)
+    truth = np.asarray(truth)
+    if test.ndim == 1:
+        test = test[:, np.newaxis]
+        truth = truth[:, np.newaxis]
+
+    # Compare in the type of the power data, as TimeSeries.indicators does.
+    thresholds = np.atleast_1d(np.asarray(thresholds,
+                                          dtype=np.result_type(test, truth)))
+
+    # A sample is a true positive exactly when the smaller of the test and
+    # truth powers is above the threshold.
+    predicted = count_above(test, thresholds)
+    actual = count_above(truth, thresholds)
+    true_positives = count_above(np.minimum(test, truth), thresholds)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = np.where(predicted > 0, true_positives / predicted, 1.0)
+        recall = np.where(actual > 0, true_positives / actual, 1.0)
+        score = np.where(precision + recall > 0,
+                         2 * precision * recall / (precision + recall), 0.0)
+
+    squared = ((test.astype(np.float64) - truth) ** 2).mean(axis=0)
+
+    return {'true_positives': true_positives,
+            'false_positives': predicted - true_positives,
+            'false_negatives': actual - true_positives,
+            'precision': precision,
+            'recall': recall,
+            'f_score': score,
+            'mean_squared_error': squared,
+            'root_mean_squared_error': np.sqrt(squared)}
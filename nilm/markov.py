@@ -1,122 +1,432 @@
-def find_means(l, Y, k):
-    # memo[m,k] is the minimum value of the optimization we can do over
-    # {Y[0],...,Y[m-1]} with k means to use.
-    memo = {}
-
-    # means[m,k] is the value of the k means used to obtain the minimum
-    # value over the {Y[0],...,Y[m-1]}
-    means = {}
-
-    for m in range(1,len(Y)+1):
-        means[m,1] = [float(sum(l[j]*Y[j] for j in range(m)))/float(sum(l[j] for j in range(m)))]
-        memo[m,1] = sum(l[j]*(Y[j] - means[m,1][0])**2 for j in range(m))
-
-    for k2 in range(2,k+1):
-        for m2 in range(1,len(Y)+1):
-            if (m2 <= k2):
-                # The best option is just to cover all points. If we ever use these values
-                # we are probably overfitting our data.
-                memo[m2,k2] = 0
-                means[m2,k2] = list(set(Y[x] for x in range(m2)))
-                continue
-
-            min_value = float('inf')
-            best_means = []
-
-            for p in range(1,m2):
-                mean_location = float(sum(l[j]*Y[j] for j in range(p,m2)))/float(sum(l[j] for j in range(p,m2)))
-                value = memo[p,k2-1] + sum(l[j]*(Y[j] - mean_location)**2 for j in range(p,m2))
-
-                if value < min_value:
-                    best_means = means[p,k2-1] + [mean_location]
-                    min_value = value
-
-            memo[m2,k2] = min_value
-            means[m2,k2] = best_means
-
-    return (memo[len(Y), k], means[len(Y), k])
+"""
+Disaggregation by fitting per-device power levels to the step changes in the
+aggregate power.
+"""
 
+# pylint: disable=E1101
 
+import numpy as np
 
 
-def only_switch(indicator, device, devices, t):
-    switchers = [d for d in devices if indicator[d,t-1] != indicator[d,t]]
-    return device in switchers and len(switchers) == 1
+def segment_cost(prefix, start, end):
+    """
+    Weighted squared error of the values in [start, end) about their weighted
+    mean, from the prefix sums of weights, weighted values, and weighted
+    squares. Start and end may be arrays.
+    """
+    (weights, values, squares) = prefix
+    weight = weights[end] - weights[start]
+    value = values[end] - values[start]
 
-def fit_data(power, device, indicator, k, devices):
-    # power[time] is power
-    # indicator[device, time] is boolean
+    return (squares[end] - squares[start]) - value * value / weight
 
-    current_length = 0
-    change = 0
-    power_length_pairs = []
-    lone_switcher = False
 
-    for t in sorted(power.keys()):
-        if (indicator[device, t] == 0 and current_length != 0):
-            if (only_switch(indicator, device, devices, t)):
-                lone_switcher = True
-                change = abs(power[t] - power[t-1])
+def best_splits(prefix, previous, ends, first, last, splits):
+    """
+    Fill in splits[m] for every m in ends, the smallest p in [first, last]
+    minimizing previous[p] + segment_cost(p, m). The optimal split is monotone
+    in m for sorted values, so we solve the middle end and divide the range of
+    candidate splits between the two halves.
+    """
+    if len(ends) == 0:
+        return
 
-            if (lone_switcher):
-                power_length_pairs.append((change, current_length))
-            current_length = 0
+    middle = len(ends) // 2
+    end = ends[middle]
 
-        if (indicator[device, t] != 0 and current_length == 0):
-            change = abs(power[t] - power[t-1])
-            lone_switcher = only_switch(indicator, device, devices, t)
-            current_length = 1
+    candidates = np.arange(first, min(last, end - 1) + 1)
+    costs = previous[candidates] + segment_cost(prefix, candidates, end)
+    split = candidates[np.argmin(costs)]
+    splits[end] = split
 
-        if (indicator[device, t] != 0 and current_length != 0):
-            current_length += 1
+    best_splits(prefix, previous, ends[:middle], first, split, splits)
+    best_splits(prefix, previous, ends[middle+1:], split, last, splits)
 
-    if (current_length != 0):
-        power_length_pairs.append((change, current_length))
-        current_length = 0
 
-    power_length_pairs.sort(key = lambda x: x[0])
-
-    powers = [power_length_pairs[i][0] for i in range(len(power_length_pairs))]
-    lengths = [power_length_pairs[i][1] for i in range(len(power_length_pairs))]
-
-    print("POWERS", powers, lengths)
-
-    estimates = find_means(lengths, powers, k)[1]
-    print("ESTIMATES", find_means(lengths, powers, k))
-
-    disaggregated = {}
-    best_fit = lambda x: min(estimates, key = lambda y: (y - x)**2)
-    change = power[0]
-    current_length = 1
-
-    first = True
-    for t in sorted(power.keys()):
-        if first:
-            first = False
-            print("BEST", best_fit(change))
-            disaggregated[t] = min([0, best_fit(change)], key = lambda x: (x - change)**2)
-            continue
+def find_means(l, Y, k):
+    """
+    Find the k means minimizing the squared error of the values Y weighted by
+    l, where each mean covers a contiguous run of Y. Returns the minimum error
+    and the means.
+
+    Segment costs come from prefix sums, and each level of the dynamic program
+    is solved by divide and conquer over the monotone optimal splits, falling
+    back to a search of every split if Y is not sorted. The chosen segments are
+    then backtracked and their means and error summed exactly as before.
+    """
+    n = len(Y)
+    if n == 0:
+        # There is no solution over no values, callers expect a missing entry.
+        raise KeyError((n, k))
+
+    weights = np.asarray(l, dtype=np.float64)
+    values = np.asarray(Y, dtype=np.float64)
+    values = values - values.mean()
+
+    prefix = tuple(np.concatenate(([0.0], np.cumsum(x))) for x in
+                   (weights, weights * values, weights * values ** 2))
+
+    # memo[k2][m] is the minimum value of the optimization over
+    # {Y[0],...,Y[m-1]} with k2 means, and splits[k2][m] is where the last of
+    # those means starts.
+    sorted_values = bool(np.all(values[1:] >= values[:-1]))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        memo = {1: segment_cost(prefix, 0, np.arange(n + 1))}
+        splits = {}
+
+        for k2 in range(2, k + 1):
+            # With no more values than means, every value gets its own mean.
+            memo[k2] = np.zeros(n + 1)
+            splits[k2] = np.zeros(n + 1, dtype=np.int64)
+            ends = np.arange(k2 + 1, n + 1)
+
+            if sorted_values:
+                best_splits(prefix, memo[k2-1], ends, 1, n - 1, splits[k2])
+            else:
+                for end in ends:
+                    candidates = np.arange(1, end)
+                    costs = (memo[k2-1][candidates] +
+                             segment_cost(prefix, candidates, end))
+                    splits[k2][end] = candidates[np.argmin(costs)]
+
+            split = splits[k2][ends]
+            memo[k2][ends] = (memo[k2-1][split] +
+                              segment_cost(prefix, split, ends))
+
+    return backtrack_means(l, Y, k, splits)
+
+
+def backtrack_means(l, Y, k, splits):
+    """
+    Recover the error and means of the segments chosen by find_means, working
+    back from the last segment.
+    """
+    segments = []
+    end = len(Y)
+    k2 = k
+
+    while k2 > 1 and end > k2:
+        segments.append((splits[k2][end], end))
+        end = splits[k2][end]
+        k2 -= 1
+
+    if k2 == 1:
+        mean = (float(sum(l[j]*Y[j] for j in range(end))) /
+                float(sum(l[j] for j in range(end))))
+        min_value = sum(l[j]*(Y[j] - mean)**2 for j in range(end))
+        means = [mean]
+    else:
+        # The best option is just to cover all points. If we ever use these
+        # values we are probably overfitting our data.
+        min_value = 0
+        means = list(set(Y[x] for x in range(end)))
+
+    for (start, end) in reversed(segments):
+        mean_location = (float(sum(l[j]*Y[j] for j in range(start, end))) /
+                         float(sum(l[j] for j in range(start, end))))
+        min_value = min_value + sum(l[j]*(Y[j] - mean_location)**2
+                                    for j in range(start, end))
+        means = means + [mean_location]
+
+    return (min_value, means)
+
+
+def switch_masks(indicator_matrix):
+    """
+    Given a T x D matrix of on/off indicators, returns the T x D matrix of
+    device state changes and the length T mask of times where exactly one
+    device changed state. Every device is taken to be off before the first
+    time.
+    """
+    indicator_matrix = np.asarray(indicator_matrix, dtype=bool)
+    previous = np.vstack((np.zeros((1, indicator_matrix.shape[1]), dtype=bool),
+                          indicator_matrix[:-1]))
+
+    switches = indicator_matrix != previous
+    lone = switches.sum(axis=1) == 1
+
+    return (switches, lone)
+
+
+def activation_steps(aggregated, indicator_matrix, device, masks=None):
+    """
+    Find the activations of the given device and the aggregate step changes
+    to fit its power levels to. Returns the absolute steps of the aggregate,
+    the [start, end) indices of the activations, and the step change and
+    length of each activation used for fitting. Only activations where the
+    device was the lone switcher at either end are used, except for an
+    activation still running at the end. The aggregate is taken to be zero
+    before the first time.
+    """
+    if masks is None:
+        masks = switch_masks(indicator_matrix)
+    (switches, lone) = masks
+
+    aggregated = np.asarray(aggregated, dtype=np.float64)
+    steps = np.abs(np.diff(np.concatenate(([0.0], aggregated))))
+    lone_switch = lone & switches[:, device]
+
+    ind = np.asarray(indicator_matrix[:, device], dtype=np.int8)
+    edges = np.diff(np.concatenate(([0], ind, [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    closed = ends < len(aggregated)
+    lone_end = np.zeros(len(ends), dtype=bool)
+    lone_end[closed] = lone_switch[ends[closed]]
+
+    used = ~closed | lone_end | lone_switch[starts]
+    changes = np.where(lone_end, steps[np.minimum(ends, len(steps) - 1)],
+                       steps[starts])[used]
+    lengths = (ends - starts)[used]
+
+    return (steps, starts, ends, changes, lengths)
+
+
+def device_levels(changes, lengths, k):
+    """
+    Fit k power levels to the step changes of a device's activations,
+    weighted by the activation lengths.
+    """
+    order = np.argsort(changes, kind='mergesort')
+    return np.array(find_means(lengths[order].tolist(),
+                               changes[order].tolist(), k)[1])
+
+
+def fit_device(aggregated, indicator_matrix, device, k, masks=None):
+    """
+    Fit k power levels to the aggregate step changes where the given device
+    switches on or off, and return the device power as the level nearest the
+    step at the start of each of its activations. Masks from switch_masks may
+    be passed in to avoid recomputing them for each device.
+    """
+    (steps, starts, ends, changes, lengths) = activation_steps(
+        aggregated, indicator_matrix, device, masks)
+    estimates = device_levels(changes, lengths, k)
+
+    # The nearest level to the step which turned each activation on.
+    nearest = np.argmin(np.abs(steps[starts, np.newaxis] - estimates), axis=1)
+
+    ind = np.asarray(indicator_matrix[:, device], dtype=bool)
+    disaggregated = np.zeros(len(steps))
+    disaggregated[ind] = np.repeat(estimates[nearest], ends - starts)
 
-        elif (indicator[device, t] == 0):
-            current_length = 0
-            disaggregated[t] = 0
+    return disaggregated
 
-        elif (current_length == 0):
-            change = abs(power[t] - power[t-1])
-            disaggregated[t] = best_fit(change)
-            current_length = 1
 
-        else: disaggregated[t] = best_fit(change)
+def fit_levels(aggregated, indicator_matrix, k):
+    """
+    Fit k power levels to the step changes of every device in the T x D
+    indicator matrix, returning a list of the level arrays of each device.
+    Devices without any usable step changes get no levels.
+    """
+    masks = switch_masks(indicator_matrix)
+    levels = []
+
+    for d in xrange(np.shape(indicator_matrix)[1]):
+        (_, _, _, changes, lengths) = activation_steps(
+            aggregated, indicator_matrix, d, masks)
+        try:
+            levels.append(device_levels(changes, lengths, k))
+        except KeyError:
+            levels.append(np.zeros(0))
+
+    return levels
+
+
+def fit_devices(aggregated, indicator_matrix, k):
+    """
+    Fit every device in the T x D indicator matrix, returning a T x D array of
+    disaggregated power. Devices without any usable step changes are given
+    zero power.
+    """
+    masks = switch_masks(indicator_matrix)
+    disaggregated = np.zeros(np.shape(indicator_matrix))
+
+    for d in xrange(disaggregated.shape[1]):
+        try:
+            disaggregated[:, d] = fit_device(aggregated, indicator_matrix, d,
+                                             k, masks)
+        except KeyError:
+            pass
 
     return disaggregated
 
-# NOTE: PAD DATA WITH ONE TIME SAMPLE WHERE EVERYTHING IS OFF
-
-#print(find_means([1,2,3,4,2], [0,1,8,8,9], 3))
-
-#power = {0:0, 1:5, 2:3, 3:2, 4:0, 5:2, 6:3}
-#indicator = {(1,0): 0, (1,1):1, (1,2):1, (1,3):0, (1,4):0, (1,5):1, (1,6):1,
-#             (2,0): 0, (2,1):1, (2,2):0, (2,3):1, (2,4):0, (2,5):0, (2,6):0}
-#k = 2
 
-#print(fit_data(power, 2, indicator, k, [1,2]))
+def power_options(levels):
+    """
+    The D x W array of the powers each device can be at, off first and padded
+    with NaN, given a list of the levels of each device.
+    """
+    levels = [np.atleast_1d(np.asarray(l, dtype=np.float64)) for l in levels]
+    options = np.full((len(levels), max([len(l) for l in levels] + [0]) + 1),
+                      np.nan)
+    options[:, 0] = 0.0
+    for (d, l) in enumerate(levels):
+        options[d, 1:len(l)+1] = l
+
+    return options
+
+
+def constant_runs(aggregated, min_step):
+    """
+    Split the aggregate into runs between steps of at least min_step,
+    returning the start, length and mean power of each run.
+    """
+    breaks = np.abs(np.diff(aggregated)) >= min_step
+    starts = np.flatnonzero(np.concatenate(([True], breaks)))
+    lengths = np.diff(np.append(starts, len(aggregated)))
+    means = np.add.reduceat(aggregated, starts) / lengths
+
+    return (starts, lengths, means)
+
+
+class BeamDecoder(object):
+    """
+    Viterbi decoding of the joint state of every device, keeping only the
+    beam_width cheapest joint states at each step. A joint state gives each
+    device one of its options, and the cost of a run of the aggregate in a
+    state is its length times its squared distance from the total power of the
+    state, over twice the noise variance. At most one device changes option
+    between runs, at the cost of its switch penalty.
+    """
+    def __init__(self, options, targets, lengths, beam_width=64,
+                 switch_penalty=10.0, noise=25.0):
+        self.options = options
+        self.valid = ~np.isnan(options)
+        self.powers = np.where(self.valid, options, 0.0)
+        self.targets = targets
+        self.lengths = lengths
+        self.beam_width = beam_width
+        self.penalty = np.ones(len(options)) * switch_penalty
+        self.scale = 1.0 / (2.0 * noise ** 2)
+
+        # Joint states in the beam are told apart by a random hash of their
+        # options, updated as devices change.
+        self.hashes = np.random.RandomState(0).randint(
+            1, 2 ** 62, len(options)).astype(np.int64)
+
+    def emission(self, totals, run):
+        """The cost of a run given the total power of each state."""
+        return (self.lengths[run] * self.scale *
+                (self.targets[run] - totals) ** 2)
+
+    def expand(self, beam, scores, run):
+        """
+        Score every state reachable from the beam in the given run, and keep
+        the cheapest distinct states. Returns the new beam, its costs, and the
+        parent in the old beam and change code of each state. The code is
+        device * W + option, or -1 if no device changed.
+        """
+        (states, totals, keys) = beam
+        (devices, width) = self.options.shape
+
+        current = self.powers[np.arange(devices), states]
+        changes = self.powers[np.newaxis] - current[:, :, np.newaxis]
+
+        switched = (scores[:, np.newaxis, np.newaxis] +
+                    self.penalty[np.newaxis, :, np.newaxis] +
+                    self.emission(totals[:, np.newaxis, np.newaxis] + changes,
+                                  run))
+        switched[(np.arange(width) == states[:, :, np.newaxis]) |
+                 ~self.valid[np.newaxis]] = np.inf
+
+        costs = np.column_stack((scores + self.emission(totals, run),
+                                 switched.reshape(len(states), -1)))
+        flat = costs.ravel()
+
+        count = min(2 * self.beam_width, int(np.isfinite(flat).sum()))
+        best = np.argpartition(flat, count - 1)[:count]
+        best = best[np.argsort(flat[best], kind='mergesort')]
+
+        (parents, codes) = np.divmod(best, costs.shape[1])
+        codes -= 1
+        moved = np.flatnonzero(codes >= 0)
+        (device, option) = np.divmod(codes[moved], width)
+
+        new_states = states[parents]
+        new_totals = totals[parents]
+        new_keys = keys[parents]
+
+        new_totals[moved] += changes[parents[moved], device, option]
+        new_keys[moved] += ((option - new_states[moved, device]) *
+                            self.hashes[device])
+        new_states[moved, device] = option
+
+        # The first of each joint state is the cheapest, as they are sorted.
+        first = np.sort(np.unique(new_keys, return_index=True)[1])
+        first = first[:self.beam_width]
+
+        return ((new_states[first], new_totals[first], new_keys[first]),
+                flat[best[first]], parents[first], codes[first])
+
+    def decode(self):
+        """
+        Returns the runs x D array of the option of each device in the
+        cheapest sequence of joint states found.
+        """
+        (devices, width) = self.options.shape
+        runs = len(self.targets)
+
+        beam = (np.zeros((1, devices), dtype=np.int64), np.zeros(1),
+                np.zeros(1, dtype=np.int64))
+        penalties = np.zeros(1)
+
+        # Any number of devices may already be on in the first run.
+        for _ in xrange(devices):
+            (beam, costs, _, _) = self.expand(beam, penalties, 0)
+            penalties = costs - self.emission(beam[1], 0)
+        scores = penalties + self.emission(beam[1], 0)
+        initial = beam[0]
+
+        parents = np.zeros((runs, self.beam_width), dtype=np.int64)
+        codes = np.zeros((runs, self.beam_width), dtype=np.int64)
+        for run in xrange(1, runs):
+            (beam, scores, run_parents, run_codes) = self.expand(beam, scores,
+                                                                 run)
+            parents[run, :len(run_parents)] = run_parents
+            codes[run, :len(run_codes)] = run_codes
+
+        path = np.zeros(runs, dtype=np.int64)
+        best = np.argmin(scores)
+        for run in xrange(runs - 1, 0, -1):
+            path[run] = codes[run, best]
+            best = parents[run, best]
+
+        decoded = np.empty((runs, devices), dtype=np.int64)
+        decoded[0] = initial[best]
+        for run in xrange(1, runs):
+            decoded[run] = decoded[run - 1]
+            if path[run] >= 0:
+                decoded[run, path[run] // width] = path[run] % width
+
+        return decoded
+
+
+def decode_devices(aggregated, levels, beam_width=64, switch_penalty=10.0,
+                   noise=25.0, min_step=25.0, base_load=None):
+    """
+    Decode the power of each device from the aggregate alone, given a list of
+    the power levels of each device such as those from fit_levels, and return
+    a T x D array of disaggregated power. Devices only switch where the
+    aggregate steps by at least min_step, so the decoder works over the runs
+    of roughly constant aggregate between them. The base load, not belonging
+    to any device, defaults to the lowest power of any run, or zero if that is
+    negative. See BeamDecoder for the beam width, switch penalty and noise.
+    """
+    aggregated = np.asarray(aggregated, dtype=np.float64)
+    options = power_options(levels)
+    if len(aggregated) == 0:
+        return np.zeros((0, len(options)))
+
+    (_, lengths, means) = constant_runs(aggregated, min_step)
+    if base_load is None:
+        base_load = max(means.min(), 0.0)
+
+    decoder = BeamDecoder(options, means - base_load, lengths, beam_width,
+                          switch_penalty, noise)
+    states = decoder.decode()
+
+    return np.repeat(decoder.powers[np.arange(len(options)), states], lengths,
+                     axis=0)
@@ -1,35 +1,63 @@
 """
-Set of neural networks for use with NILM task.
+Set of neural networks for use with NILM task. Keras is only imported when a
+model is built or loaded.
 """
 
+import json
 import os
 
-from keras.models import Sequential, model_from_yaml
-from keras.layers.convolutional import Convolution1D
-from keras.layers.core import Dense, Flatten, Reshape
+import numpy as np
+
+from nilm.timeseries import TimeSeries
+from nilm.windows import (WINDOW_MARGIN, aggregate_scale, normalize_windows,
+                          sliding_windows, valid_windows)
+
+
+# The extension of the file saved next to each model holding the aggregate
+# scale and device maximum power it was trained with.
+NORMALIZATION_EXTENSION = '.json'
 
 
 class DenoisingAutoencoder(object):
     """
     Neural network which implements a denoising auto-encoder. Inputs are
     convoluted before being fed into an encoding layer. From the encoding layer
-    we learn to recover the original signal.
+    we learn to recover the original signal. When loading a model, the window
+    size may be left as None to take it from the model's input, and the
+    normalization saved next to the model is loaded if there is one.
     """
-    def __init__(self, window_size, model_path=None, weight_path=None):
+    def __init__(self, window_size, model_path=None, weight_path=None,
+                 normalization_path=None):
         self.num_filters = 8
-        self.window_size = window_size
-        self.size = (window_size - 3) * self.num_filters
+        self.std_dev = None
+        self.max_power = None
 
         if model_path is not None:
             self.load_model(model_path)
-        else:
+            if window_size is None:
+                window_size = self.model.input_shape[1]
+            if normalization_path is None:
+                normalization_path = normalization_file(model_path)
+
+        self.window_size = window_size
+        self.size = (window_size - 3) * self.num_filters
+
+        if model_path is None:
             self.initialize_model()
 
         if weight_path is not None:
             self.load_weights(weight_path)
 
+        if (normalization_path is not None and
+                os.path.exists(normalization_path)):
+            self.load_normalization(normalization_path)
+
     def initialize_model(self):
         """Initialize the network model."""
+        from keras.models import Sequential
+        from keras.layers.convolutional import Convolution1D
+        from keras.layers.core import Dense, Flatten, Reshape
+
         self.model = Sequential()
 
         self.model.add(Convolution1D(self.num_filters, 4, 'uniform', 'linear',
@@ -48,25 +76,126 @@ class DenoisingAutoencoder(object):
 
         self.model.compile(loss='mean_squared_error', optimizer='rmsprop')
 
-    def train(self, aggregate_power, device_power):
+    def train(self, aggregate_power, device_power, batch_size=10):
         """Train the network given the aggregate and device powers."""
-        self.model.fit(aggregate_power, device_power, batch_size=10, nb_epoch=1)
+        self.model.fit(aggregate_power, device_power, batch_size=batch_size,
+                       nb_epoch=1)
+
+    def train_generator(self, generator, samples):
+        """
+        Train the network on batches of aggregate and device powers from the
+        given generator, covering the given number of samples.
+        """
+        self.model.fit_generator(generator, samples, nb_epoch=1)
+
+    def disaggregate(self, agg_data, max_power=None, std_dev=None,
+                     stride=None, batch_size=1024, period=1):
+        """
+        Run the whole aggregate timeseries through the network, returning the
+        estimated device timeseries. Windows start every stride samples, by
+        default half the output window, and the overlapping outputs are
+        averaged. Aggregate windows are normalized by std_dev as in training,
+        and the output is scaled back up by the device's max_power. Both
+        default to the values the network was trained with, if they were
+        loaded, and otherwise to an estimate from the aggregate and to one.
+        Samples not covered by any window without a gap, given the series is
+        sampled every period time units, are given zero power.
+        """
+        window_size = self.window_size
+        output_size = window_size - 2 * WINDOW_MARGIN
+        length = len(agg_data.array)
+
+        if stride is None:
+            stride = max(1, output_size // 2)
+        if std_dev is None:
+            std_dev = self.std_dev
+        if std_dev is None:
+            std_dev = aggregate_scale(agg_data)
+        if max_power is None:
+            max_power = self.max_power if self.max_power is not None else 1.0
+
+        # Every window start, with a final window flush with the end, keeping
+        # the windows that do not span a gap.
+        starts = valid_windows(agg_data.times, window_size, stride,
+                               period) * stride
+        last = length - window_size
+        if (last > 0 and last % stride != 0 and
+                len(valid_windows(agg_data.times[last:], window_size, 1,
+                                  period)) > 0):
+            starts = np.append(starts, last)
+
+        windows = sliding_windows(agg_data.powers, window_size)
+        total = np.zeros(length)
+        count = np.zeros(length)
+
+        for first in xrange(0, len(starts), batch_size):
+            batch = starts[first:first+batch_size]
+            agg_windows = normalize_windows(windows[batch], std_dev)
+
+            predicted = self.model.predict(agg_windows[:, :, np.newaxis],
+                                           batch_size=batch_size, verbose=0)
+            predicted = predicted.reshape(len(batch), output_size)
+
+            # Starts are distinct, so each column is added without collisions.
+            for j in xrange(output_size):
+                total[batch + WINDOW_MARGIN + j] += predicted[:, j]
+                count[batch + WINDOW_MARGIN + j] += 1
+
+        powers = np.where(count > 0, total / np.maximum(count, 1), 0.0)
+
+        dev = TimeSeries()
+        dev.array = agg_data.array.copy()
+        dev.powers = (powers * max_power).astype(np.float32)
+
+        return dev
 
     def save_model(self, path):
         """Save the network model to the given path as yaml."""
         yaml_string = self.model.to_yaml()
         path = os.path.abspath(path)
 
-        with open(path, 'w') as fd:
+        # Write next to the destination and rename, so that readers never see
+        # a partially written model.
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as fd:
             fd.write(yaml_string)
+        os.rename(tmp_path, path)
 
     def save_weights(self, path):
         """Save the network weights to the given path in HDF5."""
         path = os.path.abspath(path)
-        self.model.save_weights(path, overwrite=True)
+
+        tmp_path = path + '.tmp'
+        self.model.save_weights(tmp_path, overwrite=True)
+        os.rename(tmp_path, path)
+
+    def save_normalization(self, path, std_dev, max_power):
+        """
+        Save the aggregate scale and device maximum power the network is
+        trained with to the given path as JSON, and use them to disaggregate.
+        """
+        self.std_dev = float(std_dev)
+        self.max_power = float(max_power)
+        path = os.path.abspath(path)
+
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as fd:
+            json.dump({'std_dev': self.std_dev, 'max_power': self.max_power},
+                      fd)
+        os.rename(tmp_path, path)
+
+    def load_normalization(self, path):
+        """Load the aggregate scale and device maximum power to use."""
+        with open(os.path.abspath(path), 'r') as fd:
+            normalization = json.load(fd)
+
+        self.std_dev = normalization['std_dev']
+        self.max_power = normalization['max_power']
 
     def load_model(self, model_path):
         """ Load the network model from the given path."""
+        from keras.models import model_from_yaml
+
         model_path = os.path.abspath(model_path)
         with open(model_path, 'r') as fd:
             self.model = model_from_yaml(fd.read())
@@ -75,3 +204,8 @@ class DenoisingAutoencoder(object):
         """Load the network weights from the given path."""
         weight_path = os.path.abspath(weight_path)
         self.model.load_weights(weight_path)
+
+
+def normalization_file(model_path):
+    """The path of the normalization saved next to a model."""
+    return os.path.splitext(model_path)[0] + NORMALIZATION_EXTENSION
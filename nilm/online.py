@@ -0,0 +1,112 @@
+"""
+Online disaggregation of a live aggregate reading. Each reading is compared to
+a running baseline of the aggregate, and a step away from it is matched to the
+device state change, among the power levels learned offline, which best
+explains it. Only the baseline and the current power of each device are kept,
+so memory and time per reading do not grow with the length of the stream.
+"""
+
+# pylint: disable=E1101
+
+import numpy as np
+
+
+class OnlineDisaggregator(object):
+    """
+    Tracks the on/off state and power of each device from one aggregate
+    reading at a time.
+
+    Each device has a list of power levels, such as the means fitted by
+    find_means or the single power estimated by confidence_estimator, and is
+    either off or at one of its levels. Readings within threshold of the
+    baseline are taken as noise and smoothed into it. A larger step is
+    matched to the change of a single device, switching on, off or between
+    levels, whose change in power is closest to the step, if it is within
+    tolerance times the step. The baseline then moves to the new reading,
+    whether or not the step was explained.
+    """
+    def __init__(self, levels, names=None, threshold=25.0, tolerance=0.25,
+                 smoothing=0.05):
+        levels = [np.atleast_1d(np.asarray(l, dtype=np.float64)) for l in
+                  levels]
+        self.names = (list(names) if names is not None else
+                      [str(i) for i in xrange(len(levels))])
+        self.threshold = float(threshold)
+        self.tolerance = float(tolerance)
+        self.smoothing = float(smoothing)
+
+        # The powers each device can be at, off first, padded with NaN.
+        width = max([len(l) for l in levels] + [0]) + 1
+        self.options = np.full((len(levels), width), np.nan)
+        self.options[:, 0] = 0.0
+        for (i, l) in enumerate(levels):
+            self.options[i, 1:len(l)+1] = l
+
+        self.powers = np.zeros(len(levels))
+        self.baseline = None
+
+    def reset(self):
+        """Turn every device off and forget the baseline."""
+        self.powers[:] = 0.0
+        self.baseline = None
+
+    @property
+    def on(self):
+        """The boolean on/off state of each device."""
+        return self.powers > 0
+
+    def match(self, step):
+        """
+        Find the device change best explaining a step in the aggregate.
+        Returns the device index and its new power, or None if no change is
+        within tolerance.
+        """
+        changes = self.options - self.powers[:, np.newaxis]
+        errors = np.abs(changes - step)
+        errors[np.isnan(errors) | (changes == 0)] = np.inf
+
+        best = np.argmin(errors)
+        (device, option) = np.unravel_index(best, errors.shape)
+        if not errors[device, option] <= self.tolerance * abs(step):
+            return None
+
+        return (device, self.options[device, option])
+
+    def update(self, reading):
+        """
+        Take the next aggregate reading, and return the array of estimated
+        device powers. The array is updated in place by later readings.
+        """
+        reading = float(reading)
+        if self.baseline is None:
+            self.baseline = reading
+            return self.powers
+
+        step = reading - self.baseline
+        if -self.threshold < step < self.threshold:
+            self.baseline += self.smoothing * step
+            return self.powers
+
+        change = self.match(step)
+        if change is not None:
+            self.powers[change[0]] = change[1]
+        self.baseline = reading
+
+        # Devices are switched off, largest first, while the aggregate is too
+        # low for them all to be on.
+        while self.powers.any() and (self.powers.sum() >
+                                     reading + self.threshold):
+            self.powers[np.argmax(self.powers)] = 0.0
+
+        return self.powers
+
+    def run(self, readings):
+        """
+        Take a sequence of aggregate readings, returning the T x D array of
+        estimated device powers after each.
+        """
+        estimates = np.empty((len(readings), len(self.powers)))
+        for (t, reading) in enumerate(readings):
+            estimates[t] = self.update(reading)
+
+        return estimates
@@ -1,20 +1,29 @@
 """
-A collection of data pre-processing algorithms
+A collection of data pre-processing algorithms. SciPy is only imported by the
+constant energy solvers.
 """
 
 import numpy as np
 
-from scipy.optimize import minimize
-
 from nilm.evaluation import mean_squared_error
 
 
-def solve_constant_energy(aggregated, device_activations):
+def solve_constant_energy(aggregated, device_activations, method='nnls'):
     """
     Invert the indicator matrix, solving for the constant energy of each
     device. We return the constant power for each device, and the mean squared
-    error.
+    error. The 'nnls' method solves a non-negative least squares problem on
+    the device Gram matrix, while 'slsqp' minimizes the error over the full
+    matrix with a general-purpose solver.
     """
+    if method == 'nnls':
+        return solve_energy_statistics(
+            energy_statistics(aggregated, device_activations))
+    elif method != 'slsqp':
+        raise ValueError('Unknown constant energy method: %s' % method)
+
+    from scipy.optimize import minimize
+
     def objective(power, total, matrix):
         """Objective function for the minimization."""
         return np.sum((total - np.dot(matrix, power)) ** 2)
@@ -31,6 +40,77 @@ def solve_constant_energy(aggregated, device_activations):
 
     return (solution.x, error)
 
+
+def energy_statistics(aggregated, device_activations, chunk_size=100000):
+    """
+    Accumulate the sufficient statistics for solving the constant energies:
+    the device Gram matrix (X^T X), the correlation of the devices with the
+    aggregate (X^T y), the sum of squares of the aggregate, and the number of
+    samples. The indicator matrix X is only built chunk_size rows at a time.
+    """
+    statistics = None
+
+    for start in xrange(0, len(aggregated), chunk_size):
+        chunk = (aggregated[start:start+chunk_size],
+                 [a[start:start+chunk_size] for a in device_activations])
+        statistics = add_energy_statistics(statistics, *chunk)
+
+    if statistics is None:
+        statistics = add_energy_statistics(None, aggregated,
+                                           device_activations)
+
+    return statistics
+
+
+def add_energy_statistics(statistics, aggregated, device_activations):
+    """
+    Add the energy statistics of another block of samples to those already
+    accumulated, which may be None. Blocks can come from a stream of chunks,
+    so the statistics of a long series never need it all in memory.
+    """
+    matrix = np.column_stack(device_activations).astype(np.float64)
+    total = np.asarray(aggregated, dtype=np.float64)
+
+    block = (np.dot(matrix.T, matrix), np.dot(matrix.T, total),
+             np.dot(total, total), len(total))
+
+    if statistics is None:
+        return block
+
+    return tuple(s + b for (s, b) in zip(statistics, block))
+
+
+def solve_energy_statistics(statistics):
+    """
+    Solve for the non-negative constant energies which minimize the squared
+    error, given the accumulated energy statistics. We return the constant
+    power for each device, and the mean squared error.
+    """
+    from scipy.optimize import nnls
+
+    (gram, correlation, total_squares, count) = statistics
+
+    # Factor the Gram matrix as A^T A, so that |Ax - b|^2 differs from the
+    # squared error only by a constant. Directions the devices never span are
+    # dropped.
+    (eigenvalues, eigenvectors) = np.linalg.eigh(gram)
+    spanned = eigenvalues > eigenvalues.max(initial=0.0) * 1e-12
+    scales = np.sqrt(eigenvalues[spanned])
+
+    if spanned.any():
+        matrix = scales[:, np.newaxis] * eigenvectors[:, spanned].T
+        target = np.dot(eigenvectors[:, spanned].T, correlation) / scales
+        (power, _) = nnls(matrix, target)
+    else:
+        power = np.zeros(len(correlation))
+
+    squares = (total_squares - 2 * np.dot(power, correlation) +
+               np.dot(power, np.dot(gram, power)))
+    error = max(squares, 0.0) / count
+
+    return (power, error)
+
+
 def confidence(data):
     """A Heuristic for how usable our current estimate of data is."""
 
@@ -57,15 +137,10 @@ def sort_data(aggregated, devices, indicator_matrix):
     Generates usable samples for each device, where that
     device was the only device active at a single time period.
     """
+    samples = sort_samples(aggregated, indicator_matrix,
+                           np.arange(len(devices[0].times)))
 
-    data = [[] for _ in xrange(len(devices))]
-
-    for d in xrange(len(devices)):
-        for t in xrange(len(devices[d].times)):
-            if only_device(d, t, indicator_matrix):
-                data[d].append(aggregated[t])
-
-    return np.array([np.array(d) for d in data])
+    return group_samples(samples, len(devices))
 
 
 def changed_devices(devices, time_idx, indicator_matrix):
@@ -82,17 +157,77 @@ def get_changed_data(aggregated, devices, indicator_matrix):
     Generates data for each device by the step inference method, calculating
     the change in energy usage as a single device changes.
     """
+    samples = changed_samples(aggregated, indicator_matrix,
+                              np.arange(len(devices[0].times)))
 
-    data = [[] for _ in xrange(len(devices))]
+    return group_samples(samples, len(devices))
 
-    for t in xrange(1, len(devices[0].times)):
-        changed = changed_devices(devices, t, indicator_matrix)
 
-        if len(changed) == 1:
-            power_diff = abs(aggregated[t] - aggregated[t-1])
-            data[changed[0]].append(power_diff)
+def group_samples(samples, num_devices):
+    """
+    Group samples, given as arrays of device indices and values, into an array
+    of the values for each device in their original order.
+    """
+    (device, values) = samples
+
+    order = np.argsort(device, kind='mergesort')
+    splits = np.cumsum(np.bincount(device, minlength=num_devices))[:-1]
+
+    return np.array(np.split(values[order], splits))
+
+
+def sort_samples(aggregated, indicator_matrix, rows):
+    """
+    Returns the samples among the given rows where a single device was active,
+    as arrays of the active device index and the aggregated power.
+    """
+    matrix = indicator_matrix[rows]
+    lone = matrix.sum(axis=1) == 1
+
+    return (matrix[lone].argmax(axis=1), aggregated[rows][lone])
+
+
+def changed_samples(aggregated, indicator_matrix, rows):
+    """
+    Returns the samples among the given rows where a single device changed
+    state from the previous row, as arrays of the changed device index and the
+    change in aggregated power.
+    """
+    rows = rows[rows > 0]
+    changed = indicator_matrix[rows] != indicator_matrix[rows - 1]
+    lone = changed.sum(axis=1) == 1
+
+    return (changed[lone].argmax(axis=1),
+            np.abs(aggregated[rows][lone] - aggregated[rows - 1][lone]))
+
+
+def add_samples(statistics, samples, sign):
+    """
+    Add (sign 1) or remove (sign -1) samples from the per-device count, sum
+    and sum of squares statistics.
+    """
+    (device, values) = samples
+    values = values.astype(np.float64)
+    length = statistics.shape[1]
+
+    statistics[0] += sign * np.bincount(device, minlength=length)
+    statistics[1] += sign * np.bincount(device, values, minlength=length)
+    statistics[2] += sign * np.bincount(device, values ** 2, minlength=length)
+
+
+def statistics_confidence(statistics):
+    """
+    The confidence heuristic and mean for each device, from its count, sum and
+    sum of squares statistics.
+    """
+    (count, total, squares) = statistics
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = total / count
+        variance = np.maximum(squares / count - mean ** 2, 0.0)
+        heuristic = np.where(count > 0, variance / count, np.inf)
 
-    return np.array([np.array(d) for d in data])
+    return (heuristic, mean)
 
 
 def confidence_estimator(aggregated, devices, data_sorter,
@@ -109,32 +244,74 @@ def confidence_estimator(aggregated, devices, data_sorter,
     is distributed. This function assumes that every device will be able to be
     calculated at some point. If not, this function is not able to estimate the
     programs accurately.
+
+    Devices are removed one at a time by masking their indicators, and their
+    estimated power is subtracted from a single residual copy of the aggregate.
+    For the two data sorters above, only the statistics of the rows where the
+    removed device was active are updated.
     """
     if len(devices) == 0:
         return {}
 
     indicator_matrix = np.column_stack([d.indicators(threshold) for
                                         d in devices])
+    residual = np.array(aggregated)
+    remaining = np.ones(len(devices), dtype=bool)
+
+    sampler = SAMPLERS.get(data_sorter)
+    if sampler is not None:
+        statistics = np.zeros((3, len(devices)))
+        add_samples(statistics, sampler(residual, indicator_matrix,
+                                        np.arange(len(residual))), 1)
+
+    calculated_means = {}
+    while remaining.any():
+        candidates = np.flatnonzero(remaining)
+
+        # Pick data to remove according to some heuristic
+        if sampler is not None:
+            (heuristic, means) = statistics_confidence(
+                statistics[:, candidates])
+        else:
+            data = data_sorter(residual, [devices[d] for d in candidates],
+                               indicator_matrix[:, candidates])
+            heuristic = [confidence(d) for d in data]
+            means = [d.mean(axis=None) if len(d) > 0 else 0.0 for d in data]
+
+        best = int(np.argmin(heuristic))
+        choice = candidates[best]
+
+        if heuristic[best] == np.inf:
+            # Need to pick a better approach, try
+            # generating more data using level technique.
+            mean_choice = np.float32(0.0)
+        else:
+            mean_choice = np.float32(means[best])
+
+        # Samples change where the device was active, where they follow such a
+        # row, and where the residual still needs clipping.
+        active = indicator_matrix[:, choice].copy()
+        affected = active | (residual < 0)
+        affected[1:] = affected[1:] | affected[:-1]
+        rows = np.flatnonzero(affected)
+
+        if sampler is not None:
+            add_samples(statistics, sampler(residual, indicator_matrix, rows),
+                        -1)
+
+        residual[active] -= mean_choice
+        residual[rows] = np.clip(residual[rows], np.float32(0.0), np.inf)
+        indicator_matrix[:, choice] = False
+
+        if sampler is not None:
+            add_samples(statistics, sampler(residual, indicator_matrix, rows),
+                        1)
+
+        remaining[choice] = False
+        calculated_means[devices[choice].name] = mean_choice
 
-    data = data_sorter(aggregated, devices, indicator_matrix)
-
-    # Pick data to remove according to some heuristic
-    heuristic = lambda x: confidence(data[x])
-    choice = min(range(len(devices)), key=heuristic)
-
-    if heuristic(choice) == np.inf:
-        # Need to pick a better approach, try
-        # generating more data using level technique.
-        mean_choice = np.float32(0.0)
-    else:
-        mean_choice = data[choice].mean(axis=None)
-
-    new_aggregated = aggregated - indicator_matrix[:, choice] * mean_choice
-    new_aggregated = np.clip(new_aggregated, np.float32(0.0), np.inf)
+    return calculated_means
 
-    new_devices = devices[:choice] + devices[choice+1:]
-    calculated_means = confidence_estimator(new_aggregated, new_devices,
-                                            data_sorter)
-    calculated_means[devices[choice].name] = mean_choice
 
-    return calculated_means
+# The data sorters whose samples confidence_estimator can update row by row.
+SAMPLERS = {sort_data: sort_samples, get_changed_data: changed_samples}
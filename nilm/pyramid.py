@@ -0,0 +1,110 @@
+"""
+Cached pyramids of a timeseries file resampled to coarser resolutions. Each
+level is stored in the binary format in a hidden directory next to the file,
+and is rebuilt whenever the file is newer than it, so that exploratory runs
+at a coarse resolution only pay for resampling once. Files in directories
+which cannot be written to are resampled in memory on every load instead.
+"""
+
+# pylint: disable=E1101
+
+import logging
+import os
+
+import numpy as np
+
+from nilm.timeseries import TimeSeries
+
+
+# Directory next to each timeseries file holding its pyramid levels.
+PYRAMID_DIRECTORY = '.pyramid'
+
+# Default bin sizes in seconds of the levels built for a file.
+LEVELS = (10, 60, 900)
+
+
+log = logging.getLogger(__name__)
+
+
+def level_path(path, bin_size, how='mean'):
+    """
+    The path of the pyramid level of the file at the given bin size. Levels
+    are named after the whole file name, so files differing only in their
+    extension have distinct levels.
+    """
+    name = os.path.basename(path)
+    return os.path.join(os.path.dirname(os.path.abspath(path)),
+                        PYRAMID_DIRECTORY,
+                        '%s.%ss.%s.npy' % (name, bin_size, how))
+
+
+def is_fresh(level, path):
+    """Returns True if the level exists and is no older than the file."""
+    return (os.path.exists(level) and
+            os.path.getmtime(level) >= os.path.getmtime(path))
+
+
+def save_level(ts, level):
+    """
+    Save a resampled timeseries as a pyramid level. It is written to a
+    temporary file and renamed into place, so concurrent readers never see a
+    partial level.
+    """
+    directory = os.path.dirname(level)
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            if not os.path.isdir(directory):
+                raise
+
+    tmp_path = '%s.%s.tmp' % (level, os.getpid())
+    try:
+        with open(tmp_path, 'wb') as fd:
+            np.save(fd, np.ascontiguousarray(ts.array))
+        os.rename(tmp_path, level)
+    except (IOError, OSError):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def build_pyramid(path, levels=LEVELS, how='mean', name=''):
+    """
+    Build every stale level of the pyramid of the file at the given path,
+    loading the file at most once. Returns the list of level paths.
+    """
+    paths = [level_path(path, bin_size, how) for bin_size in levels]
+
+    ts = None
+    for (bin_size, level) in zip(levels, paths):
+        if is_fresh(level, path):
+            continue
+        if ts is None:
+            ts = TimeSeries(name, path)
+        save_level(ts.resample(bin_size, how), level)
+
+    return paths
+
+
+def load_level(path, bin_size=1, how='mean', name=''):
+    """
+    Load the timeseries file at the given path resampled to bins of bin_size
+    seconds, from its pyramid if the level is fresh, and otherwise resampling
+    it and caching the level. If the level cannot be written, the resampled
+    series is only kept in memory. A bin size of one loads the file as it is.
+    """
+    if bin_size <= 1:
+        return TimeSeries(name, path)
+
+    level = level_path(path, bin_size, how)
+    if is_fresh(level, path):
+        return TimeSeries(name, level)
+
+    ts = TimeSeries(name, path).resample(bin_size, how)
+    try:
+        save_level(ts, level)
+    except (IOError, OSError) as error:
+        log.warning('Could not cache pyramid level %s: %s' % (level, error))
+
+    return ts
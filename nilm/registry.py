@@ -0,0 +1,143 @@
+"""
+Registry of trained networks, loading each device's model lazily and keeping
+the most recently used ones warm for repeated disaggregation. The networks,
+and Keras, are only imported when a model is first loaded.
+"""
+
+import collections
+import os
+import time
+
+
+# The extensions train.py saves each device's model and weights with.
+MODEL_EXTENSION = '.yml'
+WEIGHT_EXTENSION = '.h5'
+
+
+class ModelRegistry(object):
+    """
+    Index of the device networks saved in a model directory. Networks are
+    loaded on first use and kept in a least recently used cache of at most
+    max_models networks, keyed by their paths and modification times so that
+    retrained models are reloaded. Hits, misses and the total time spent
+    loading are counted.
+    """
+    def __init__(self, directory, max_models=8):
+        self.directory = os.path.abspath(directory)
+        self.max_models = max_models
+        self.paths = {}
+        self.hits = 0
+        self.misses = 0
+        self.load_time = 0.0
+        self._networks = collections.OrderedDict()
+
+        self.index()
+
+    def index(self):
+        """
+        Scan the model directory for saved models, returning the sorted device
+        names. Weights are optional, a model without them is loaded untrained.
+        """
+        self.paths = {}
+
+        for filename in os.listdir(self.directory):
+            (name, ext) = os.path.splitext(filename)
+            if ext != MODEL_EXTENSION:
+                continue
+
+            weight_path = os.path.join(self.directory, name + WEIGHT_EXTENSION)
+            if not os.path.exists(weight_path):
+                weight_path = None
+
+            self.paths[name] = (os.path.join(self.directory, filename),
+                                weight_path)
+
+        return sorted(self.paths)
+
+    def names(self):
+        """Returns the sorted names of the indexed devices."""
+        return sorted(self.paths)
+
+    def __contains__(self, name):
+        return name in self.paths
+
+    def get(self, name):
+        """
+        Returns the network for the named device, loading it if it is not
+        cached or has changed on disk. Raises KeyError for unknown devices,
+        including those whose files have been deleted.
+        """
+        from nilm.network import DenoisingAutoencoder
+
+        if name not in self.paths:
+            self.index()
+        try:
+            key = self.cache_key(name)
+        except OSError:
+            self.index()
+            try:
+                key = self.cache_key(name)
+            except OSError:
+                raise KeyError(name)
+        (model_path, weight_path) = (key[0], key[2])
+
+        network = self._networks.pop(key, None)
+        if network is None:
+            self.misses += 1
+            start = time.time()
+            network = DenoisingAutoencoder(None, model_path, weight_path)
+            self.load_time += time.time() - start
+
+            for stale in [k for k in self._networks if k[0] == model_path]:
+                del self._networks[stale]
+        else:
+            self.hits += 1
+
+        self._networks[key] = network
+        while len(self._networks) > self.max_models:
+            self._networks.popitem(last=False)
+
+        return network
+
+    def cache_key(self, name):
+        """
+        The paths and modification times of the named device's files, which
+        identify its loaded network. Raises KeyError for unknown devices, and
+        OSError if the files no longer exist.
+        """
+        (model_path, weight_path) = self.paths[name]
+
+        return (model_path, os.path.getmtime(model_path), weight_path,
+                weight_path and os.path.getmtime(weight_path))
+
+    def disaggregate(self, agg_data, names=None, stride=None,
+                     batch_size=1024, period=1):
+        """
+        Run the aggregate timeseries, sampled every period time units, through
+        the network of every named device, by default every indexed device,
+        returning the list of estimated device timeseries, named after their
+        devices.
+        """
+        devices = []
+        for name in (names if names is not None else self.names()):
+            dev = self.get(name).disaggregate(agg_data, stride=stride,
+                                              batch_size=batch_size,
+                                              period=period)
+            dev.name = name
+            devices.append(dev)
+
+        return devices
+
+    def clear(self):
+        """Drop every cached network."""
+        self._networks.clear()
+
+    def stats(self):
+        """
+        Returns the cache hits and misses, the total seconds spent loading
+        networks, and the number of networks currently cached.
+        """
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'load_time': self.load_time,
+                'cached': len(self._networks)}
@@ -0,0 +1,166 @@
+"""
+Incremental estimation of device power levels. Step changes are summarized in
+a weighted histogram sketch of bounded size, and the levels are periodically
+refined by running find_means exactly over the sketch, so that new events can
+be added without keeping or re-sorting the whole history. Sketches can be
+saved and loaded, so each run only needs to add its new events.
+"""
+
+# pylint: disable=E1101
+
+import json
+
+import numpy as np
+
+from nilm.markov import activation_steps, find_means, switch_masks
+
+
+class LevelSketch(object):
+    """
+    A weighted histogram of step changes with at most max_bins bins, each
+    holding the total weight, weighted sum and weighted sum of squares of its
+    changes. When there are too many bins, the bins separated by the smallest
+    gaps are merged, which combines their statistics exactly. The k levels are
+    refined by find_means over the bin means every refine_every events, or
+    whenever refine is called.
+    """
+    def __init__(self, k=3, max_bins=256, refine_every=10000):
+        self.k = k
+        self.max_bins = max_bins
+        self.refine_every = refine_every
+
+        self.bins = np.zeros((0, 3))
+        self.events = 0
+        self.pending = 0
+        self.levels = np.zeros(0)
+        self.error = 0.0
+
+    @property
+    def means(self):
+        """The weighted mean change of each bin, in increasing order."""
+        return self.bins[:, 1] / self.bins[:, 0]
+
+    def add(self, changes, lengths):
+        """
+        Add step changes weighted by the lengths of their activations,
+        refining the levels if enough events have been added since they were
+        last refined.
+        """
+        changes = np.asarray(changes, dtype=np.float64)
+        lengths = np.asarray(lengths, dtype=np.float64)
+        keep = lengths > 0
+
+        new_bins = np.column_stack((lengths[keep], lengths[keep] *
+                                    changes[keep], lengths[keep] *
+                                    changes[keep] ** 2))
+        self.add_bins(new_bins)
+
+        self.events += int(keep.sum())
+        self.pending += int(keep.sum())
+        if self.pending >= self.refine_every:
+            self.refine()
+
+    def add_bins(self, new_bins):
+        """Merge rows of bin statistics into the sketch."""
+        bins = np.vstack((self.bins, new_bins))
+        order = np.argsort(bins[:, 1] / bins[:, 0], kind='mergesort')
+        self.bins = compress_bins(bins[order], self.max_bins)
+
+    def merge(self, other):
+        """Add the bins of another sketch to this one."""
+        self.add_bins(other.bins)
+        self.events += other.events
+        self.pending += other.events
+
+    def refine(self):
+        """
+        Fit the k levels exactly over the bins, returning them. The error
+        includes the spread of the changes within each bin.
+        """
+        self.pending = 0
+        if len(self.bins) == 0:
+            self.levels = np.zeros(0)
+            self.error = 0.0
+            return self.levels
+
+        (error, levels) = find_means(self.bins[:, 0].tolist(),
+                                     self.means.tolist(), self.k)
+        spread = self.bins[:, 2] - self.bins[:, 1] ** 2 / self.bins[:, 0]
+
+        self.levels = np.sort(levels)
+        self.error = float(error + np.maximum(spread, 0).sum())
+
+        return self.levels
+
+    def to_dict(self):
+        """The state of the sketch, as a dictionary which can be saved."""
+        return {'k': self.k, 'max_bins': self.max_bins,
+                'refine_every': self.refine_every,
+                'bins': self.bins.tolist(), 'events': self.events,
+                'pending': self.pending, 'levels': self.levels.tolist(),
+                'error': self.error}
+
+    @classmethod
+    def from_dict(cls, state):
+        """Restore a sketch from the dictionary of its state."""
+        sketch = cls(state['k'], state['max_bins'], state['refine_every'])
+        sketch.bins = np.array(state['bins'], dtype=np.float64).reshape(-1, 3)
+        sketch.events = state['events']
+        sketch.pending = state['pending']
+        sketch.levels = np.array(state['levels'], dtype=np.float64)
+        sketch.error = state['error']
+
+        return sketch
+
+
+def compress_bins(bins, max_bins):
+    """
+    Merge rows of sorted bin statistics until there are at most max_bins, by
+    merging across the smallest gaps between bin means all at once.
+    """
+    excess = len(bins) - max_bins
+    if excess <= 0:
+        return bins
+
+    means = bins[:, 1] / bins[:, 0]
+    gaps = np.diff(means)
+    merged = np.zeros(len(gaps), dtype=bool)
+    merged[np.argpartition(gaps, excess - 1)[:excess]] = True
+
+    starts = np.flatnonzero(np.concatenate(([True], ~merged)))
+    return np.add.reduceat(bins, starts, axis=0)
+
+
+def sketch_devices(aggregated, indicator_matrix, names, sketches, k=3,
+                   max_bins=256):
+    """
+    Add the step changes of every device in the T x D indicator matrix to the
+    sketches, a dictionary from device name to sketch, creating sketches for
+    new devices. The levels of every sketch are refined afterwards.
+    """
+    masks = switch_masks(indicator_matrix)
+
+    for (d, name) in enumerate(names):
+        if name not in sketches:
+            sketches[name] = LevelSketch(k, max_bins)
+
+        (_, _, _, changes, lengths) = activation_steps(
+            aggregated, indicator_matrix, d, masks)
+        sketches[name].add(changes, lengths)
+        sketches[name].refine()
+
+    return sketches
+
+
+def save_sketches(path, sketches):
+    """Save a dictionary of sketches as JSON."""
+    with open(path, 'w') as fd:
+        json.dump(dict((name, s.to_dict()) for (name, s) in sketches.items()),
+                  fd, sort_keys=True)
+
+
+def load_sketches(path):
+    """Load a dictionary of sketches saved as JSON."""
+    with open(path, 'r') as fd:
+        return dict((name, LevelSketch.from_dict(state)) for (name, state) in
+                    json.load(fd).items())
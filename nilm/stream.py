@@ -0,0 +1,189 @@
+"""
+Streaming versions of the TimeSeries operations, working over iterators of
+sorted TimeSeries chunks such as those from TimeSeries.iter_chunks. State is
+carried across chunk boundaries so that the results match the operations on
+the whole series, while only a few chunks are ever held in memory.
+"""
+
+# pylint: disable=E1101
+
+import os
+
+import numpy as np
+
+from nilm.timeseries import TimeSeries, is_binary
+from nilm.trace import span
+
+
+def pad_chunks(chunks, max_pad, fill='hold'):
+    """
+    Pad a stream of timeseries chunks, as TimeSeries.pad does for a whole
+    series. The last sample of each chunk is carried over so that gaps across
+    chunk boundaries are also filled.
+    """
+    last = None
+
+    for chunk in chunks:
+        if len(chunk.array) == 0:
+            continue
+
+        padded = TimeSeries(chunk.name)
+        if last is None:
+            padded.array = chunk.array
+        else:
+            padded.array = np.concatenate((last, chunk.array))
+        with span('pad', len(chunk.array), device=chunk.name):
+            padded.pad(max_pad, fill)
+
+        if last is not None:
+            padded.array = padded.array[1:]
+
+        last = chunk.array[-1:].copy()
+        yield padded
+
+
+def indicator_chunks(chunks, threshold=np.float32(0.0)):
+    """
+    Yield the boolean on-off indicators of each chunk in a stream, given a
+    power threshold.
+    """
+    for chunk in chunks:
+        yield chunk.indicators(threshold)
+
+
+def activation_chunks(chunks, threshold=np.float32(0.0)):
+    """
+    Yield the device activations of a stream of chunks as pairs of arrays of
+    [start, end) indices into the whole series. An activation still running at
+    the end of a chunk is held back until the chunk in which it ends.
+    """
+    offset = 0
+    open_start = None
+
+    for chunk in chunks:
+        length = len(chunk.array)
+        if length == 0:
+            continue
+
+        (starts, ends) = chunk.activation_index(threshold)
+        starts = starts + offset
+        ends = ends + offset
+
+        if open_start is not None:
+            if len(starts) > 0 and starts[0] == offset:
+                starts[0] = open_start
+            else:
+                starts = np.concatenate(([open_start], starts))
+                ends = np.concatenate(([offset], ends))
+            open_start = None
+
+        offset += length
+
+        if len(ends) > 0 and ends[-1] == offset:
+            open_start = starts[-1]
+            starts = starts[:-1]
+            ends = ends[:-1]
+
+        yield (starts, ends)
+
+    if open_start is not None:
+        yield (np.array([open_start]), np.array([offset]))
+
+
+def combine_chunks(chunks1, chunks2, operation):
+    """
+    Combine two streams of chunks with the given TimeSeries operation, such as
+    TimeSeries.__add__, based on the intersection of their timestamps. Samples
+    past the end of the other stream's current chunk are carried over to the
+    next step.
+    """
+    chunks1 = iter(chunks1)
+    chunks2 = iter(chunks2)
+    buffer1 = None
+    buffer2 = None
+
+    while True:
+        try:
+            while buffer1 is None or len(buffer1.array) == 0:
+                buffer1 = next(chunks1)
+            while buffer2 is None or len(buffer2.array) == 0:
+                buffer2 = next(chunks2)
+        except StopIteration:
+            return
+
+        limit = min(buffer1.times[-1], buffer2.times[-1])
+
+        (head1, buffer1) = split_chunk(buffer1, limit)
+        (head2, buffer2) = split_chunk(buffer2, limit)
+
+        yield operation(head1, head2)
+
+
+def add_chunks(chunks1, chunks2):
+    """Add two streams of chunks, as TimeSeries.__add__ does."""
+    return combine_chunks(chunks1, chunks2, TimeSeries.__add__)
+
+
+def subtract_chunks(chunks1, chunks2):
+    """Subtract two streams of chunks, as TimeSeries.__sub__ does."""
+    return combine_chunks(chunks1, chunks2, TimeSeries.__sub__)
+
+
+def split_chunk(chunk, limit):
+    """
+    Split a chunk into the samples up to and including the given time, and
+    the samples after it.
+    """
+    split = np.searchsorted(chunk.times, limit, 'right')
+
+    head = TimeSeries(chunk.name)
+    head.array = chunk.array[:split]
+    tail = TimeSeries(chunk.name)
+    tail.array = chunk.array[split:]
+
+    return (head, tail)
+
+
+def write_chunks(chunks, path):
+    """
+    Write a stream of chunks to the given path, as binary if the path has the
+    binary extension and as text otherwise. Returns the number of samples
+    written. The file is written next to the path and renamed into place once
+    complete, so a failure never leaves a partial file at the path.
+    """
+    dtype = np.dtype([('time', np.uint32), ('power', np.float32)])
+    tmp_path = '%s.%s.tmp' % (path, os.getpid())
+    raw_path = path + '.raw'
+
+    try:
+        if not is_binary(path):
+            count = 0
+            with open(tmp_path, 'w') as fd:
+                for chunk in chunks:
+                    for i in chunk.array:
+                        fd.write('%s %s\n' % (i[0], i[1]))
+                    count += len(chunk.array)
+        else:
+            # The binary header holds the length of the series, so we stream
+            # the raw records to a temporary file first and copy them in
+            # afterwards.
+            with open(raw_path, 'wb') as fd:
+                for chunk in chunks:
+                    fd.write(np.ascontiguousarray(chunk.array, dtype=dtype)
+                             .tobytes())
+
+            count = os.path.getsize(raw_path) // dtype.itemsize
+            out = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=dtype,
+                                            shape=(count,))
+            if count > 0:
+                out[:] = np.memmap(raw_path, dtype=dtype, mode='r')
+            out.flush()
+            del out
+
+        os.rename(tmp_path, path)
+    finally:
+        for leftover in (tmp_path, raw_path):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+    return count
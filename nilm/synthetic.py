@@ -0,0 +1,179 @@
+"""
+Generating synthetic households, for testing the pipeline at scale. Each device
+switches between off and one of several power levels with a given duty cycle,
+is sampled with noise, timestamp jitter and missing-data gaps, and the mains
+meter reads the sum of every device over a base load. Everything is drawn from
+a seed, one device at a time, so households can be regenerated exactly.
+"""
+
+# pylint: disable=E1101
+
+import os
+
+import numpy as np
+
+from nilm.timeseries import BINARY_EXTENSION, TimeSeries
+
+
+# First timestamp of generated series.
+START_TIME = 1303132929
+
+# Mean length in seconds of missing-data gaps.
+MEAN_GAP = 1800
+
+
+def device_parameters(rng):
+    """
+    Draw the power levels, duty cycle and mean activation length in seconds of
+    a random device.
+    """
+    levels = np.sort(rng.uniform(20.0, 2500.0, rng.randint(1, 4)))
+    return {'levels': levels, 'duty_cycle': rng.uniform(0.02, 0.5),
+            'mean_on': rng.uniform(60.0, 3600.0)}
+
+
+def device_powers(samples, rng, levels, duty_cycle, mean_on, noise=0.02):
+    """
+    The power of a device over the given number of seconds. Activations and the
+    gaps between them have geometrically distributed lengths, with means giving
+    the duty cycle, and each activation runs at one of the levels. The power
+    while on has Gaussian noise with standard deviation noise times the level.
+    """
+    mean_off = mean_on * (1.0 - duty_cycle) / duty_cycle
+    runs = int(samples / (mean_on + mean_off)) + 16
+
+    lengths = np.zeros((0, 2), dtype=np.int64)
+    while lengths.sum() < samples:
+        lengths = np.vstack([lengths, np.column_stack([
+            rng.geometric(1.0 / mean_off, runs),
+            rng.geometric(1.0 / mean_on, runs)])])
+
+    values = np.zeros(lengths.shape, dtype=np.float32)
+    values[:, 1] = np.asarray(levels)[rng.randint(len(levels),
+                                                  size=len(lengths))]
+
+    powers = np.repeat(values.ravel(), lengths.ravel())[:samples]
+
+    on = np.flatnonzero(powers)
+    powers[on] *= 1.0 + noise * rng.standard_normal(len(on))
+    np.maximum(powers, 0, out=powers)
+
+    return powers
+
+
+def sample_indices(samples, rng, period=1, jitter=0, gap_rate=0.0,
+                   mean_gap=MEAN_GAP):
+    """
+    The seconds at which a meter reads, out of the given number of seconds.
+    Readings are period seconds apart, give or take up to jitter seconds, and
+    each second starts a missing-data gap with probability gap_rate.
+    """
+    intervals = np.full(samples // max(period - jitter, 1) + 1, period,
+                        dtype=np.int64)
+    if jitter:
+        intervals += rng.randint(-jitter, jitter + 1, len(intervals))
+        np.maximum(intervals, 1, out=intervals)
+
+    indices = np.cumsum(intervals) - intervals[0]
+    indices = indices[indices < samples]
+
+    if gap_rate > 0:
+        gaps = rng.binomial(samples, gap_rate)
+        starts = rng.randint(0, samples, gaps)
+        ends = starts + rng.geometric(1.0 / mean_gap, gaps)
+
+        # The number of gaps started less the number ended at each reading.
+        depth = (np.searchsorted(np.sort(starts), indices, side='right') -
+                 np.searchsorted(np.sort(ends), indices, side='right'))
+        indices = indices[depth == 0]
+
+    return indices
+
+
+def sampled_series(name, powers, indices, start=START_TIME):
+    """The timeseries of the powers read at the given indices."""
+    ts = TimeSeries(name)
+    ts.array = np.zeros(len(indices), dtype=[('time', np.uint32),
+                                             ('power', np.float32)])
+    ts.array['time'] = start + indices
+    ts.array['power'] = powers[indices]
+
+    return ts
+
+
+def iter_devices(devices, samples, seed=0, period=1, jitter=0, gap_rate=0.0,
+                 mean_gap=MEAN_GAP, noise=0.02, start=START_TIME):
+    """
+    Generate the given number of random devices over the given number of
+    seconds, yielding each device's sampled timeseries with its power at every
+    second. Device i is drawn from its own seed, so it is the same whatever
+    the number of devices.
+    """
+    for i in xrange(devices):
+        rng = np.random.RandomState([seed, i, 0])
+        powers = device_powers(samples, rng, noise=noise,
+                               **device_parameters(rng))
+        indices = sample_indices(samples, rng, period, jitter, gap_rate,
+                                 mean_gap)
+
+        yield (sampled_series('device%02d' % i, powers, indices, start), powers)
+
+
+def mains_series(total, seed=0, base_load=50.0, period=1, jitter=0,
+                 gap_rate=0.0, mean_gap=MEAN_GAP, noise=0.02,
+                 start=START_TIME):
+    """
+    The mains timeseries reading the total device power at every second, over
+    a base load with Gaussian noise of standard deviation noise times the base
+    load.
+    """
+    rng = np.random.RandomState([seed, 0, 1])
+
+    powers = total + np.float32(base_load)
+    powers += noise * base_load * rng.standard_normal(len(total))
+    np.maximum(powers, 0, out=powers)
+
+    indices = sample_indices(len(total), rng, period, jitter, gap_rate,
+                             mean_gap)
+
+    return sampled_series('mains', powers, indices, start)
+
+
+def generate_household(devices, samples, seed=0, base_load=50.0, **options):
+    """
+    Generate a household of the given number of devices over the given number
+    of seconds, returning the mains timeseries and the list of device
+    timeseries. The options are those of iter_devices.
+    """
+    total = np.zeros(samples, dtype=np.float32)
+    series = []
+    for (ts, powers) in iter_devices(devices, samples, seed, **options):
+        total += powers
+        series.append(ts)
+
+    return (mains_series(total, seed, base_load, **options), series)
+
+
+def write_household(directory, devices, samples, seed=0, binary=False,
+                    base_load=50.0, **options):
+    """
+    Write a generated household to the directory, as a mains file and a file
+    per device, one device at a time. These are the meter files read by
+    generate_aggregate, and with no gaps or jitter at a period of one second
+    they are aligned for training as they are. Returns the list of paths
+    written, mains first.
+    """
+    ext = BINARY_EXTENSION if binary else '.dat'
+    total = np.zeros(samples, dtype=np.float32)
+    paths = []
+
+    for (ts, powers) in iter_devices(devices, samples, seed, **options):
+        total += powers
+        paths.append(os.path.join(directory, ts.name + ext))
+        ts.save(paths[-1])
+
+    mains = mains_series(total, seed, base_load, **options)
+    paths.insert(0, os.path.join(directory, mains.name + ext))
+    mains.save(paths[0])
+
+    return paths
@@ -4,23 +4,130 @@ Utility class for dealing with timeseries data.
 
 # pylint: disable=E1101
 
+import collections
+import itertools
+import logging
+import os
+import tempfile
+
 import numpy as np
 
 
+# Files with this extension hold the sorted record array in NumPy's native
+# binary format, and are memory-mapped rather than parsed.
+BINARY_EXTENSION = '.npy'
+
+# Ways of combining the powers in a bin when resampling.
+RESAMPLE_METHODS = ('mean', 'max', 'last')
+
+
+log = logging.getLogger(__name__)
+
+
 class TimeSeries(object):
     """
     Object for holding, manipulating, and loading power timeseries data.
+
+    Indicators are cached per threshold, bit-packed, for up to cache_size
+    thresholds (without bound if None). The cache is cleared whenever the
+    array or powers are replaced or modified through the series' own methods;
+    code modifying the array in place directly should call clear_cache.
     """
-    def __init__(self, name='', path=None):
+    def __init__(self, name='', path=None, cache_size=None):
         self.name = name
+        self.cache_size = cache_size
+        self._indicator_cache = collections.OrderedDict()
         if path is not None:
-            self.array = np.genfromtxt(path, dtype=[('time', np.uint32),
-                                                    ('power', np.float32)])
-            self.array = np.sort(self.array)
+            if is_binary(path):
+                # Copy-on-write, so modifying the series never touches disk.
+                self.array = np.load(path, mmap_mode='c')
+            else:
+                self.array = np.genfromtxt(path, dtype=[('time', np.uint32),
+                                                        ('power', np.float32)])
+                self.array = np.sort(self.array)
         else:
             self.array = np.rec.array((0, 2), dtype=[('time', np.uint32),
                                                      ('power', np.float32)])
 
+    @classmethod
+    def load(cls, path, name=''):
+        """
+        Load a timeseries from the given path, as binary if the path has the
+        binary extension and as text otherwise.
+        """
+        return cls(name, path=path)
+
+    @classmethod
+    def iter_chunks(cls, path, chunk_size, name=''):
+        """
+        Iterate over the timeseries stored at the given path in blocks of at
+        most chunk_size samples, without loading the whole file. Each block is
+        yielded as a sorted timeseries. Text files are parsed block by block
+        into a temporary binary file, which is memory-mapped back. If a text
+        file is not sorted by time across blocks, the whole series is sorted
+        in memory instead, as when loading it.
+        """
+        if is_binary(path):
+            array = np.load(path, mmap_mode='c')
+            for start in xrange(0, len(array), chunk_size):
+                chunk = cls(name)
+                chunk.array = array[start:start+chunk_size]
+                yield chunk
+            return
+
+        dtype = np.dtype([('time', np.uint32), ('power', np.float32)])
+        with tempfile.TemporaryFile() as raw:
+            count = 0
+            in_order = True
+            last_time = None
+            with open(path, 'r') as fd:
+                while True:
+                    lines = list(itertools.islice(fd, chunk_size))
+                    if len(lines) == 0:
+                        break
+
+                    array = np.atleast_1d(np.genfromtxt(lines, dtype=dtype))
+                    if len(array) == 0:
+                        continue
+
+                    array = np.sort(array)
+                    if last_time is not None and array['time'][0] < last_time:
+                        in_order = False
+                    last_time = array['time'][-1]
+
+                    raw.write(array.tobytes())
+                    count += len(array)
+
+            if count == 0:
+                return
+
+            raw.flush()
+            array = np.memmap(raw, dtype=dtype, mode='c', shape=(count,))
+            if not in_order:
+                log.warning('Timeseries file %s is not sorted by time, '
+                            'sorting it in memory.' % path)
+                array = np.sort(array)
+
+            for start in xrange(0, count, chunk_size):
+                chunk = cls(name)
+                chunk.array = array[start:start+chunk_size]
+                yield chunk
+
+    @property
+    def array(self):
+        """Returns the record array of times and powers in the series."""
+        return self._array
+
+    @array.setter
+    def array(self, array):
+        """Set the record array of the series, clearing cached indicators."""
+        self._array = array
+        self.clear_cache()
+
+    def clear_cache(self):
+        """Clear the cached indicators of the series."""
+        self._indicator_cache.clear()
+
     @property
     def times(self):
         """Returns the array of times in the series."""
@@ -35,21 +142,65 @@ class TimeSeries(object):
     def powers(self, power_array):
         """Set the powers in the series to a copy of the given array-."""
         self.array['power'] = power_array.copy()
+        self.clear_cache()
 
     def indicators(self, threshold=np.float32(0.0)):
         """
         Returns the boolean on-off indicators for the timeseries, given a power
         threshold.
         """
-        return np.apply_along_axis(lambda x: (x > threshold), 0, self.powers)
+        powers = self.powers
+
+        # The threshold is compared in the type of the powers, so thresholds
+        # equal in that type share an entry.
+        key = powers.dtype.type(threshold)
+        packed = self._indicator_cache.pop(key, None)
+
+        if packed is None:
+            indicators = powers > threshold
+            packed = np.packbits(indicators.ravel())
+        else:
+            indicators = (np.unpackbits(packed)[:powers.size]
+                          .reshape(powers.shape).astype(bool))
+
+        self._indicator_cache[key] = packed
+        if self.cache_size is not None:
+            while len(self._indicator_cache) > self.cache_size:
+                self._indicator_cache.popitem(last=False)
+
+        return indicators
+
+    def align(self, ts):
+        """
+        Returns a pair of index arrays selecting the samples of self and of the
+        given timeseries which share a timestamp. Both series must be sorted
+        with unique timestamps. The result can be reused for any operation
+        between the two series.
+        """
+        if self.aligned(ts):
+            indices = np.arange(len(self.times))
+            return (indices, indices)
+
+        if len(ts.times) == 0:
+            return (np.array([], dtype=np.int64), np.array([], dtype=np.int64))
+
+        positions = np.searchsorted(ts.times, self.times)
+        matched = (ts.times[np.minimum(positions, len(ts.times) - 1)] ==
+                   self.times)
+
+        return (np.flatnonzero(matched), positions[matched])
+
+    def aligned(self, ts):
+        """Returns True if the given timeseries has exactly our timestamps."""
+        return (len(self.times) == len(ts.times) and
+                np.array_equal(self.times, ts.times))
 
     def __add__(self, ts):
         """
         Add two timeseries together, based on the intersection of their
         timestamps.
         """
-        indices1 = np.in1d(self.times, ts.times, assume_unique=True)
-        indices2 = np.in1d(ts.times, self.times, assume_unique=True)
+        (indices1, indices2) = self.align(ts)
 
         ts_sum = TimeSeries()
         ts_sum.array = self.array[indices1]
@@ -61,8 +212,7 @@ class TimeSeries(object):
         """
         Subtract two timeseries, based on the intersection of their timestamps.
         """
-        indices1 = np.in1d(self.times, ts.times, assume_unique=True)
-        indices2 = np.in1d(ts.times, self.times, assume_unique=True)
+        (indices1, indices2) = self.align(ts)
 
         ts_diff = TimeSeries()
         ts_diff.array = self.array[indices1]
@@ -70,68 +220,201 @@ class TimeSeries(object):
 
         return ts_diff
 
-    def intersect(self, ts):
+    def __iadd__(self, ts):
+        """
+        Add a timeseries to self in place, based on the intersection of their
+        timestamps. No new array is allocated if the timestamps already match.
+        """
+        if self.aligned(ts):
+            self.array['power'] += ts.powers
+            self.clear_cache()
+        else:
+            (indices1, indices2) = self.align(ts)
+            self.array = self.array[indices1]
+            self.array['power'] += ts.powers[indices2]
+
+        return self
+
+    def __isub__(self, ts):
+        """
+        Subtract a timeseries from self in place, based on the intersection of
+        their timestamps. No new array is allocated if the timestamps already
+        match.
+        """
+        if self.aligned(ts):
+            self.array['power'] -= ts.powers
+            self.clear_cache()
+        else:
+            (indices1, indices2) = self.align(ts)
+            self.array = self.array[indices1]
+            self.array['power'] -= ts.powers[indices2]
+
+        return self
+
+    def intersect(self, ts, alignment=None):
         """
         Modify self to only contain the timestamps present in the given
-        timeseries.
+        timeseries. A previously computed alignment with ts may be given.
+        """
+        if alignment is None:
+            if self.aligned(ts):
+                return
+            alignment = self.align(ts)
+
+        self.array = self.array[alignment[0]]
+
+    def pad(self, max_pad, fill='hold'):
+        """
+        Pad the timeseries data so that there are no missing values. Gaps
+        longer than max_pad are left as is. Missing power values are filled
+        according to the fill strategy: 'hold' uses the previous power value in
+        the series, 'linear' interpolates between the values on either side of
+        the gap, and 'zero' fills with zeros.
         """
-        indices = np.in1d(self.times, ts.times, assume_unique=True)
+        if fill not in ('hold', 'linear', 'zero'):
+            raise ValueError('Unknown fill strategy: %s' % fill)
+
+        times = self.times.astype(np.int64)
+        powers = self.powers
+
+        # Each sample is followed by gap - 1 padded samples, unless the gap is
+        # too large to fill.
+        gaps = np.diff(times)
+        counts = np.ones(len(times), dtype=np.int64)
+        counts[:-1] += np.where(gaps <= max_pad, np.maximum(gaps - 1, 0), 0)
+
+        source = np.repeat(np.arange(len(times)), counts)
+        starts = np.cumsum(counts) - counts
+        offsets = np.arange(counts.sum()) - np.repeat(starts, counts)
 
-        self.array = self.array[indices]
+        padded_array = np.empty(len(source), dtype=[('time', np.uint32),
+                                                    ('power', np.float32)])
+        padded_array['time'] = times[source] + offsets
+
+        if fill == 'hold':
+            padded_array['power'] = powers[source]
+        elif fill == 'zero':
+            padded_array['power'] = np.where(offsets == 0, powers[source],
+                                             np.float32(0.0))
+        else:
+            following = np.minimum(source + 1, len(times) - 1)
+            spans = np.maximum(times[following] - times[source], 1)
+            slopes = (powers[following].astype(np.float64) -
+                      powers[source]) / spans
+            padded_array['power'] = powers[source] + slopes * offsets
 
-    def pad(self, max_pad):
+        self.array = padded_array.view(np.recarray)
+
+    def resample(self, bin_size, how='mean'):
         """
-        Pad the timeseries data so that there are no missing values. We fill in
-        missing power values using the previous power value in the series.
+        Returns a new timeseries with the samples grouped into bins of bin_size
+        time units, each taking the mean, max or last of the powers in the
+        bin according to how. Bins are timestamped by their start, and bins
+        holding no samples are left out, so that gaps stay gaps.
         """
-        width = self.times[-1] - self.times[0] + 1
-        padded_array = np.rec.array((0, 2), dtype=[('time', np.uint32),
-                                                   ('power', np.float32)])
-        padded_array.resize(width)
+        if how not in RESAMPLE_METHODS:
+            raise ValueError('Unknown resampling method: %s' % how)
 
-        cnt = 0
-        for i in xrange(len(self.times)-1):
-            padded_array[cnt] = (np.uint32(self.times[i]), self.powers[i])
-            cnt += 1
+        resampled = TimeSeries(self.name)
+        if len(self.array) == 0:
+            resampled.array = np.zeros(0, dtype=self.array.dtype)
+            return resampled
 
-            if self.times[i+1] - self.times[i] > max_pad:
-                continue
+        bins = self.times // np.uint32(bin_size)
+        starts = np.flatnonzero(np.concatenate(([True],
+                                                bins[1:] != bins[:-1])))
 
-            for t in xrange(self.times[i]+1, self.times[i+1]):
-                padded_array[cnt] = (np.uint32(t), self.powers[i])
-                cnt += 1
+        resampled.array = np.empty(len(starts), dtype=[('time', np.uint32),
+                                                       ('power', np.float32)])
+        resampled.array['time'] = bins[starts] * np.uint32(bin_size)
 
-        padded_array[cnt] = (np.uint32(self.times[-1]), self.powers[-1])
-        padded_array.resize(cnt + 1)
+        if how == 'mean':
+            counts = np.diff(np.append(starts, len(bins)))
+            resampled.array['power'] = np.add.reduceat(
+                self.powers.astype(np.float64), starts) / counts
+        elif how == 'max':
+            resampled.array['power'] = np.maximum.reduceat(self.powers, starts)
+        else:
+            resampled.array['power'] = self.powers[np.append(starts[1:],
+                                                             len(bins)) - 1]
 
-        self.array = padded_array
+        return resampled
 
-    def activations(self, threshold=np.float32(0.0)):
+    def activation_index(self, threshold=np.float32(0.0), min_duration=0,
+                         min_gap=0):
         """
-        Returns the device activations as a list of [start, end) index tuples.
-        We assume that a device turning on and off is an entire activation.
+        Returns the device activations as a pair of arrays of [start, end)
+        indices, found from the rising and falling edges of the indicators.
+        Activations separated by fewer than min_gap off samples are merged, and
+        activations lasting fewer than min_duration samples are then dropped.
+        """
+        ind = self.indicators(threshold).astype(np.int8)
+        edges = np.diff(np.concatenate(([0], ind, [0])))
+
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
+
+        if min_gap > 0 and len(starts) > 1:
+            separate = (starts[1:] - ends[:-1]) >= min_gap
+            starts = starts[np.concatenate(([True], separate))]
+            ends = ends[np.concatenate((separate, [True]))]
+
+        if min_duration > 0:
+            long_enough = (ends - starts) >= min_duration
+            starts = starts[long_enough]
+            ends = ends[long_enough]
+
+        return (starts, ends)
+
+    def activation_durations(self, index, in_time=False):
+        """
+        Returns the durations of the activations in the given index, in
+        samples, or in time units spanned if in_time is set.
+        """
+        (starts, ends) = index
+
+        if in_time:
+            return self.times[ends - 1] - self.times[starts] + 1
+
+        return ends - starts
+
+    def activations_overlapping(self, index, start_time, end_time):
+        """
+        Returns the positions in the given index of the activations which
+        overlap the time range [start_time, end_time).
         """
-        activations = []
+        (starts, ends) = index
+
+        first = np.searchsorted(self.times[ends - 1], start_time, 'left')
+        last = np.searchsorted(self.times[starts], end_time, 'left')
 
-        ind = self.indicators(threshold)
-        in_interval = ind[0]
+        return np.arange(first, max(first, last))
+
+    def activation_at(self, index, time):
+        """
+        Returns the position in the given index of the activation containing
+        the given time, or -1 if the device is off at that time. Time may also
+        be an array of times.
+        """
+        (starts, ends) = index
+        time = np.asarray(time)
 
-        if in_interval:
-            start = 0
+        if len(starts) == 0:
+            return np.full(time.shape, -1, dtype=np.int64)
 
-        for i in xrange(len(ind)):
-            if not ind[i] and in_interval:
-                in_interval = False
-                activations.append((start, i))
+        pos = np.searchsorted(self.times[starts], time, 'right') - 1
+        inside = (pos >= 0) & (time <= self.times[ends - 1][pos])
 
-            if ind[i] and not in_interval:
-                in_interval = True
-                start = i
+        return np.where(inside, pos, -1)
 
-        if in_interval:
-            activations.append((start, len(ind)))
+    def activations(self, threshold=np.float32(0.0)):
+        """
+        Returns the device activations as a list of [start, end) index tuples.
+        We assume that a device turning on and off is an entire activation.
+        """
+        (starts, ends) = self.activation_index(threshold)
 
-        return activations
+        return zip(starts.tolist(), ends.tolist())
 
     def write(self, path):
         """
@@ -140,3 +423,34 @@ class TimeSeries(object):
         with open(path, 'w') as fd:
             for i in self.array:
                 fd.write('%s %s\n' % (i[0], i[1]))
+
+    def write_binary(self, path):
+        """
+        Write the timeseries data to the given path in the binary format. The
+        array is already sorted, so it can be memory-mapped back as is.
+        """
+        np.save(path, np.ascontiguousarray(self.array))
+
+    def save(self, path):
+        """
+        Save the timeseries to the given path, as binary if the path has the
+        binary extension and as text otherwise.
+        """
+        if is_binary(path):
+            self.write_binary(path)
+        else:
+            self.write(path)
+
+
+def is_binary(path):
+    """Returns True if the given path names a binary timeseries file."""
+    return os.path.splitext(path)[1] == BINARY_EXTENSION
+
+
+def series_files(directory):
+    """
+    Returns the absolute paths of the timeseries files in a directory, leaving
+    out hidden entries such as cached resolution pyramids.
+    """
+    return [os.path.abspath(os.path.join(directory, p)) for p in
+            os.listdir(directory) if not p.startswith('.')]
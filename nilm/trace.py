@@ -0,0 +1,180 @@
+"""
+Spans timing the stages of a run. Each span records its wall and CPU time, the
+peak resident memory of the process when it ends, and a count of the items it
+processed, and is written as a line of JSON to the trace file. Tracing is off
+until enabled, in which case span returns a shared span which does nothing.
+Only the standard library is used, so the command line can import this
+without loading NumPy.
+"""
+
+import collections
+import functools
+import json
+import os
+import resource
+import time
+
+
+# The trace file spans are written to, or None when tracing is off.
+_STATE = {'path': None}
+
+# The names of the spans currently open in this process.
+_STACK = []
+
+
+class Span(object):
+    """
+    A timed stage, used as a context manager. The item count can be set, or
+    added to, while the span is open. Fields are written along with the
+    measurements.
+    """
+    def __init__(self, name, items=0, **fields):
+        self.name = name
+        self.items = items
+        self.fields = fields
+        self._start = None
+
+    def add(self, items):
+        """Count more items processed by the span."""
+        self.items += items
+
+    def __enter__(self):
+        self._start = (time.time(), cpu_time())
+        _STACK.append(self.name)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _STACK.pop()
+        record = dict(self.fields)
+        record.update({
+            'name': self.name,
+            'parent': _STACK[-1] if _STACK else None,
+            'pid': os.getpid(),
+            'start': self._start[0],
+            'wall': time.time() - self._start[0],
+            'cpu': cpu_time() - self._start[1],
+            'peak_rss_mb': peak_rss(),
+            'items': self.items,
+        })
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+
+        write_record(record)
+        return False
+
+
+class NullSpan(object):
+    """A span which records nothing, used while tracing is off."""
+    items = 0
+
+    def add(self, items):
+        """Ignore the items."""
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+def cpu_time():
+    """The user and system CPU time of this process in seconds."""
+    times = os.times()
+    return times[0] + times[1]
+
+
+def peak_rss():
+    """The peak resident memory of this process so far in megabytes."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def enable(path, append=False):
+    """
+    Start writing spans to the trace file at the given path, emptying it
+    first unless appending. Processes forked afterwards trace to it too.
+    """
+    if not append:
+        open(path, 'w').close()
+    _STATE['path'] = path
+
+
+def disable():
+    """Stop tracing."""
+    _STATE['path'] = None
+
+
+def enabled():
+    """Returns True if spans are being traced."""
+    return _STATE['path'] is not None
+
+
+def span(name, items=0, **fields):
+    """
+    A span with the given name, initial item count and extra fields, or the
+    null span if tracing is off.
+    """
+    if _STATE['path'] is None:
+        return NULL_SPAN
+    return Span(name, items, **fields)
+
+
+def traced(name):
+    """Decorator running every call of a function in a span."""
+    def decorator(function):
+        """Wrap the function in the span."""
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            """Call the function in the span."""
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def write_record(record):
+    """
+    Append a record to the trace file. Each record is a single short write to
+    a file opened for appending, so records from several processes do not
+    interleave.
+    """
+    with open(_STATE['path'], 'a') as fd:
+        fd.write(json.dumps(record, sort_keys=True) + '\n')
+
+
+def read_trace(path):
+    """Read the list of records from a trace file."""
+    with open(path, 'r') as fd:
+        return [json.loads(line) for line in fd if line.strip()]
+
+
+def summarize(records):
+    """
+    Total the records of each span name, in the order the names first end.
+    Returns a list of rows of name, count, wall and CPU time, the highest peak
+    memory, and the item count. Times of nested spans are also included in
+    those of the spans containing them.
+    """
+    totals = collections.OrderedDict()
+    for r in records:
+        row = totals.setdefault(r['name'], [r['name'], 0, 0.0, 0.0, 0.0, 0])
+        row[1] += 1
+        row[2] += r['wall']
+        row[3] += r['cpu']
+        row[4] = max(row[4], r['peak_rss_mb'])
+        row[5] += r['items']
+
+    return [tuple(row) for row in totals.values()]
+
+
+def format_summary(rows):
+    """Format summary rows as a table."""
+    lines = ['%-24s %8s %12s %12s %10s %12s' % ('span', 'count', 'wall',
+                                                'cpu', 'peak_mb', 'items')]
+    for row in rows:
+        lines.append('%-24s %8d %12.3f %12.3f %10.1f %12d' % row)
+
+    return '\n'.join(lines)
@@ -0,0 +1,378 @@
+"""
+Preparing device data and training a network for each device. Heavy backends
+are only imported by the steps which need them.
+"""
+
+# pylint: disable=E1101
+
+import logging
+import multiprocessing
+import os
+
+import numpy as np
+
+from nilm.pyramid import load_level
+from nilm.timeseries import TimeSeries, series_files
+from nilm.trace import span
+from nilm.windows import (aggregate_scale, training_windows, valid_windows,
+                          window_batches)
+
+
+log = logging.getLogger(__name__)
+
+
+def data_files(agg_path, directory):
+    """
+    Returns the absolute path of the aggregate file and the list of paths of
+    every other file in the directory, which are the devices.
+    """
+    device_files = series_files(directory)
+    agg_path = os.path.abspath(agg_path)
+    if agg_path in device_files:
+        device_files.remove(agg_path)
+
+    return (agg_path, device_files)
+
+
+def load_data(agg_path, directory, holdout=False, resolution=1):
+    """
+    Load the aggregate file, and every other file in the directory as a device
+    intersected with it. With holdout, only the first four fifths of the
+    aggregate are kept, holding out the rest from training. Series are loaded
+    resampled to bins of resolution seconds, through their cached pyramids.
+    """
+    (agg_path, device_files) = data_files(agg_path, directory)
+
+    with span('load', device='aggregate') as load_span:
+        agg_data = load_level(agg_path, resolution)
+        load_span.add(len(agg_data.array))
+    if holdout:
+        agg_data.array = agg_data.array[0:len(agg_data.array)/5*4]
+
+    devices = []
+    for dev_path in device_files:
+        name = os.path.basename(dev_path).split('.')[0]
+        with span('load', device=name) as load_span:
+            dev = load_level(dev_path, resolution, name=name)
+            load_span.add(len(dev.array))
+        with span('intersect', device=name) as intersect_span:
+            dev.intersect(agg_data)
+            intersect_span.add(len(dev.array))
+        devices.append(dev)
+
+    return (agg_data, devices)
+
+
+def apply_preprocess(aggregated, devices, method, threshold=np.float32(0.0)):
+    """
+    Apply the given preprocessing method to the devices.
+    """
+    if method == 'raw':
+        return
+
+    indicators = [d.indicators(threshold) for d in devices]
+
+    if method == 'constant':
+        from nilm.preprocess import solve_constant_energy
+
+        (energies, _) = solve_constant_energy(aggregated, indicators)
+
+        for (e, d) in zip(energies, devices):
+            log.info('Setting constant energy %s for device %s.' % (e, d.name))
+            d.powers = e * d.indicators(np.float32(10))
+
+    elif method == 'interval':
+        from nilm.preprocess import confidence_estimator, sort_data
+
+        energy_dict = confidence_estimator(aggregated, devices, sort_data,
+                                           threshold)
+
+        for d in devices:
+            log.info('Setting constant energy %s for device %s.' %
+                     (energy_dict[d.name], d.name))
+            d.powers = energy_dict[d.name] * d.indicators(np.float32(10))
+
+    elif method == 'edge':
+        from nilm.preprocess import confidence_estimator, get_changed_data
+
+        energy_dict = confidence_estimator(aggregated, devices,
+                                           get_changed_data, threshold)
+
+        for d in devices:
+            log.info('Setting constant energy %s for device %s.' %
+                     (energy_dict[d.name], d.name))
+            d.powers = energy_dict[d.name] * d.indicators(np.float32(10))
+
+    elif method == 'markov':
+        from nilm.markov import fit_devices
+
+        powers = fit_devices(aggregated, np.column_stack(indicators), 3)
+
+        for (i, d) in enumerate(devices):
+            log.info('Setting markov power levels for device %s.' % d.name)
+            d.powers = powers[:, i]
+
+    elif method == 'viterbi':
+        from nilm.markov import decode_devices, fit_levels
+
+        levels = fit_levels(aggregated, np.column_stack(indicators), 3)
+        powers = decode_devices(aggregated, levels, min_step=threshold)
+
+        for (i, d) in enumerate(devices):
+            log.info('Setting decoded power levels %s for device %s.' %
+                     (levels[i], d.name))
+            d.powers = powers[:, i]
+
+
+def open_cache(args):
+    """The array cache of a training run, or None if caching is off."""
+    if args.no_cache:
+        return None
+
+    from nilm.cache import ArrayCache
+
+    return ArrayCache(args.cache_dir, args.cache_size << 20)
+
+
+def prepare_data(args, threshold=np.float32(0.0), cache=None):
+    """
+    Load the training data of a run, holding out the last fifth, and apply
+    its preprocessing. With a cache, the result of an earlier run on files
+    with the same content, method, threshold and resolution is memory-mapped
+    back instead, and otherwise stored for later runs.
+    """
+    if cache is not None:
+        (agg_path, device_files) = data_files(args.aggregated, args.dir)
+        key = cache.key('prepare', cache.file_digest(agg_path),
+                        sorted((os.path.basename(p), cache.file_digest(p))
+                               for p in device_files),
+                        args.preprocess, float(threshold), args.resolution)
+
+        cached = cache.get(key)
+        if cached is not None:
+            (arrays, names) = cached
+            agg_data = TimeSeries()
+            agg_data.array = arrays['aggregate']
+
+            devices = []
+            for (i, name) in enumerate(names):
+                devices.append(TimeSeries(name))
+                devices[-1].array = arrays['device%d' % i]
+
+            log.info('Reusing cached preprocessed data %s.' % key)
+            return (agg_data, devices)
+
+    (agg_data, devices) = load_data(args.aggregated, args.dir, holdout=True,
+                                    resolution=args.resolution)
+    with span('preprocess.' + args.preprocess, len(agg_data.array)):
+        apply_preprocess(agg_data.powers, devices, args.preprocess, threshold)
+
+    if cache is not None:
+        arrays = dict(('device%d' % i, d.array) for (i, d) in
+                      enumerate(devices))
+        arrays['aggregate'] = agg_data.array
+        cache.put(key, arrays, [d.name for d in devices])
+
+    return (agg_data, devices)
+
+
+def cached_windows(cache, agg_data, dev, window_size, stride, std_dev,
+                   max_power, rows):
+    """
+    Build the training windows of a device as training_windows does, or with
+    a cache, memory-map back those built from the same aggregate and device
+    content with the same window size and stride. Returns the aggregate and
+    device windows, and the scale the aggregate windows were normalized by,
+    which for cached windows is the one estimated by the run which built them.
+    """
+    if cache is None:
+        return training_windows(agg_data, dev, window_size, stride, std_dev,
+                                max_power, rows) + (std_dev,)
+
+    from nilm.cache import array_digest
+
+    key = cache.key('windows', array_digest(agg_data.array),
+                    array_digest(dev.array), window_size, stride)
+    cached = cache.get(key)
+    if cached is not None and cached[1] is not None:
+        return (cached[0]['agg_windows'], cached[0]['dev_windows'],
+                np.float32(cached[1]))
+
+    windows = training_windows(agg_data, dev, window_size, stride, std_dev,
+                               max_power, rows)
+    cache.put(key, {'agg_windows': windows[0], 'dev_windows': windows[1]},
+              float(std_dev))
+
+    return windows + (std_dev,)
+
+
+def learn_levels(aggregated, devices, method, threshold=np.float32(0.0)):
+    """
+    Learn the power levels of the devices with the given preprocessing
+    method, for online disaggregation. Returns a list of the levels of each
+    device: the three means fitted to its step changes for 'markov' and
+    'viterbi', and its single estimated power otherwise.
+    """
+    indicators = [d.indicators(threshold) for d in devices]
+
+    if method in ('markov', 'viterbi'):
+        from nilm.markov import fit_levels
+
+        return fit_levels(aggregated, np.column_stack(indicators), 3)
+
+    elif method == 'constant':
+        from nilm.preprocess import solve_constant_energy
+
+        (energies, _) = solve_constant_energy(aggregated, indicators)
+        return [[e] for e in energies]
+
+    elif method in ('interval', 'edge'):
+        from nilm.preprocess import (confidence_estimator, get_changed_data,
+                                     sort_data)
+
+        data_sorter = sort_data if method == 'interval' else get_changed_data
+        energy_dict = confidence_estimator(aggregated, devices, data_sorter,
+                                           threshold)
+        return [[energy_dict[d.name]] for d in devices]
+
+    raise ValueError('Cannot learn power levels with method: %s' % method)
+
+
+def train_devices(agg_data, devices, args):
+    """
+    Train a network for each device, in a pool of args.jobs processes if more
+    than one. Returns 1 if training failed for any device and 0 otherwise.
+    """
+    init_worker(agg_data, args)
+    if args.jobs > 1:
+        pool = multiprocessing.Pool(args.jobs, init_worker, (agg_data, args))
+        results = pool.map(train_worker, devices, chunksize=1)
+        pool.close()
+        pool.join()
+    else:
+        results = [train_worker(dev) for dev in devices]
+
+    failed = [name for (name, status) in results if status is None]
+    for name in failed:
+        log.error('Training failed for device %s.' % name)
+
+    return 1 if failed else 0
+
+
+class DeviceLog(logging.LoggerAdapter):
+    """
+    Logger which tags every message with the name of the device being
+    trained.
+    """
+    def process(self, msg, kwargs):
+        return ('[%s] %s' % (self.extra['device'], msg), kwargs)
+
+
+# The aggregate series and arguments shared by the training workers, set once
+# per worker process rather than sent along with every device.
+_WORKER_STATE = {}
+
+
+def init_worker(agg_data, args):
+    """Set the data shared by every device trained in this process."""
+    _WORKER_STATE['agg_data'] = agg_data
+    _WORKER_STATE['args'] = args
+
+
+def train_worker(dev):
+    """
+    Train the network for a device, catching any failure so that the other
+    devices still get trained. Returns the device name, and whether a network
+    was trained or None on failure.
+    """
+    try:
+        return (dev.name, train_device(dev, _WORKER_STATE['agg_data'],
+                                       _WORKER_STATE['args']))
+    except Exception: # pylint: disable=broad-except
+        DeviceLog(log, {'device': dev.name}).exception('Training failed.')
+        return (dev.name, None)
+
+
+def train_device(dev, agg_data, args):
+    """
+    Build the training windows for a device, then train its network and save
+    it to the output directory. Returns False if the device has no activations
+    to train on.
+    """
+    from nilm.network import DenoisingAutoencoder
+
+    out = args.out
+    dev_log = DeviceLog(log, {'device': dev.name})
+
+    dev_log.info('Training: %s' % dev.name)
+    activations = dev.activation_index(np.float32(25.0))
+    durations = dev.activation_durations(activations)
+
+    dev_log.info('Activations:')
+    for (start, end) in zip(*activations):
+        dev_log.info('From %s to %s lasting %s' % (dev.times[start],
+                                                   dev.times[end-1],
+                                                   end - start))
+    if len(durations) == 0:
+        dev_log.info('No activations found.')
+        return False
+
+    window_size = int(durations.sum() / len(durations))
+    length = min(len(dev.array), len(agg_data.array))
+
+    dev_log.info('Window size: %s' % window_size)
+    dev_log.info('Series length: %s' % length)
+
+    window_size = min(1500, window_size)
+    window_size = max(8, window_size)
+    stride = args.stride or window_size
+
+    dev_log.info('Computing windows...')
+    with span('valid_windows', device=dev.name) as rows_span:
+        std_dev = aggregate_scale(agg_data)
+        max_power = dev.powers.max()
+        rows = valid_windows(agg_data.times[:length], window_size, stride,
+                             args.resolution)
+        rows_span.add(len(rows))
+
+    dev_log.info('Std Dev: %s' % std_dev)
+    dev_log.info('Max Power: %s' % max_power)
+    dev_log.info('Throwing out %s windows spanning gaps, keeping %s' %
+                 (max(0, (length - window_size) // stride + 1) - len(rows),
+                  len(rows)))
+    if len(rows) == 0:
+        dev_log.info('No windows without gaps found.')
+        return False
+
+    dev_log.info('Training network...')
+    network = DenoisingAutoencoder(window_size)
+    if args.generator:
+        # Windows are built batch by batch, so this counts as training time.
+        with span('train', len(rows), device=dev.name):
+            network.train_generator(window_batches(agg_data, dev, window_size,
+                                                   stride, std_dev, max_power,
+                                                   args.batch_size, rows),
+                                    len(rows))
+    else:
+        with span('windows', len(rows), device=dev.name):
+            (agg_windows, dev_windows, std_dev) = cached_windows(
+                open_cache(args), agg_data, dev, window_size, stride, std_dev,
+                max_power, rows)
+        with span('train', len(rows), device=dev.name):
+            network.train(agg_windows, dev_windows, args.batch_size)
+
+    with span('save', device=dev.name):
+        dev_log.info('Saving model to: %s' % os.path.join(out,
+                                                          dev.name + '.yml'))
+        network.save_model(os.path.join(out, dev.name + '.yml'))
+
+        dev_log.info('Saving weight to: %s' % os.path.join(out,
+                                                           dev.name + '.h5'))
+        network.save_weights(os.path.join(out, dev.name + '.h5'))
+
+        dev_log.info('Saving normalization to: %s' %
+                     os.path.join(out, dev.name + '.json'))
+        network.save_normalization(os.path.join(out, dev.name + '.json'),
+                                   std_dev, max_power)
+
+    return True
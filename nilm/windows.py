@@ -0,0 +1,103 @@
+"""
+Building normalized training windows from aggregate and device TimeSeries.
+Windows are strided views into the series, so overlapping windows cost no
+memory until a batch of them is normalized for the network.
+"""
+
+# pylint: disable=E1101
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+
+# The network trims this many samples from each end of its input window.
+WINDOW_MARGIN = 3
+
+
+def sliding_windows(array, window_size, stride=1):
+    """
+    Returns a read-only view of a one dimensional array as windows of the given
+    size, starting every stride samples. No data is copied.
+    """
+    count = max(0, (len(array) - window_size) // stride + 1)
+    step = array.strides[0]
+
+    return as_strided(array, shape=(count, window_size),
+                      strides=(step * stride, step), writeable=False)
+
+
+def valid_windows(times, window_size, stride=1, period=1):
+    """
+    Returns the indices of the windows which do not span a gap in the given
+    timestamps sampled every period time units, ie. which cover no more than
+    window_size periods.
+    """
+    windows = sliding_windows(times, window_size, stride)
+    spans = windows[:, -1].astype(np.int64) - windows[:, 0]
+
+    return np.flatnonzero(spans <= window_size * period)
+
+
+def aggregate_scale(agg_data, samples=10000):
+    """
+    Estimate the scale to normalize aggregate windows by, as the standard
+    deviation of a random sample of the aggregate powers.
+    """
+    return np.std(np.random.choice(agg_data.powers, samples))
+
+
+def normalize_windows(agg_windows, std_dev):
+    """
+    Centre each aggregate window on its mean and scale it by std_dev, in
+    place. Returns the windows.
+    """
+    agg_windows -= agg_windows.mean(axis=1)[:, np.newaxis]
+    agg_windows /= std_dev
+
+    return agg_windows
+
+
+def training_windows(agg_data, dev, window_size, stride, std_dev, max_power,
+                     rows=None):
+    """
+    Returns the aggregate and device windows to train a network on, shaped as
+    the network expects. Aggregate windows are centred on their mean and
+    scaled by std_dev, and device windows are trimmed by WINDOW_MARGIN at each
+    end and scaled by max_power. Only the given window indices are built, and
+    by default every window without a gap.
+    """
+    length = min(len(agg_data.array), len(dev.array))
+
+    if rows is None:
+        rows = valid_windows(agg_data.times[:length], window_size, stride)
+
+    agg_windows = normalize_windows(
+        sliding_windows(agg_data.powers[:length], window_size, stride)[rows],
+        std_dev)
+
+    dev_windows = sliding_windows(
+        dev.powers[WINDOW_MARGIN:length-WINDOW_MARGIN],
+        window_size - 2 * WINDOW_MARGIN, stride)[rows]
+    dev_windows /= max_power
+
+    return (agg_windows[:, :, np.newaxis], dev_windows[:, :, np.newaxis])
+
+
+def window_batches(agg_data, dev, window_size, stride, std_dev, max_power,
+                   batch_size, rows=None):
+    """
+    Endlessly yield batches of training windows, as training_windows builds
+    them, so that only one batch is held in memory at a time. Raises
+    ValueError if there are no windows to yield.
+    """
+    if rows is None:
+        length = min(len(agg_data.array), len(dev.array))
+        rows = valid_windows(agg_data.times[:length], window_size, stride)
+
+    if len(rows) == 0:
+        raise ValueError('No training windows without gaps.')
+
+    while True:
+        for start in xrange(0, len(rows), batch_size):
+            yield training_windows(agg_data, dev, window_size, stride, std_dev,
+                                   max_power, rows[start:start+batch_size])
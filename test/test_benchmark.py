@@ -0,0 +1,112 @@
+"""
+Test the benchmark suite.
+"""
+
+# pylint: disable=E1101
+
+import json
+import os
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+from nilm.benchmark import (CASES, compare_results, fit_exponents,
+                            load_baseline, run_case, save_baseline)
+
+
+def result(case, samples, devices, seconds):
+    """A result record with no memory measurement."""
+    return {'case': case, 'samples': samples, 'devices': devices,
+            'seconds': seconds, 'peak_rss_mb': 0.0}
+
+
+class BenchmarkTestCase(unittest.TestCase):
+    """
+    Test fitting scaling exponents and comparing against baselines.
+    """
+    def test_run_case(self):
+        """Every case runs at a small size and reports time and memory."""
+        for case in CASES:
+            r = run_case(case, 1000, 2, repeat=1)
+            self.assertEqual(r['case'], case)
+            self.assertTrue(r['seconds'] >= 0)
+            self.assertTrue(r['peak_rss_mb'] > 0)
+
+    def test_failed_case(self):
+        """Cases which raise, die or time out are reported as failed."""
+        def raising(*_):
+            """A case failing during its setup."""
+            raise ValueError('bad case')
+
+        def exiting(*_):
+            """A case whose process dies."""
+            return lambda: os._exit(3)
+
+        def sleeping(*_):
+            """A case running too long."""
+            return lambda: time.sleep(60)
+
+        for (name, setup) in [('raising', raising), ('exiting', exiting),
+                              ('sleeping', sleeping)]:
+            CASES[name] = (setup, False)
+        try:
+            raised = run_case('raising', 10, 1, repeat=1)
+            exited = run_case('exiting', 10, 1, repeat=1)
+            slept = run_case('sleeping', 10, 1, repeat=1, timeout=0.5)
+        finally:
+            for name in ['raising', 'exiting', 'sleeping']:
+                del CASES[name]
+
+        self.assertIn('ValueError: bad case', raised['error'])
+        self.assertIsNone(raised['seconds'])
+        self.assertIn('status 3', exited['error'])
+        self.assertIn('timed out', slept['error'])
+
+        results = [raised, result('a', 10, 1, 1.0), result('a', 100, 1, 10.0)]
+        self.assertEqual(fit_exponents(results)['raising'], {})
+        self.assertEqual(compare_results(results, [result('raising', 10, 1,
+                                                          0.1)]), [])
+
+    def test_fit_exponents(self):
+        """Exponents are the slopes of the log-log timings."""
+        results = []
+        for samples in [10, 100, 1000]:
+            for devices in [1, 2, 4]:
+                results.append(result('quadratic', samples, devices,
+                                      1e-6 * samples ** 2 * devices))
+        results.append(result('single', 10, 1, 1.0))
+
+        exponents = fit_exponents(results)
+
+        self.assertAlmostEqual(exponents['quadratic']['samples'], 2.0)
+        self.assertAlmostEqual(exponents['quadratic']['devices'], 1.0)
+        self.assertEqual(exponents['single'], {})
+
+    def test_compare_results(self):
+        """Only matching cases slower than the threshold are regressions."""
+        baseline = [result('a', 10, 1, 1.0), result('b', 10, 1, 1.0)]
+        results = [result('a', 10, 1, 1.4), result('b', 10, 1, 2.0),
+                   result('c', 10, 1, 9.0)]
+
+        regressions = compare_results(results, baseline, 1.5)
+
+        self.assertEqual(len(regressions), 1)
+        self.assertEqual(regressions[0][0]['case'], 'b')
+        self.assertAlmostEqual(regressions[0][2], 2.0)
+
+    def test_baseline(self):
+        """Baselines round trip through JSON with their exponents."""
+        results = [result('a', 10, 1, 1.0), result('a', 100, 1, 10.0)]
+        (fd, path) = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+
+        try:
+            save_baseline(path, results)
+            self.assertEqual(load_baseline(path), results)
+            with open(path) as f:
+                self.assertTrue(np.isclose(
+                    json.load(f)['exponents']['a']['samples'], 1.0))
+        finally:
+            os.remove(path)
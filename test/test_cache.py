@@ -0,0 +1,89 @@
+"""
+Unit tests for the on-disk array cache.
+"""
+
+# pylint: disable=E1101
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from nilm.cache import ArrayCache, array_digest, file_digest
+
+
+class TestCache(unittest.TestCase):
+    """
+    Test storing, memory-mapping back and evicting cached arrays.
+    """
+    def setUp(self):
+        """Create an empty cache in a temporary directory."""
+        self.directory = tempfile.mkdtemp()
+        self.cache = ArrayCache(os.path.join(self.directory, 'cache'),
+                                1 << 20)
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        shutil.rmtree(self.directory)
+
+    def test_put_get(self):
+        """Test arrays are memory-mapped back with their information."""
+        arrays = {'a': np.arange(10, dtype=np.float32),
+                  'b': np.zeros((3, 4, 1)), 'empty': np.zeros(0)}
+        key = self.cache.key('test', 1)
+
+        self.assertIsNone(self.cache.get(key))
+        self.cache.put(key, arrays, ['x', 'y'])
+        (cached, info) = self.cache.get(key)
+
+        self.assertEqual(info, ['x', 'y'])
+        self.assertItemsEqual(cached.keys(), arrays.keys())
+        for (name, array) in arrays.items():
+            self.assertIsInstance(cached[name], np.memmap)
+            self.assertEqual(cached[name].dtype, array.dtype)
+            self.assertTrue(np.array_equal(cached[name], array))
+
+    def test_key(self):
+        """Test keys depend on every part but not on dictionary order."""
+        self.assertEqual(self.cache.key('a', {'x': 1, 'y': 2}),
+                         self.cache.key('a', {'y': 2, 'x': 1}))
+        self.assertNotEqual(self.cache.key('a', 1), self.cache.key('a', 2))
+        self.assertNotEqual(array_digest(np.zeros(3, dtype=np.float32)),
+                            array_digest(np.zeros(3, dtype=np.float64)))
+
+    def test_file_digest(self):
+        """Test input file digests follow changes to the file."""
+        path = os.path.join(self.directory, 'input')
+        with open(path, 'w') as fd:
+            fd.write('1 2\n')
+
+        digest = self.cache.file_digest(path)
+        self.assertEqual(digest, file_digest(path))
+        self.assertEqual(self.cache.file_digest(path), digest)
+
+        with open(path, 'w') as fd:
+            fd.write('1 2\n3 4\n')
+        self.assertNotEqual(self.cache.file_digest(path), digest)
+
+        # Each file's digest is remembered in a hidden file of its own.
+        self.assertEqual(len(os.listdir(os.path.join(self.cache.directory,
+                                                     '.digests'))), 1)
+        self.assertEqual(self.cache.entries(), [])
+
+    def test_evict(self):
+        """Test the least recently used entries are evicted first."""
+        array = np.zeros(50000)
+        for key in ['a', 'b']:
+            self.cache.put(key, {'array': array})
+            os.utime(self.cache.entry_path(key), (0, 0))
+        self.cache.get('a')
+        self.cache.put('c', {'array': array})
+
+        self.assertIsNotNone(self.cache.get('a'))
+        self.assertIsNone(self.cache.get('b'))
+        self.assertIsNotNone(self.cache.get('c'))
+
+        self.cache.clear()
+        self.assertEqual(self.cache.entries(), [])
@@ -8,7 +8,7 @@ import unittest
 
 import numpy as np
 
-from nilm.evaluation import f_score
+from nilm.evaluation import evaluate, f_score
 from nilm.timeseries import TimeSeries
 
 
@@ -51,3 +51,42 @@ class TestEvaluationFunctions(unittest.TestCase):
         score = f_score(ts_test, ts_truth, threshold=np.float32(0.5))
 
         self.assertEqual(score, 0.75)
+
+    def test_evaluate(self):
+        """Test batch evaluation against the single device F1 score."""
+        rng = np.random.RandomState(0)
+        test = (rng.rand(200, 3) * 10).astype(np.float32)
+        truth = (rng.rand(200, 3) * 10).astype(np.float32)
+        thresholds = np.array([1, 5, 9], dtype=np.float32)
+
+        results = evaluate(test, truth, thresholds)
+        self.assertEqual(results['f_score'].shape, (3, 3))
+
+        for d in xrange(3):
+            ts_test = TimeSeries()
+            ts_test.array.resize(200)
+            ts_test.array['power'] = test[:, d]
+
+            ts_truth = TimeSeries()
+            ts_truth.array.resize(200)
+            ts_truth.array['power'] = truth[:, d]
+
+            for (k, threshold) in enumerate(thresholds):
+                self.assertAlmostEqual(results['f_score'][d, k],
+                                       f_score(ts_test, ts_truth, threshold),
+                                       places=5)
+
+            self.assertAlmostEqual(results['mean_squared_error'][d],
+                                   ((test[:, d] - truth[:, d]) ** 2).mean(),
+                                   places=3)
+
+    def test_evaluate_no_positives(self):
+        """Test batch evaluation when a device is never on."""
+        test = np.array([[0.0, 1.0], [0.0, 0.0]])
+        truth = np.array([[0.0, 0.0], [0.0, 0.0]])
+
+        results = evaluate(test, truth, [0.5])
+
+        self.assertEqual(results['precision'].tolist(), [[1.0], [0.0]])
+        self.assertEqual(results['recall'].tolist(), [[1.0], [1.0]])
+        self.assertEqual(results['f_score'].tolist(), [[1.0], [0.0]])
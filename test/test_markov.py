@@ -0,0 +1,139 @@
+"""
+Unit tests for the markov disaggregation functions.
+"""
+
+# pylint: disable=E1101
+
+import unittest
+
+import numpy as np
+
+from nilm.markov import (constant_runs, decode_devices, find_means, fit_devices,
+                         fit_levels, power_options, switch_masks)
+
+
+class TestFindMeans(unittest.TestCase):
+    """
+    Test fitting weighted means to step changes.
+    """
+    def test_find_means(self):
+        """Test finding three means over sorted values."""
+        (error, means) = find_means([1, 2, 3, 4, 2], [0, 1, 8, 8, 9], 3)
+
+        self.assertAlmostEqual(error, 2.0 / 3.0)
+        self.assertEqual(means, [2.0 / 3.0, 8.0, 9.0])
+
+    def test_find_means_two(self):
+        """Test finding two means over sorted values."""
+        (error, means) = find_means([3, 1, 2, 2], [1, 2, 10, 12], 2)
+
+        self.assertEqual(error, 4.75)
+        self.assertEqual(means, [1.25, 11.0])
+
+    def test_find_means_few_values(self):
+        """Test finding more means than there are distinct values."""
+        (error, means) = find_means([2, 1, 1], [5, 5, 6], 3)
+
+        self.assertEqual(error, 0)
+        self.assertItemsEqual(means, [5, 6])
+
+    def test_find_means_empty(self):
+        """Test that no means are found without values."""
+        self.assertRaises(KeyError, find_means, [], [], 3)
+
+
+class TestFitDevices(unittest.TestCase):
+    """
+    Test fitting device power levels from the aggregate and indicators.
+    """
+    def test_switch_masks(self):
+        """Test finding the times where a single device switches."""
+        indicators = np.array([[0, 0], [1, 0], [1, 1], [0, 0], [0, 1]])
+
+        (switches, lone) = switch_masks(indicators)
+
+        self.assertEqual(switches.tolist(),
+                         [[False, False], [True, False], [False, True],
+                          [True, True], [False, True]])
+        self.assertEqual(lone.tolist(), [False, True, True, False, True])
+
+    def test_fit_devices(self):
+        """Test disaggregating two devices with distinct power levels."""
+        aggregated = np.array([0, 5, 5, 0, 2, 2, 7, 2, 0, 5])
+        indicators = np.array([[0, 0], [1, 0], [1, 0], [0, 0], [0, 1],
+                               [0, 1], [1, 1], [0, 1], [0, 0], [1, 0]])
+
+        powers = fit_devices(aggregated, indicators, 1)
+
+        self.assertEqual(powers[:, 0].tolist(),
+                         [0, 5, 5, 0, 0, 0, 5, 0, 0, 5])
+        self.assertEqual(powers[:, 1].tolist(),
+                         [0, 0, 0, 0, 2, 2, 2, 2, 0, 0])
+
+    def test_fit_devices_unused(self):
+        """Test that devices which never switch alone get zero power."""
+        aggregated = np.array([0, 3, 3, 0])
+        indicators = np.array([[0, 0], [1, 1], [1, 1], [0, 0]])
+
+        powers = fit_devices(aggregated, indicators, 2)
+
+        self.assertEqual(powers.tolist(), [[0, 0]] * 4)
+
+    def test_fit_levels(self):
+        """Test fitting the power levels of each device."""
+        aggregated = np.array([0, 5, 5, 0, 2, 2, 7, 2, 0, 5])
+        indicators = np.array([[0, 0], [1, 0], [1, 0], [0, 0], [0, 1],
+                               [0, 1], [1, 1], [0, 1], [0, 0], [1, 0]])
+
+        levels = fit_levels(aggregated, indicators, 1)
+
+        self.assertEqual([l.tolist() for l in levels], [[5], [2]])
+
+        indicators = np.array([[0, 0], [1, 1], [1, 1], [0, 0]])
+        levels = fit_levels(np.array([0, 3, 3, 0]), indicators, 2)
+
+        self.assertEqual(levels[0].tolist(), [])
+
+    def test_constant_runs(self):
+        """Test splitting the aggregate at large steps."""
+        (starts, lengths, means) = constant_runs(
+            np.array([0, 1, 10, 12, 11, 2, 2], dtype=np.float64), 5)
+
+        self.assertEqual(starts.tolist(), [0, 2, 5])
+        self.assertEqual(lengths.tolist(), [2, 3, 2])
+        self.assertEqual(means.tolist(), [0.5, 11, 2])
+
+    def test_power_options(self):
+        """Test padding the device levels after the off option."""
+        options = power_options([[5.0], [2.0, 3.0], []])
+
+        self.assertEqual(options[:, 0].tolist(), [0, 0, 0])
+        self.assertEqual(options[1].tolist(), [0, 2, 3])
+        self.assertTrue(np.isnan(options[0, 2]) and np.isnan(options[2, 1]))
+
+    def test_decode_devices(self):
+        """Test decoding overlapping devices from the aggregate alone."""
+        lamp = np.repeat([0, 100, 100, 100, 0, 0], 10)
+        heater = np.repeat([0, 0, 1000, 1500, 1500, 0], 10)
+        aggregated = lamp + heater + 50.0
+
+        for beam_width in [1, 4, 64]:
+            powers = decode_devices(aggregated, [[100], [1000, 1500]],
+                                    beam_width=beam_width)
+
+            self.assertEqual(powers.shape, (60, 2))
+            self.assertEqual(powers[:, 0].tolist(), lamp.tolist())
+            self.assertEqual(powers[:, 1].tolist(), heater.tolist())
+
+    def test_decode_devices_initial(self):
+        """Test that devices may be on from the start, unless penalized."""
+        aggregated = np.repeat([1150.0, 150.0, 50.0], 5)
+
+        powers = decode_devices(aggregated, [[100], [1000]], base_load=50)
+        self.assertEqual(powers[::5].tolist(), [[100, 1000], [100, 0], [0, 0]])
+
+        powers = decode_devices(aggregated, [[100], [1000]], base_load=50,
+                                switch_penalty=1e6)
+        self.assertEqual(powers.tolist(), [[0, 0]] * 15)
+
+        self.assertEqual(decode_devices([], [[1]]).shape, (0, 1))
@@ -0,0 +1,122 @@
+"""
+Unit tests for disaggregating with a network, using a stub in place of the
+Keras model.
+"""
+
+# pylint: disable=E1101
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from nilm.network import DenoisingAutoencoder
+from nilm.timeseries import TimeSeries
+from nilm.windows import WINDOW_MARGIN
+
+
+class StubModel(object):
+    """A model predicting each window's trimmed normalized input."""
+    def __init__(self):
+        self.batches = []
+
+    def predict(self, windows, batch_size, verbose):
+        """Returns the windows without their margins."""
+        self.batches.append(len(windows))
+        return windows[:, WINDOW_MARGIN:-WINDOW_MARGIN, :].copy()
+
+
+class StubNetwork(DenoisingAutoencoder):
+    """A network built around the stub model instead of Keras."""
+    def initialize_model(self):
+        """Use the stub model."""
+        self.model = StubModel()
+
+
+class TestNetwork(unittest.TestCase):
+    """
+    Test running an aggregate through a network window by window.
+    """
+    def setUp(self):
+        """Set up an aggregate with a gap."""
+        self.agg = TimeSeries()
+        self.agg.array.resize(40)
+        self.agg.array['time'] = np.concatenate((np.arange(1, 31),
+                                                 np.arange(101, 111)))
+        self.agg.array['power'] = np.arange(40) ** 2
+
+    def expected(self, window_size, stride, std_dev, max_power, period=1):
+        """Average the stub's outputs over the windows covering each sample."""
+        powers = self.agg.powers.astype(np.float64)
+        total = np.zeros(len(powers))
+        count = np.zeros(len(powers))
+
+        starts = range(0, len(powers) - window_size + 1, stride)
+        starts.append(len(powers) - window_size)
+        for start in set(starts):
+            times = self.agg.times[start:start+window_size]
+            if times[-1] - times[0] > window_size * period:
+                continue
+
+            window = powers[start:start+window_size]
+            window = (window - window.mean()) / std_dev
+            covered = slice(start + WINDOW_MARGIN,
+                            start + window_size - WINDOW_MARGIN)
+            total[covered] += window[WINDOW_MARGIN:-WINDOW_MARGIN]
+            count[covered] += 1
+
+        return (np.where(count > 0, total / np.maximum(count, 1), 0.0) *
+                max_power)
+
+    def test_disaggregate(self):
+        """Test overlapping outputs are averaged and scaled back up."""
+        network = StubNetwork(10)
+        dev = network.disaggregate(self.agg, max_power=4.0, std_dev=2.0,
+                                   stride=3, batch_size=4)
+
+        self.assertTrue(np.array_equal(dev.times, self.agg.times))
+        self.assertEqual(dev.powers.dtype, np.float32)
+        self.assertTrue(np.allclose(dev.powers,
+                                    self.expected(10, 3, 2.0, 4.0),
+                                    rtol=1e-5, atol=1e-3))
+        self.assertTrue(max(network.model.batches) <= 4)
+
+        # Samples only covered by windows spanning the gap are zero.
+        self.assertTrue((dev.powers[28:33] == 0).all())
+
+    def test_period(self):
+        """Test gaps are found in series sampled every period seconds."""
+        self.agg.array['time'] *= 60
+        network = StubNetwork(10)
+        dev = network.disaggregate(self.agg, max_power=4.0, std_dev=2.0,
+                                   stride=3, period=60)
+
+        self.assertTrue(np.allclose(dev.powers,
+                                    self.expected(10, 3, 2.0, 4.0, 60),
+                                    rtol=1e-5, atol=1e-3))
+        self.assertTrue((dev.powers[28:33] == 0).all())
+        self.assertTrue((dev.powers[3:27] != 0).any())
+
+        # At the wrong period every window spans a gap.
+        dev = network.disaggregate(self.agg, max_power=4.0, std_dev=2.0,
+                                   stride=3)
+        self.assertTrue((dev.powers == 0).all())
+
+    def test_normalization(self):
+        """Test the saved normalization is used by default."""
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'device.json')
+            StubNetwork(10).save_normalization(path, 2.0, 4.0)
+
+            network = StubNetwork(10, normalization_path=path)
+            self.assertEqual((network.std_dev, network.max_power), (2.0, 4.0))
+
+            dev = network.disaggregate(self.agg, stride=3)
+            self.assertTrue(np.allclose(dev.powers,
+                                        self.expected(10, 3, 2.0, 4.0),
+                                        rtol=1e-5, atol=1e-3))
+        finally:
+            shutil.rmtree(directory)
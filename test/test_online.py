@@ -0,0 +1,56 @@
+"""
+Test the online disaggregator.
+"""
+
+# pylint: disable=E1101
+
+import unittest
+
+from nilm.online import OnlineDisaggregator
+
+
+class OnlineTestCase(unittest.TestCase):
+    """
+    Test tracking device states from one aggregate reading at a time.
+    """
+    def setUp(self):
+        self.disaggregator = OnlineDisaggregator([100.0, [1000.0, 1500.0]],
+                                                 ['lamp', 'heater'])
+
+    def test_steps(self):
+        """Steps switch devices on, off and between levels."""
+        readings = [50, 52, 150, 148, 1150, 1651, 1550, 1050, 49, 51]
+
+        estimates = self.disaggregator.run(readings)
+
+        self.assertEqual(estimates[:, 0].tolist(),
+                         [0, 0, 100, 100, 100, 100, 0, 0, 0, 0])
+        self.assertEqual(estimates[:, 1].tolist(),
+                         [0, 0, 0, 0, 1000, 1500, 1500, 1000, 0, 0])
+        self.assertEqual(self.disaggregator.on.tolist(), [False, False])
+
+    def test_unmatched(self):
+        """Steps matching no device change only move the baseline."""
+        self.disaggregator.update(50)
+        self.assertEqual(self.disaggregator.update(600).tolist(), [0, 0])
+        self.assertEqual(self.disaggregator.baseline, 600)
+        self.assertEqual(self.disaggregator.update(700).tolist(), [100, 0])
+
+    def test_noise(self):
+        """Readings within the threshold are smoothed into the baseline."""
+        self.disaggregator.update(50)
+        self.disaggregator.update(60)
+
+        self.assertAlmostEqual(self.disaggregator.baseline, 50.5)
+        self.assertEqual(self.disaggregator.powers.tolist(), [0, 0])
+
+    def test_low_aggregate(self):
+        """Devices are switched off when the aggregate cannot hold them."""
+        self.disaggregator.run([0, 1000, 1100])
+        self.assertEqual(self.disaggregator.powers.tolist(), [100, 1000])
+
+        self.disaggregator.update(-500)
+        self.assertEqual(self.disaggregator.powers.tolist(), [0, 0])
+
+        self.disaggregator.reset()
+        self.assertTrue(self.disaggregator.baseline is None)
@@ -4,15 +4,47 @@ Unit tests for evaluation functions.
 
 # pylint: disable=E1101
 
+import subprocess
+import sys
 import unittest
 
 import numpy as np
 
-from nilm.preprocess import (confidence_estimator, get_changed_data,
-                             solve_constant_energy, sort_data)
+from nilm.preprocess import (add_energy_statistics, confidence,
+                             confidence_estimator, energy_statistics,
+                             get_changed_data, solve_constant_energy,
+                             solve_energy_statistics, sort_data)
 from nilm.timeseries import TimeSeries
 
 
+def recomputed_estimator(aggregated, devices, data_sorter, threshold):
+    """
+    Estimate device powers as confidence_estimator does, but recomputing
+    every device's samples from the whole residual each round.
+    """
+    matrix = np.column_stack([d.indicators(threshold) for d in devices])
+    residual = np.array(aggregated)
+    remaining = range(len(devices))
+    means = {}
+
+    while remaining:
+        data = [np.asarray(d, dtype=np.float64) for d in
+                data_sorter(residual, [devices[d] for d in remaining],
+                            matrix[:, remaining])]
+        heuristic = [confidence(d) for d in data]
+        best = int(np.argmin(heuristic))
+        choice = remaining.pop(best)
+
+        mean = (np.float32(data[best].mean()) if heuristic[best] != np.inf
+                else np.float32(0.0))
+        residual[matrix[:, choice]] -= mean
+        residual = np.clip(residual, np.float32(0.0), np.inf)
+        matrix[:, choice] = False
+        means[devices[choice].name] = mean
+
+    return means
+
+
 class TestPreprocessConstantEnergy(unittest.TestCase):
     """
     Test the constant energy preprocessing function.
@@ -75,6 +107,57 @@ class TestPreprocessConstantEnergy(unittest.TestCase):
         self.assertTrue(np.allclose(energies_test, energies[0],
                                     atol=np.float32(1e-3)))
 
+    def test_constant_energy_methods(self):
+        """Test that the NNLS and SLSQP methods agree on random data."""
+        rng = np.random.RandomState(0)
+        activations = [rng.rand(500) < 0.3 for _ in xrange(4)]
+        aggregated = (np.dot(np.column_stack(activations), [5, 1, 0, 20]) +
+                      rng.rand(500))
+
+        (nnls_powers, nnls_error) = solve_constant_energy(aggregated,
+                                                          activations)
+        (slsqp_powers, slsqp_error) = solve_constant_energy(aggregated,
+                                                            activations,
+                                                            method='slsqp')
+
+        self.assertTrue(np.allclose(nnls_powers, slsqp_powers, atol=1e-2))
+        self.assertAlmostEqual(nnls_error, slsqp_error, places=3)
+
+    def test_energy_statistics_chunks(self):
+        """Test accumulating the energy statistics chunk by chunk."""
+        rng = np.random.RandomState(0)
+        activations = [rng.rand(100) < 0.5 for _ in xrange(3)]
+        aggregated = np.dot(np.column_stack(activations), [1, 2, 3])
+
+        statistics = None
+        for start in xrange(0, 100, 30):
+            statistics = add_energy_statistics(
+                statistics, aggregated[start:start+30],
+                [a[start:start+30] for a in activations])
+
+        whole = energy_statistics(aggregated, activations, chunk_size=7)
+        for (chunked, full) in zip(statistics, whole):
+            self.assertTrue(np.allclose(chunked, full))
+
+        (powers, error) = solve_energy_statistics(statistics)
+        self.assertTrue(np.allclose(powers, [1, 2, 3]))
+        self.assertAlmostEqual(error, 0.0)
+
+
+class TestPreprocessImports(unittest.TestCase):
+    """
+    Test the preprocessing module only loads SciPy when it is needed.
+    """
+    def test_lazy_scipy(self):
+        """Test importing the module and its callers does not load SciPy."""
+        loaded = subprocess.check_output([
+            sys.executable, '-c',
+            'import sys, nilm.preprocess, nilm.online, nilm.sketch, '
+            'nilm.training; print(any(m.startswith("scipy") for m in '
+            'sys.modules))'])
+
+        self.assertEqual(loaded.strip(), 'False')
+
 
 class TestPreprocessConfidenceEstimator(unittest.TestCase):
     """
@@ -119,3 +202,75 @@ class TestPreprocessConfidenceEstimator(unittest.TestCase):
                                         get_changed_data)
         estimate_test = {'a': np.float(0.0), 'b': np.float(2.5)}
         self.assertEqual(estimate, estimate_test)
+
+    def test_sort_data_samples(self):
+        """Test grouping the samples where a single device is active."""
+        indicator_matrix = np.column_stack([d.indicators() for d in
+                                            self.devices])
+        data = sort_data(self.aggregate.powers, self.devices,
+                         indicator_matrix)
+
+        self.assertEqual(list(data[0]), [5.0, 4.0])
+        self.assertEqual(list(data[1]), [])
+
+    def test_get_changed_data_samples(self):
+        """Test grouping the power changes where a single device switches."""
+        indicator_matrix = np.column_stack([d.indicators() for d in
+                                            self.devices])
+        data = get_changed_data(self.aggregate.powers, self.devices,
+                                indicator_matrix)
+
+        self.assertEqual(list(data[0]), [])
+        self.assertEqual(list(data[1]), [3.0, 2.0])
+
+    def test_incremental(self):
+        """
+        Test the incrementally updated estimates equal a full recompute each
+        round, including where the residual is clipped.
+        """
+        rng = np.random.RandomState(3)
+        devices = []
+        for d in xrange(6):
+            dev = TimeSeries(str(d))
+            dev.array.resize(2000)
+            dev.array['time'] = np.arange(2000)
+            dev.array['power'] = ((rng.rand(2000) < 0.2 + 0.05 * d) *
+                                  (100 * (d + 1) + rng.randn(2000) * 5))
+            devices.append(dev)
+
+        aggregated = np.sum([d.powers for d in devices], axis=0)
+        aggregated = (aggregated * rng.uniform(0.5, 1.2, 2000) -
+                      rng.rand(2000) * 50).astype(np.float32)
+        self.assertTrue((aggregated < 0).any())
+
+        for sorter in [sort_data, get_changed_data]:
+            estimate = confidence_estimator(aggregated, devices, sorter,
+                                            np.float32(25.0))
+            expected = recomputed_estimator(aggregated, devices, sorter,
+                                            np.float32(25.0))
+
+            self.assertItemsEqual(estimate.keys(), expected.keys())
+            for name in expected:
+                self.assertTrue(np.isclose(estimate[name], expected[name],
+                                           rtol=1e-4), (sorter, name))
+
+    def test_custom_sorter(self):
+        """
+        Test other data sorters are called each round with the residual and
+        the remaining devices.
+        """
+        calls = []
+
+        def on_data(aggregated, devices, indicator_matrix):
+            """The aggregated powers wherever each device is on."""
+            calls.append(([d.name for d in devices], aggregated.tolist()))
+            return [aggregated[indicator_matrix[:, d]] for d in
+                    xrange(len(devices))]
+
+        estimate = confidence_estimator(self.aggregate.powers, self.devices,
+                                        on_data)
+
+        self.assertEqual(estimate, {'a': np.float32(3.0),
+                                    'b': np.float32(2.0)})
+        self.assertEqual(calls, [(['a', 'b'], [5.0, 2.0, 4.0]),
+                                 (['a'], [5.0, 0.0, 4.0])])
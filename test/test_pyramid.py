@@ -0,0 +1,92 @@
+"""
+Test the cached resolution pyramids.
+"""
+
+# pylint: disable=E1101
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+from nilm import pyramid
+from nilm.pyramid import build_pyramid, level_path, load_level
+from nilm.timeseries import TimeSeries, series_files
+
+
+class PyramidTestCase(unittest.TestCase):
+    """
+    Test building, loading and refreshing pyramid levels.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'fridge.npy')
+
+        self.ts = TimeSeries('fridge')
+        self.ts.array.resize(100)
+        self.ts.array['time'] = np.arange(100)
+        self.ts.array['power'] = np.arange(100)
+        self.ts.save(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_load_level(self):
+        """Levels are resampled, cached, and hidden from file listings."""
+        ts = load_level(self.path, 10, name='fridge')
+
+        self.assertEqual(ts.name, 'fridge')
+        self.assertItemsEqual(ts.times, np.arange(0, 100, 10))
+        self.assertTrue(np.allclose(ts.powers, np.arange(4.5, 100, 10)))
+        self.assertTrue(os.path.exists(level_path(self.path, 10)))
+        self.assertEqual(series_files(self.directory), [self.path])
+
+        cached = load_level(self.path, 10)
+        self.assertTrue(np.array_equal(cached.array, ts.array))
+
+        native = load_level(self.path, 1)
+        self.assertTrue(np.array_equal(native.array, self.ts.array))
+
+    def test_stale_level(self):
+        """Levels older than their file are rebuilt."""
+        build_pyramid(self.path, [10, 50], 'max')
+        self.assertItemsEqual(load_level(self.path, 50, 'max').powers,
+                              [49, 99])
+
+        self.ts.powers = np.zeros(100, dtype=np.float32)
+        self.ts.save(self.path)
+        future = time.time() + 10
+        os.utime(self.path, (future, future))
+
+        self.assertItemsEqual(load_level(self.path, 50, 'max').powers, [0, 0])
+
+    def test_extensions(self):
+        """Files differing only in their extension have distinct levels."""
+        text_path = os.path.join(self.directory, 'fridge.dat')
+        self.ts.powers = np.ones(100, dtype=np.float32)
+        self.ts.save(text_path)
+
+        self.assertNotEqual(level_path(self.path, 10),
+                            level_path(text_path, 10))
+        self.assertTrue(np.allclose(load_level(self.path, 10).powers,
+                                    np.arange(4.5, 100, 10)))
+        self.assertTrue(np.allclose(load_level(text_path, 10).powers, 1.0))
+
+    def test_read_only(self):
+        """Levels which cannot be written are resampled in memory."""
+        def save_level(ts, level):
+            """Fail as in a read-only directory."""
+            raise IOError(13, 'Permission denied', level)
+
+        original = pyramid.save_level
+        pyramid.save_level = save_level
+        try:
+            ts = load_level(self.path, 10)
+        finally:
+            pyramid.save_level = original
+
+        self.assertTrue(np.allclose(ts.powers, np.arange(4.5, 100, 10)))
+        self.assertFalse(os.path.exists(level_path(self.path, 10)))
@@ -0,0 +1,140 @@
+"""
+Unit tests for the registry of trained networks, using a stub in place of the
+Keras networks.
+"""
+
+# pylint: disable=E1101
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from nilm import network
+from nilm.registry import ModelRegistry
+from nilm.timeseries import TimeSeries
+
+
+class StubAutoencoder(object):
+    """A network recording the files it was loaded from."""
+    loads = []
+
+    def __init__(self, window_size, model_path=None, weight_path=None):
+        self.paths = (model_path, weight_path)
+        StubAutoencoder.loads.append(self.paths)
+
+    def disaggregate(self, agg_data, stride=None, batch_size=1024, period=1):
+        """Estimate the device as the aggregate times the period."""
+        dev = TimeSeries()
+        dev.array = agg_data.array.copy()
+        dev.powers = dev.powers * period
+        return dev
+
+
+class TestRegistry(unittest.TestCase):
+    """
+    Test loading and caching the networks saved in a model directory.
+    """
+    def setUp(self):
+        """Save stub models for three devices, one without weights."""
+        self.directory = tempfile.mkdtemp()
+        for name in ['a', 'b', 'c']:
+            self.touch(name + '.yml')
+            self.touch(name + '.json')
+        for name in ['a', 'b']:
+            self.touch(name + '.h5')
+
+        StubAutoencoder.loads = []
+        self.autoencoder = network.DenoisingAutoencoder
+        network.DenoisingAutoencoder = StubAutoencoder
+
+    def tearDown(self):
+        """Restore the network and remove the models."""
+        network.DenoisingAutoencoder = self.autoencoder
+        shutil.rmtree(self.directory)
+
+    def touch(self, filename, mtime=None):
+        """Write a file in the model directory, with the given mtime."""
+        path = os.path.join(self.directory, filename)
+        with open(path, 'w') as fd:
+            fd.write(filename)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+
+    def test_index(self):
+        """Test only models are indexed, weights being optional."""
+        registry = ModelRegistry(self.directory)
+
+        self.assertEqual(registry.names(), ['a', 'b', 'c'])
+        self.assertTrue('a' in registry)
+        self.assertIsNone(registry.paths['c'][1])
+
+    def test_hit_miss(self):
+        """Test networks are loaded once and then reused."""
+        registry = ModelRegistry(self.directory)
+
+        first = registry.get('a')
+        self.assertIs(registry.get('a'), first)
+        self.assertEqual(first.paths,
+                         (os.path.join(self.directory, 'a.yml'),
+                          os.path.join(self.directory, 'a.h5')))
+        self.assertEqual(len(StubAutoencoder.loads), 1)
+
+        stats = registry.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['cached']),
+                         (1, 1, 1))
+
+        self.assertRaises(KeyError, registry.get, 'missing')
+
+    def test_reload(self):
+        """Test changed models are reloaded, and deleted ones are unknown."""
+        registry = ModelRegistry(self.directory)
+        first = registry.get('a')
+
+        self.touch('a.h5', os.path.getmtime(
+            os.path.join(self.directory, 'a.h5')) + 10)
+        second = registry.get('a')
+
+        self.assertIsNot(second, first)
+        self.assertEqual(registry.stats()['cached'], 1)
+
+        os.remove(os.path.join(self.directory, 'a.yml'))
+        self.assertRaises(KeyError, registry.get, 'a')
+        self.assertEqual(registry.names(), ['b', 'c'])
+
+        # New models are found without an explicit re-index.
+        self.touch('d.yml')
+        self.assertEqual(registry.get('d').paths[0],
+                         os.path.join(self.directory, 'd.yml'))
+
+    def test_eviction(self):
+        """Test the least recently used networks are evicted."""
+        registry = ModelRegistry(self.directory, max_models=2)
+
+        a = registry.get('a')
+        registry.get('b')
+        registry.get('a')
+        registry.get('c')
+
+        self.assertEqual(registry.stats()['cached'], 2)
+        self.assertIs(registry.get('a'), a)
+        registry.get('b')
+        self.assertEqual(registry.stats()['misses'], 4)
+
+    def test_disaggregate(self):
+        """Test every device is estimated and named."""
+        agg = TimeSeries()
+        agg.array.resize(5)
+        agg.array['time'] = np.arange(5)
+        agg.array['power'] = np.arange(5)
+
+        devices = ModelRegistry(self.directory).disaggregate(agg)
+
+        self.assertEqual([d.name for d in devices], ['a', 'b', 'c'])
+        self.assertTrue(np.array_equal(devices[0].powers, agg.powers))
+
+        devices = ModelRegistry(self.directory).disaggregate(agg, ['b'],
+                                                             period=60)
+        self.assertTrue(np.array_equal(devices[0].powers, agg.powers * 60))
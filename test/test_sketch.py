@@ -0,0 +1,102 @@
+"""
+Test the incremental power level sketches.
+"""
+
+# pylint: disable=E1101
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from nilm.markov import find_means
+from nilm.sketch import (LevelSketch, compress_bins, load_sketches,
+                         save_sketches, sketch_devices)
+
+
+class SketchTestCase(unittest.TestCase):
+    """
+    Test adding step changes to sketches, refining them and saving them.
+    """
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.changes = np.concatenate([rng.normal(100, 5, 1000),
+                                       rng.normal(800, 20, 1000),
+                                       rng.normal(1500, 30, 1000)])
+        self.lengths = rng.randint(1, 500, len(self.changes))
+        order = rng.permutation(len(self.changes))
+        self.changes = self.changes[order]
+        self.lengths = self.lengths[order]
+
+    def test_exact(self):
+        """Sketches with a bin per change fit the exact levels."""
+        sketch = LevelSketch(2, max_bins=100)
+        sketch.add([1, 2, 10, 11, 12], [1, 1, 2, 1, 1])
+
+        (error, levels) = find_means([1, 1, 2, 1, 1], [1, 2, 10, 11, 12], 2)
+
+        self.assertTrue(np.allclose(sketch.refine(), sorted(levels)))
+        self.assertAlmostEqual(sketch.error, error)
+        self.assertEqual(len(sketch.bins), 5)
+
+    def test_bounded(self):
+        """Sketches stay bounded and close to the exact levels."""
+        sketch = LevelSketch(3, max_bins=64, refine_every=1000)
+        for start in xrange(0, len(self.changes), 300):
+            sketch.add(self.changes[start:start+300],
+                       self.lengths[start:start+300])
+            self.assertTrue(len(sketch.bins) <= 64)
+
+        order = np.argsort(self.changes)
+        (_, levels) = find_means(self.lengths[order].tolist(),
+                                 self.changes[order].tolist(), 3)
+
+        self.assertEqual(sketch.events, len(self.changes))
+        self.assertTrue(np.allclose(sketch.refine(), sorted(levels),
+                                    rtol=1e-3))
+
+    def test_compress_bins(self):
+        """Compressing bins merges the closest and keeps the totals."""
+        bins = np.array([[1, 1, 1], [1, 2, 4], [1, 10, 100], [2, 22, 242]],
+                        dtype=np.float64)
+
+        compressed = compress_bins(bins, 2)
+
+        self.assertEqual(compressed.tolist(), [[2, 3, 5], [3, 32, 342]])
+        self.assertTrue(compress_bins(bins, 4) is bins)
+
+    def test_merge(self):
+        """Merged sketches match a sketch of all the changes."""
+        sketch1 = LevelSketch(3, max_bins=4000)
+        sketch1.add(self.changes[:1500], self.lengths[:1500])
+        sketch2 = LevelSketch(3, max_bins=4000)
+        sketch2.add(self.changes[1500:], self.lengths[1500:])
+        sketch = LevelSketch(3, max_bins=4000)
+        sketch.add(self.changes, self.lengths)
+
+        sketch1.merge(sketch2)
+
+        self.assertEqual(sketch1.events, sketch.events)
+        self.assertTrue(np.allclose(sketch1.refine(), sketch.refine()))
+
+    def test_save_load(self):
+        """Sketches are restored as they were saved."""
+        indicators = np.array([[0, 0], [1, 0], [1, 0], [0, 0], [0, 1],
+                               [0, 1], [1, 1], [0, 1], [0, 0], [1, 0]])
+        sketches = sketch_devices(np.array([0, 5, 5, 0, 2, 2, 7, 2, 0, 5]),
+                                  indicators, ['a', 'b'], {}, 1)
+        (fd, path) = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+
+        try:
+            save_sketches(path, sketches)
+            loaded = load_sketches(path)
+        finally:
+            os.remove(path)
+
+        self.assertItemsEqual(loaded.keys(), ['a', 'b'])
+        self.assertEqual(loaded['a'].levels.tolist(), [5])
+        self.assertEqual(loaded['b'].levels.tolist(), [2])
+        for name in ['a', 'b']:
+            self.assertEqual(loaded[name].to_dict(), sketches[name].to_dict())
@@ -0,0 +1,159 @@
+"""
+Unit tests for streaming TimeSeries operations.
+"""
+
+# pylint: disable=E1101
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from nilm.stream import (activation_chunks, add_chunks, pad_chunks,
+                         subtract_chunks, write_chunks)
+from nilm.timeseries import TimeSeries
+
+
+def make_series(times, powers):
+    """Create a TimeSeries from lists of times and powers."""
+    ts = TimeSeries()
+    ts.array.resize(len(times))
+    ts.array['time'] = times
+    ts.array['power'] = powers
+    return ts
+
+
+def split_series(ts, chunk_size):
+    """Split a TimeSeries into a list of chunks."""
+    chunks = []
+    for start in xrange(0, len(ts.array), chunk_size):
+        chunk = TimeSeries(ts.name)
+        chunk.array = ts.array[start:start+chunk_size]
+        chunks.append(chunk)
+    return chunks
+
+
+def join_chunks(chunks):
+    """Join a stream of chunks into a single TimeSeries."""
+    ts = TimeSeries()
+    ts.array = np.concatenate([c.array for c in chunks])
+    return ts
+
+
+class TestStream(unittest.TestCase):
+    """
+    Test the streaming TimeSeries operations against their whole-series
+    counterparts.
+    """
+    def setUp(self):
+        """Set up two series with gaps and different timestamps."""
+        self.ts1 = make_series([1, 2, 4, 5, 9, 10, 11, 20, 22],
+                               [0, 3, 3, 0, 0, 2, 2, 2, 0])
+        self.ts2 = make_series([2, 3, 4, 9, 10, 11, 12, 22],
+                               [1, 1, 0, 1, 1, 0, 0, 1])
+
+    def test_iter_chunks(self):
+        """Test reading a file in chunks."""
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            for ext in ('.dat', '.npy'):
+                path = os.path.join(tmp_dir, 'test' + ext)
+                self.ts1.save(path)
+
+                chunks = list(TimeSeries.iter_chunks(path, 4))
+                self.assertEqual([len(c.array) for c in chunks], [4, 4, 1])
+                self.assertItemsEqual(join_chunks(chunks).times,
+                                      self.ts1.times)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_iter_unsorted_chunks(self):
+        """Test reading a text file not sorted across chunks."""
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'test.dat')
+            with open(path, 'w') as fd:
+                for i in [6, 7, 8, 0, 5, 4, 2, 3, 1]:
+                    fd.write('%s %s\n' % (self.ts1.times[i],
+                                          self.ts1.powers[i]))
+
+            chunks = list(TimeSeries.iter_chunks(path, 4))
+            self.assertEqual([len(c.array) for c in chunks], [4, 4, 1])
+            self.assertEqual(join_chunks(chunks).array.tobytes(),
+                             self.ts1.array.tobytes())
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_pad_chunks(self):
+        """Test padding across chunk boundaries."""
+        for chunk_size in (1, 2, 4):
+            padded = join_chunks(pad_chunks(split_series(self.ts1, chunk_size),
+                                            3))
+            self.ts1.pad(3)
+
+            self.assertEqual(padded.array.tobytes(), self.ts1.array.tobytes())
+
+    def test_activation_chunks(self):
+        """Test finding activations across chunk boundaries."""
+        threshold = np.float32(0.5)
+        for chunk_size in (1, 2, 4):
+            index = list(activation_chunks(split_series(self.ts1, chunk_size),
+                                           threshold))
+            starts = np.concatenate([i[0] for i in index])
+            ends = np.concatenate([i[1] for i in index])
+
+            self.assertEqual(zip(starts, ends), self.ts1.activations(threshold))
+
+    def test_combine_chunks(self):
+        """Test adding and subtracting streams of chunks."""
+        for chunk_size in (1, 2, 4):
+            ts_sum = join_chunks(add_chunks(split_series(self.ts1, chunk_size),
+                                            split_series(self.ts2, 3)))
+            ts_diff = join_chunks(subtract_chunks(
+                split_series(self.ts1, chunk_size), split_series(self.ts2, 3)))
+
+            self.assertEqual(ts_sum.array.tobytes(),
+                             (self.ts1 + self.ts2).array.tobytes())
+            self.assertEqual(ts_diff.array.tobytes(),
+                             (self.ts1 - self.ts2).array.tobytes())
+
+    def test_write_chunks(self):
+        """Test writing a stream of chunks in both formats."""
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            for ext in ('.dat', '.npy'):
+                path = os.path.join(tmp_dir, 'test' + ext)
+                count = write_chunks(split_series(self.ts1, 2), path)
+
+                self.assertEqual(count, len(self.ts1.array))
+                self.assertItemsEqual(TimeSeries.load(path).powers,
+                                      self.ts1.powers)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_write_chunks_failure(self):
+        """Test a failed write leaves no partial file behind."""
+        def failing_chunks():
+            """Yield a chunk, then fail."""
+            yield self.ts1
+            raise IOError('read failed')
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            for ext in ('.dat', '.npy'):
+                path = os.path.join(tmp_dir, 'test' + ext)
+                self.assertRaises(IOError, write_chunks, failing_chunks(),
+                                  path)
+                self.assertEqual(os.listdir(tmp_dir), [])
+
+                # An existing file is kept as it was.
+                self.ts2.save(path)
+                self.assertRaises(IOError, write_chunks, failing_chunks(),
+                                  path)
+                self.assertItemsEqual(TimeSeries.load(path).times,
+                                      self.ts2.times)
+                os.remove(path)
+        finally:
+            shutil.rmtree(tmp_dir)
@@ -0,0 +1,77 @@
+"""
+Test the synthetic household generator.
+"""
+
+# pylint: disable=E1101
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from nilm.synthetic import (device_powers, generate_household, sample_indices,
+                            write_household)
+from nilm.timeseries import TimeSeries
+
+
+class SyntheticTestCase(unittest.TestCase):
+    """
+    Test generating devices, their sampling, and whole households.
+    """
+    def test_device_powers(self):
+        """Devices run at their levels for about their duty cycle."""
+        rng = np.random.RandomState(0)
+        powers = device_powers(100000, rng, [100.0, 1000.0], 0.25, 100.0,
+                               noise=0.0)
+
+        self.assertEqual(len(powers), 100000)
+        self.assertItemsEqual(np.unique(powers), [0.0, 100.0, 1000.0])
+        self.assertAlmostEqual(np.mean(powers > 0), 0.25, delta=0.05)
+
+    def test_sample_indices(self):
+        """Readings are sorted, jittered around the period, and have gaps."""
+        rng = np.random.RandomState(0)
+        indices = sample_indices(100000, rng, period=3, jitter=1)
+        intervals = np.diff(indices)
+
+        self.assertItemsEqual(np.unique(intervals), [2, 3, 4])
+        self.assertTrue(indices[-1] < 100000)
+
+        indices = sample_indices(100000, rng, gap_rate=1e-4, mean_gap=100)
+        self.assertTrue((np.diff(indices) > 0).all())
+        self.assertTrue(np.diff(indices).max() > 1)
+        self.assertTrue(len(indices) < 100000)
+
+    def test_generate_household(self):
+        """Households are deterministic, and the mains sum every device."""
+        (mains, devices) = generate_household(3, 10000, seed=1, noise=0.0)
+        (_, more_devices) = generate_household(4, 10000, seed=1, noise=0.0)
+
+        self.assertEqual(len(devices), 3)
+        for (dev1, dev2) in zip(devices, more_devices):
+            self.assertTrue(np.array_equal(dev1.array, dev2.array))
+
+        total = np.sum([d.powers for d in devices], axis=0) + 50.0
+        self.assertTrue(np.allclose(mains.powers, total))
+        self.assertTrue(np.array_equal(mains.times, devices[0].times))
+
+    def test_write_household(self):
+        """Written households load back as they were generated."""
+        (mains, devices) = generate_household(2, 1000, seed=2, gap_rate=1e-3)
+        directory = tempfile.mkdtemp()
+
+        try:
+            for binary in [False, True]:
+                paths = write_household(directory, 2, 1000, seed=2,
+                                        binary=binary, gap_rate=1e-3)
+
+                self.assertEqual([os.path.basename(p).split('.')[0] for p in
+                                  paths], ['mains', 'device00', 'device01'])
+                for (path, ts) in zip(paths, [mains] + devices):
+                    loaded = TimeSeries(path=path)
+                    self.assertTrue(np.array_equal(loaded.times, ts.times))
+                    self.assertTrue(np.allclose(loaded.powers, ts.powers))
+        finally:
+            shutil.rmtree(directory)
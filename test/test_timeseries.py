@@ -6,6 +6,8 @@ Unit tests for TimeSeries.
 
 import unittest
 import os
+import shutil
+import tempfile
 
 import numpy as np
 
@@ -32,6 +34,27 @@ class TestTimeSeries(unittest.TestCase):
         self.assertItemsEqual(ts_file.times, ts_test.times)
         self.assertItemsEqual(ts_file.powers, ts_test.powers)
 
+    def test_save_load_binary(self):
+        """Test saving a TimeSeries as binary and loading it back."""
+        ts_file = TimeSeries.load(DATA_PATH)
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'test.npy')
+            ts_file.save(path)
+
+            ts_binary = TimeSeries.load(path, 'test')
+            self.assertEqual(ts_binary.name, 'test')
+            self.assertIsInstance(ts_binary.array, np.memmap)
+            self.assertItemsEqual(ts_binary.times, ts_file.times)
+            self.assertItemsEqual(ts_binary.powers, ts_file.powers)
+
+            ts_binary.powers = np.zeros(3, dtype=np.float32)
+            self.assertItemsEqual(TimeSeries.load(path).powers,
+                                  ts_file.powers)
+        finally:
+            shutil.rmtree(tmp_dir)
+
     def test_indicators(self):
         """Test getting the on-off indicators from a TimeSeries."""
         ts = TimeSeries()
@@ -152,6 +175,49 @@ class TestTimeSeries(unittest.TestCase):
 
         self.assertItemsEqual(ts_diff.powers, ts_test.powers)
 
+    def test_align(self):
+        """Test aligning the timestamps of two TimeSeries."""
+        ts1 = TimeSeries()
+        ts1.array.resize(4)
+        ts1.array['time'] = [1, 2, 4, 6]
+
+        ts2 = TimeSeries()
+        ts2.array.resize(4)
+        ts2.array['time'] = [2, 3, 4, 7]
+
+        (indices1, indices2) = ts1.align(ts2)
+
+        self.assertEqual(list(indices1), [1, 2])
+        self.assertEqual(list(indices2), [0, 2])
+
+    def test_inplace_arithmetic(self):
+        """Test in-place addition and subtraction of TimeSeries."""
+        ts1 = TimeSeries()
+        ts1.array.resize(3)
+        ts1.array[0] = (np.uint32(1), np.float32(0.5))
+        ts1.array[1] = (np.uint32(2), np.float32(1.0))
+        ts1.array[2] = (np.uint32(3), np.float32(3.0))
+
+        ts2 = TimeSeries()
+        ts2.array.resize(3)
+        ts2.array[0] = (np.uint32(1), np.float32(0.0))
+        ts2.array[1] = (np.uint32(2), np.float32(1.0))
+        ts2.array[2] = (np.uint32(3), np.float32(2.0))
+
+        array = ts1.array
+        ts1 += ts2
+        self.assertIs(ts1.array, array)
+        self.assertItemsEqual(ts1.powers, [0.5, 2.0, 5.0])
+
+        ts3 = TimeSeries()
+        ts3.array.resize(2)
+        ts3.array[0] = (np.uint32(2), np.float32(1.0))
+        ts3.array[1] = (np.uint32(4), np.float32(1.0))
+
+        ts1 -= ts3
+        self.assertItemsEqual(ts1.times, [2])
+        self.assertItemsEqual(ts1.powers, [1.0])
+
     def test_padding(self):
         """
         Test padding a TimeSeries with missing values.
@@ -195,6 +261,36 @@ class TestTimeSeries(unittest.TestCase):
 
         self.assertItemsEqual(ts_missing.powers, ts_test.powers)
 
+    def test_padding_linear(self):
+        """
+        Test padding a TimeSeries by linear interpolation.
+        """
+        ts_missing = TimeSeries()
+        ts_missing.array.resize(3)
+        ts_missing.array[0] = (np.uint32(1), np.float32(1.0))
+        ts_missing.array[1] = (np.uint32(3), np.float32(3.0))
+        ts_missing.array[2] = (np.uint32(8), np.float32(0.0))
+
+        ts_missing.pad(3, fill='linear')
+
+        self.assertItemsEqual(ts_missing.times, [1, 2, 3, 8])
+        self.assertItemsEqual(ts_missing.powers, [1.0, 2.0, 3.0, 0.0])
+
+    def test_padding_zero(self):
+        """
+        Test padding a TimeSeries with zeros.
+        """
+        ts_missing = TimeSeries()
+        ts_missing.array.resize(3)
+        ts_missing.array[0] = (np.uint32(1), np.float32(1.0))
+        ts_missing.array[1] = (np.uint32(3), np.float32(3.0))
+        ts_missing.array[2] = (np.uint32(5), np.float32(2.0))
+
+        ts_missing.pad(5, fill='zero')
+
+        self.assertItemsEqual(ts_missing.times, [1, 2, 3, 4, 5])
+        self.assertItemsEqual(ts_missing.powers, [1.0, 0.0, 3.0, 0.0, 2.0])
+
     def test_activations(self):
         """
         Test retrieving the TimeSeries activation indices.
@@ -217,3 +313,80 @@ class TestTimeSeries(unittest.TestCase):
         activations = ts.activations(np.float32(0.5))
 
         self.assertItemsEqual(activations, test)
+
+    def test_activation_index(self):
+        """
+        Test the activation index and its queries.
+        """
+        ts = TimeSeries()
+        ts.array.resize(10)
+        ts.array['time'] = np.arange(1, 11, dtype=np.uint32)
+        ts.array['power'] = np.array([1, 1, 0, 1, 0, 0, 0, 1, 0, 1],
+                                     dtype=np.float32)
+
+        index = ts.activation_index(np.float32(0.5))
+        self.assertItemsEqual(index[0], [0, 3, 7, 9])
+        self.assertItemsEqual(index[1], [2, 4, 8, 10])
+
+        self.assertItemsEqual(ts.activation_durations(index), [2, 1, 1, 1])
+        self.assertItemsEqual(ts.activations_overlapping(index, 2, 8), [0, 1])
+        self.assertItemsEqual(ts.activation_at(index, [1, 3, 4, 10]),
+                              [0, -1, 1, 3])
+
+    def test_activation_index_debounce(self):
+        """
+        Test merging short off gaps and dropping short activations.
+        """
+        ts = TimeSeries()
+        ts.array.resize(10)
+        ts.array['time'] = np.arange(1, 11, dtype=np.uint32)
+        ts.array['power'] = np.array([1, 1, 0, 1, 0, 0, 0, 1, 0, 1],
+                                     dtype=np.float32)
+
+        index = ts.activation_index(np.float32(0.5), min_duration=3,
+                                    min_gap=2)
+        self.assertItemsEqual(index[0], [0, 7])
+        self.assertItemsEqual(index[1], [4, 10])
+
+    def test_indicators_cache(self):
+        """Test that cached indicators are cleared when the series changes."""
+        ts = TimeSeries(cache_size=2)
+        ts.array.resize(10)
+        ts.array['time'] = np.arange(10)
+        ts.array['power'] = np.arange(10)
+
+        self.assertEqual(ts.indicators(np.float32(4.5)).tolist(),
+                         [False] * 5 + [True] * 5)
+        self.assertEqual(ts.indicators(np.float32(4.5)).tolist(),
+                         [False] * 5 + [True] * 5)
+
+        ts.indicators(np.float32(1.0))
+        ts.indicators(np.float32(2.0))
+        self.assertEqual(len(ts._indicator_cache), 2) # pylint: disable=W0212
+
+        ts.powers = np.zeros(10, dtype=np.float32)
+        self.assertEqual(ts.indicators(np.float32(4.5)).tolist(), [False] * 10)
+
+        ts_ones = TimeSeries()
+        ts_ones.array = ts.array.copy()
+        ts_ones.powers = np.ones(10, dtype=np.float32) * 5
+
+        ts += ts_ones
+        self.assertEqual(ts.indicators(np.float32(4.5)).tolist(), [True] * 10)
+
+    def test_resample(self):
+        """Test resampling into bins by mean, max and last, keeping gaps."""
+        ts = TimeSeries()
+        ts.array.resize(7)
+        ts.array['time'] = [10, 11, 15, 19, 20, 45, 47]
+        ts.array['power'] = [1, 2, 3, 6, 4, 8, 5]
+
+        mean = ts.resample(10)
+        self.assertItemsEqual(mean.times, [10, 20, 40])
+        self.assertTrue(np.allclose(mean.powers, [3, 4, 6.5]))
+
+        self.assertItemsEqual(ts.resample(10, 'max').powers, [6, 4, 8])
+        self.assertItemsEqual(ts.resample(10, 'last').powers, [6, 4, 5])
+        self.assertTrue(np.allclose(ts.resample(100).powers, [29.0 / 7]))
+
+        self.assertRaises(ValueError, ts.resample, 10, 'median')
@@ -0,0 +1,81 @@
+"""
+Test the tracing spans.
+"""
+
+import os
+import tempfile
+import unittest
+
+from nilm import trace
+
+
+class TraceTestCase(unittest.TestCase):
+    """
+    Test recording spans to a trace file and summarizing them.
+    """
+    def setUp(self):
+        (fd, self.path) = tempfile.mkstemp(suffix='.jsonl')
+        os.close(fd)
+
+    def tearDown(self):
+        trace.disable()
+        os.remove(self.path)
+
+    def test_disabled(self):
+        """Spans record nothing while tracing is off."""
+        with trace.span('load', 10) as s:
+            s.add(5)
+
+        self.assertTrue(s is trace.NULL_SPAN)
+        self.assertFalse(trace.enabled())
+        self.assertEqual(trace.read_trace(self.path), [])
+
+    def test_records(self):
+        """Spans record their measurements, fields and parent."""
+        trace.enable(self.path)
+        with trace.span('train', device='fridge'):
+            with trace.span('windows', 3, device='fridge') as s:
+                s.add(4)
+
+        records = trace.read_trace(self.path)
+
+        self.assertEqual([r['name'] for r in records], ['windows', 'train'])
+        self.assertEqual(records[0]['parent'], 'train')
+        self.assertEqual(records[1]['parent'], None)
+        self.assertEqual(records[0]['items'], 7)
+        self.assertEqual(records[0]['device'], 'fridge')
+        for r in records:
+            self.assertTrue(r['wall'] >= 0)
+            self.assertTrue(r['peak_rss_mb'] > 0)
+            self.assertEqual(r['pid'], os.getpid())
+
+    def test_traced(self):
+        """Decorated functions run in a span, which records errors."""
+        @trace.traced('fail')
+        def fail():
+            """Raise an error."""
+            raise ValueError()
+
+        trace.enable(self.path)
+        self.assertRaises(ValueError, fail)
+
+        records = trace.read_trace(self.path)
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['error'], 'ValueError')
+
+    def test_summarize(self):
+        """Records are totalled by name."""
+        records = [
+            {'name': 'a', 'wall': 1.0, 'cpu': 0.5, 'peak_rss_mb': 10.0,
+             'items': 2},
+            {'name': 'b', 'wall': 2.0, 'cpu': 1.0, 'peak_rss_mb': 30.0,
+             'items': 0},
+            {'name': 'a', 'wall': 3.0, 'cpu': 1.5, 'peak_rss_mb': 20.0,
+             'items': 5},
+        ]
+
+        rows = trace.summarize(records)
+
+        self.assertEqual(rows, [('a', 2, 4.0, 2.0, 20.0, 7),
+                                ('b', 1, 2.0, 1.0, 30.0, 0)])
+        self.assertEqual(len(trace.format_summary(rows).split('\n')), 3)
@@ -0,0 +1,173 @@
+"""
+Unit tests for training a network per device.
+"""
+
+# pylint: disable=E1101
+
+import argparse
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from nilm import network, training
+from nilm.cache import ArrayCache
+from nilm.timeseries import TimeSeries
+
+
+def stub_train_device(dev, agg_data, args):
+    """Fail for the device named bad, and record the others as trained."""
+    if dev.name == 'bad':
+        raise RuntimeError('training failed')
+
+    with open(os.path.join(args.out, dev.name), 'w') as fd:
+        fd.write(agg_data.name)
+    return dev.name != 'idle'
+
+
+class TestTraining(unittest.TestCase):
+    """
+    Test that a failing device does not stop the others being trained.
+    """
+    def setUp(self):
+        """Replace train_device with the stub."""
+        self.out = tempfile.mkdtemp()
+        self.train_device = training.train_device
+        training.train_device = stub_train_device
+
+        self.agg = TimeSeries('aggregate')
+        self.devices = [TimeSeries(name) for name in
+                        ['first', 'bad', 'idle', 'last']]
+
+    def tearDown(self):
+        """Restore train_device and remove the output."""
+        training.train_device = self.train_device
+        shutil.rmtree(self.out)
+
+    def test_failure_isolation(self):
+        """Test the other devices are trained, and the run fails."""
+        for jobs in [1, 2]:
+            for name in os.listdir(self.out):
+                os.remove(os.path.join(self.out, name))
+            args = argparse.Namespace(out=self.out, jobs=jobs)
+
+            self.assertEqual(training.train_devices(self.agg, self.devices,
+                                                    args), 1)
+            self.assertItemsEqual(os.listdir(self.out),
+                                  ['first', 'idle', 'last'])
+
+    def test_success(self):
+        """Test devices without activations do not fail the run."""
+        args = argparse.Namespace(out=self.out, jobs=2)
+
+        self.assertEqual(training.train_devices(self.agg, self.devices[2:],
+                                                args), 0)
+
+    def test_no_windows(self):
+        """Test devices whose windows all span gaps are skipped."""
+        training.train_device = self.train_device
+
+        def no_network(*_):
+            """Fail if a network is built."""
+            raise AssertionError('A network was built.')
+
+        autoencoder = network.DenoisingAutoencoder
+        network.DenoisingAutoencoder = no_network
+        try:
+            agg = TimeSeries()
+            agg.array.resize(100)
+            agg.array['time'] = np.arange(100) * 100
+            agg.array['power'] = 500
+            dev = TimeSeries('gappy')
+            dev.array = agg.array.copy()
+            dev.powers[:50] = 0
+
+            args = argparse.Namespace(out=self.out, stride=None, resolution=1,
+                                      generator=True, batch_size=10)
+            self.assertFalse(training.train_device(dev, agg, args))
+        finally:
+            network.DenoisingAutoencoder = autoencoder
+
+
+class TestPreparedDataCache(unittest.TestCase):
+    """
+    Test reusing the prepared data and windows of an earlier run.
+    """
+    def setUp(self):
+        """Write an aggregate of two devices, and create an empty cache."""
+        self.directory = tempfile.mkdtemp()
+        self.data = os.path.join(self.directory, 'data')
+        os.mkdir(self.data)
+
+        rng = np.random.RandomState(0)
+        total = np.zeros(500, dtype=np.float32)
+        for (d, power) in enumerate([100.0, 400.0]):
+            dev = TimeSeries()
+            dev.array.resize(500)
+            dev.array['time'] = np.arange(500)
+            dev.array['power'] = (rng.rand(500) < 0.3) * power
+            dev.save(os.path.join(self.data, 'device%d.npy' % d))
+            total += dev.powers
+
+        agg = TimeSeries()
+        agg.array.resize(500)
+        agg.array['time'] = np.arange(500)
+        agg.array['power'] = total + 10
+        self.agg_path = os.path.join(self.data, 'aggregate.npy')
+        agg.save(self.agg_path)
+
+        self.cache = ArrayCache(os.path.join(self.directory, 'cache'))
+        self.args = argparse.Namespace(aggregated=self.agg_path,
+                                       dir=self.data, preprocess='constant',
+                                       resolution=1)
+
+    def tearDown(self):
+        """Remove the data and cache."""
+        shutil.rmtree(self.directory)
+
+    def test_prepare_data(self):
+        """Test a second run memory-maps the first run's prepared data."""
+        (agg, devices) = training.prepare_data(self.args, np.float32(25.0),
+                                               self.cache)
+        (cached_agg, cached_devices) = training.prepare_data(
+            self.args, np.float32(25.0), self.cache)
+
+        self.assertEqual(len(agg.array), 400)
+        self.assertIsInstance(cached_agg.array, np.memmap)
+        self.assertTrue(np.array_equal(cached_agg.array, agg.array))
+        self.assertEqual([d.name for d in cached_devices],
+                         [d.name for d in devices])
+        for (cached, dev) in zip(cached_devices, devices):
+            self.assertIsInstance(cached.array, np.memmap)
+            self.assertTrue(np.array_equal(cached.array, dev.array))
+        self.assertEqual(len(self.cache.entries()), 1)
+
+        # Another method is prepared again.
+        self.args.preprocess = 'raw'
+        (_, raw_devices) = training.prepare_data(self.args, np.float32(25.0),
+                                                 self.cache)
+        self.assertFalse(isinstance(raw_devices[0].array, np.memmap))
+        self.assertEqual(len(self.cache.entries()), 2)
+
+    def test_cached_windows(self):
+        """Test cached windows are reused with the scale they were built by."""
+        (agg, devices) = training.load_data(self.agg_path, self.data)
+        rows = np.arange(10)
+
+        windows = training.cached_windows(self.cache, agg, devices[0], 20, 20,
+                                          np.float32(2.0), np.float32(100.0),
+                                          rows)
+        cached = training.cached_windows(self.cache, agg, devices[0], 20, 20,
+                                         np.float32(3.0), np.float32(100.0),
+                                         rows)
+        uncached = training.cached_windows(None, agg, devices[0], 20, 20,
+                                           np.float32(2.0), np.float32(100.0),
+                                           rows)
+
+        for result in [cached, uncached]:
+            self.assertTrue(np.array_equal(result[0], windows[0]))
+            self.assertTrue(np.array_equal(result[1], windows[1]))
+            self.assertEqual(result[2], np.float32(2.0))
+        self.assertIsInstance(cached[0], np.memmap)
@@ -0,0 +1,90 @@
+"""
+Unit tests for building training windows.
+"""
+
+# pylint: disable=E1101
+
+import unittest
+
+import numpy as np
+
+from nilm.timeseries import TimeSeries
+from nilm.windows import (sliding_windows, training_windows, valid_windows,
+                          window_batches)
+
+
+class TestWindows(unittest.TestCase):
+    """
+    Test building training windows from TimeSeries.
+    """
+    def setUp(self):
+        """Set up an aggregate with a gap, and a device."""
+        self.agg = TimeSeries()
+        self.agg.array.resize(20)
+        self.agg.array['time'] = np.concatenate((np.arange(1, 11),
+                                                 np.arange(31, 41)))
+        self.agg.array['power'] = np.arange(20) ** 2
+
+        self.dev = TimeSeries()
+        self.dev.array.resize(20)
+        self.dev.array['time'] = self.agg.times
+        self.dev.array['power'] = np.arange(20)
+
+    def test_sliding_windows(self):
+        """Test viewing an array as overlapping windows."""
+        windows = sliding_windows(np.arange(7), 3, 2)
+
+        self.assertEqual(windows.tolist(), [[0, 1, 2], [2, 3, 4], [4, 5, 6]])
+
+    def test_valid_windows(self):
+        """Test skipping windows which span a gap."""
+        rows = valid_windows(self.agg.times, 8, 4)
+
+        self.assertEqual(rows.tolist(), [0, 3])
+
+        rows = valid_windows(self.agg.times * 10, 8, 4, period=10)
+
+        self.assertEqual(rows.tolist(), [0, 3])
+
+    def test_training_windows(self):
+        """Test normalizing the training windows."""
+        (agg_windows, dev_windows) = training_windows(self.agg, self.dev, 8, 4,
+                                                      np.float32(2.0),
+                                                      np.float32(4.0))
+
+        self.assertEqual(agg_windows.shape, (2, 8, 1))
+        self.assertEqual(dev_windows.shape, (2, 2, 1))
+
+        for (row, start) in enumerate([0, 12]):
+            agg_window = self.agg.powers[start:start+8]
+            agg_window = (agg_window - agg_window.mean()) / np.float32(2.0)
+            dev_window = self.dev.powers[start+3:start+5] / np.float32(4.0)
+
+            self.assertTrue(np.allclose(agg_windows[row, :, 0], agg_window))
+            self.assertTrue(np.allclose(dev_windows[row, :, 0], dev_window))
+
+    def test_window_batches(self):
+        """Test generating the training windows in batches."""
+        (agg_windows, dev_windows) = training_windows(self.agg, self.dev, 8, 1,
+                                                      np.float32(2.0),
+                                                      np.float32(4.0))
+        batches = window_batches(self.agg, self.dev, 8, 1, np.float32(2.0),
+                                 np.float32(4.0), 3)
+
+        batch_agg = []
+        batch_dev = []
+        while sum(len(b) for b in batch_agg) < len(agg_windows):
+            (agg_batch, dev_batch) = next(batches)
+            self.assertTrue(len(agg_batch) <= 3)
+            batch_agg.append(agg_batch)
+            batch_dev.append(dev_batch)
+
+        self.assertTrue(np.array_equal(np.concatenate(batch_agg), agg_windows))
+        self.assertTrue(np.array_equal(np.concatenate(batch_dev), dev_windows))
+
+    def test_no_window_batches(self):
+        """Test generating batches fails when every window spans a gap."""
+        batches = window_batches(self.agg, self.dev, 15, 1, np.float32(2.0),
+                                 np.float32(4.0), 3)
+
+        self.assertRaises(ValueError, next, batches)